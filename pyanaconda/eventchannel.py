@@ -0,0 +1,188 @@
+#
+# eventchannel.py: framed event channel between anaconda and its helpers
+#
+# Copyright (C) 2015  Red Hat, Inc.  All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+    Helper processes (like anaconda-yum) report what they are doing by writing
+    frames to a file descriptor inherited from anaconda.  Every frame is a 5
+    byte header -- the event type (unsigned char) and the length of the
+    payload (unsigned int), both in network byte order -- followed by the
+    payload, which is a JSON encoded list of the event's arguments.
+
+    This module has to stay importable without the rest of pyanaconda, the
+    helpers run outside of anaconda's environment.
+"""
+
+import os
+import json
+import errno
+import fcntl
+import select
+import struct
+
+# a line of the helper's plain text output, never sent over the channel
+EVENT_TEXT = 0
+# (level, message) where level is one of "DEBUG", "INFO", "WARN"
+EVENT_LOG = 1
+# (message,)
+EVENT_ERROR = 2
+# () the transaction is being prepared
+EVENT_PREP = 3
+# (package, index, total, size) a package is being installed
+EVENT_PKG_START = 4
+# (package, seconds) a package has been installed
+EVENT_PKG_END = 5
+# (package, scriptlet) a scriptlet has been started
+EVENT_SCRIPT_START = 6
+# (package, scriptlet, seconds, exit code) a scriptlet has finished
+EVENT_SCRIPT_END = 7
+# () all packages are installed, post-transaction work is running
+EVENT_POST = 8
+# () the helper is done
+EVENT_QUIT = 9
+
+_HEADER = struct.Struct("!BI")
+
+# maximum number of bytes read from the helper at once
+CHUNK_SIZE = 64 * 1024
+# how long to wait for output before checking if the helper exited (seconds)
+EXIT_CHECK = 5
+# the largest payload of a frame, anything bigger is a corrupted channel
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+def channel_pipe():
+    """Create the pipe of a channel.
+
+       The reading end is closed on exec, so the helper only inherits the
+       writing end and the channel ends when the helper closes it.
+
+       :returns: the reading and the writing end of the channel
+       :rtype: (int, int)
+    """
+    (channel_r, channel_w) = os.pipe()
+    flags = fcntl.fcntl(channel_r, fcntl.F_GETFD)
+    fcntl.fcntl(channel_r, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+    return (channel_r, channel_w)
+
+class EventWriter(object):
+    """Sending side of the channel, used by the helper process."""
+
+    def __init__(self, fd):
+        """
+           :param fd: file descriptor of the channel inherited from anaconda
+           :type fd: int
+        """
+        self._fd = fd
+
+    def send(self, event, *args):
+        """Send an event with the given arguments."""
+        payload = json.dumps(args)
+        if len(payload) > MAX_FRAME_SIZE:
+            raise ValueError("event %d is too big (%d bytes)" % (event, len(payload)))
+        frame = _HEADER.pack(event, len(payload)) + payload
+        while frame:
+            written = os.write(self._fd, frame)
+            frame = frame[written:]
+
+    def close(self):
+        os.close(self._fd)
+
+def _split_frames(data):
+    """Split the data into complete frames and the incomplete rest.
+
+       :returns: list of (event, args) tuples and the rest of the data
+       :raises IOError: if a frame is bigger than MAX_FRAME_SIZE
+    """
+    frames = []
+    while len(data) >= _HEADER.size:
+        (event, length) = _HEADER.unpack_from(data)
+        if length > MAX_FRAME_SIZE:
+            raise IOError("event %d is too big (%d bytes)" % (event, length))
+        end = _HEADER.size + length
+        if len(data) < end:
+            break
+        frames.append((event, json.loads(data[_HEADER.size:end])))
+        data = data[end:]
+
+    return (frames, data)
+
+def read_events(proc, channel_fd=None):
+    """Generate the events a helper process sends.
+
+       Events from the channel are generated as (event, args) tuples, lines of
+       the helper's text output as (EVENT_TEXT, [line]).  A frame cut off by
+       the end of the channel is reported as an EVENT_ERROR.  Both file
+       descriptors are closed when the helper is done.
+
+       :param proc: the helper process, its stdout has to be a pipe
+       :type proc: subprocess.Popen
+       :param channel_fd: reading end of the channel or None if the helper
+                          only produces text output
+       :type channel_fd: int or None
+    """
+    out_fd = proc.stdout.fileno()
+    poller = select.poll()
+    buffers = {}
+    for fd in (out_fd, channel_fd):
+        if fd is not None:
+            poller.register(fd, select.POLLIN | select.POLLPRI)
+            buffers[fd] = b""
+
+    try:
+        while buffers:
+            try:
+                ready = poller.poll(EXIT_CHECK * 1000)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            if not ready:
+                # the helper's children may keep the descriptors open
+                if proc.poll() is not None:
+                    break
+                continue
+
+            for (fd, _mask) in ready:
+                data = os.read(fd, CHUNK_SIZE)
+                if not data:
+                    poller.unregister(fd)
+                    rest = buffers.pop(fd)
+                    if fd == out_fd and rest:
+                        yield (EVENT_TEXT, [rest.strip()])
+                    elif rest:
+                        yield (EVENT_ERROR, ["event channel closed in the middle "
+                                             "of a frame (%d bytes left)" % len(rest)])
+                    continue
+
+                data = buffers[fd] + data
+                if fd == out_fd:
+                    lines = data.split(b"\n")
+                    buffers[fd] = lines.pop()
+                    for line in lines:
+                        yield (EVENT_TEXT, [line.strip()])
+                else:
+                    (frames, buffers[fd]) = _split_frames(data)
+                    for frame in frames:
+                        yield frame
+    finally:
+        proc.stdout.close()
+        if channel_fd is not None:
+            os.close(channel_fd)
+
+    proc.wait()
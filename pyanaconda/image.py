@@ -17,7 +17,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from pyanaconda import isys
+from pyanaconda.iso9660 import IsoInfo, iso_info, parse_discinfo
 import os, os.path, stat, tempfile
 from pyanaconda.constants import ISO_DIR
 
@@ -32,6 +32,75 @@ log = logging.getLogger("anaconda")
 
 _arch = blivet.arch.getArch()
 
+def _mountedIsoInfo(path):
+    """
+    Get the install media information of an ISO image by mounting it. This
+    is only needed for images without Rock Ridge or Joliet names.
+    """
+    log.debug("mounting %s on /mnt/install/cdimage", path)
+    try:
+        blivet.util.mount(path, "/mnt/install/cdimage", fstype="iso9660", options="ro")
+    except OSError:
+        return None
+
+    try:
+        discinfo = None
+        if os.access("/mnt/install/cdimage/.discinfo", os.R_OK):
+            with open("/mnt/install/cdimage/.discinfo") as f:
+                discinfo = parse_discinfo(f.readlines())
+
+        repodata = os.access("/mnt/install/cdimage/repodata", os.R_OK)
+    finally:
+        blivet.util.umount("/mnt/install/cdimage")
+
+    return IsoInfo(discinfo, repodata, True)
+
+def isInstallIsoImage(path):
+    """
+    Is path an ISO image that can be installed from, i.e. one with a .discinfo
+    for this architecture and repodata? The image is only read, not mounted,
+    unless it has neither Rock Ridge nor Joliet names.
+    """
+    info = iso_info(path)
+    if info is None:
+        return False
+
+    if not info.names_found:
+        info = _mountedIsoInfo(path)
+        if info is None:
+            return False
+
+    if info.discinfo is None:
+        return False
+
+    discArch = info.discinfo[2]
+    log.debug("discArch = %s", discArch)
+    if discArch != _arch:
+        log.warning("%s: architectures mismatch: %s, %s", path, discArch, _arch)
+        return False
+
+    # If there's no repodata, there's no point in trying to
+    # install from it.
+    if not info.has_repodata:
+        log.warning("%s doesn't have repodata, skipping", path)
+        return False
+
+    return True
+
+def findIsoImages(path):
+    """
+    Find the iso images that can be installed from in path.
+
+    Returns the list of the basenames of the images
+    """
+    try:
+        files = sorted(os.listdir(path))
+    except OSError:
+        return []
+
+    return [fn for fn in files if fn.lower().endswith(".iso") and
+            isInstallIsoImage(os.path.join(path, fn))]
+
 def findFirstIsoImage(path):
     """
     Find the first iso image in path
@@ -44,8 +113,6 @@ def findFirstIsoImage(path):
     except OSError:
         return None
 
-    arch = _arch
-
     if os.path.isfile(path) and path.endswith(".iso"):
         files = [os.path.basename(path)]
         path = os.path.dirname(path)
@@ -55,38 +122,7 @@ def findFirstIsoImage(path):
     for fn in files:
         what = path + '/' + fn
         log.debug("Checking %s", what)
-        if not isys.isIsoImage(what):
-            continue
-
-        log.debug("mounting %s on /mnt/install/cdimage", what)
-        try:
-            blivet.util.mount(what, "/mnt/install/cdimage", fstype="iso9660", options="ro")
-        except OSError:
-            continue
-
-        if not os.access("/mnt/install/cdimage/.discinfo", os.R_OK):
-            blivet.util.umount("/mnt/install/cdimage")
-            continue
-
-        log.debug("Reading .discinfo")
-        f = open("/mnt/install/cdimage/.discinfo")
-        f.readline() # skip timestamp
-        f.readline() # skip release description
-        discArch = f.readline().strip() # read architecture
-        f.close()
-
-        log.debug("discArch = %s", discArch)
-        if discArch != arch:
-            log.warning("findFirstIsoImage: architectures mismatch: %s, %s",
-                        discArch, arch)
-            blivet.util.umount("/mnt/install/cdimage")
-            continue
-
-        # If there's no repodata, there's no point in trying to
-        # install from it.
-        if not os.access("/mnt/install/cdimage/repodata", os.R_OK):
-            log.warning("%s doesn't have repodata, skipping", what)
-            blivet.util.umount("/mnt/install/cdimage")
+        if not isInstallIsoImage(what):
             continue
 
         # warn user if images appears to be wrong size
@@ -97,7 +133,6 @@ def findFirstIsoImage(path):
                 raise exn
 
         log.info("Found disc at %s", fn)
-        blivet.util.umount("/mnt/install/cdimage")
         return fn
 
     return None
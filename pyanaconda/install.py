@@ -24,6 +24,7 @@ from pyanaconda.constants import ROOT_PATH
 from blivet import turnOnFilesystems
 from pyanaconda.bootloader import writeBootLoader
 from pyanaconda.progress import progress_report, progressQ
+from pyanaconda.timing import install_phase, write_install_profile
 from pyanaconda.users import createLuserConf, getPassAlgo, Users
 from pyanaconda import flags
 from pyanaconda import timezone
@@ -63,15 +64,10 @@ def doConfiguration(storage, payload, ksdata, instClass):
     # Now run the execute methods of ksdata that require an installed system
     # to be present first.
     with progress_report(_("Configuring installed system")):
-        ksdata.authconfig.execute(storage, ksdata, instClass)
-        ksdata.selinux.execute(storage, ksdata, instClass)
-        ksdata.firstboot.execute(storage, ksdata, instClass)
-        ksdata.services.execute(storage, ksdata, instClass)
-        ksdata.keyboard.execute(storage, ksdata, instClass)
-        ksdata.timezone.execute(storage, ksdata, instClass)
-        ksdata.lang.execute(storage, ksdata, instClass)
-        ksdata.firewall.execute(storage, ksdata, instClass)
-        ksdata.xconfig.execute(storage, ksdata, instClass)
+        for name in ("authconfig", "selinux", "firstboot", "services", "keyboard",
+                     "timezone", "lang", "firewall", "xconfig"):
+            with install_phase("ksdata.%s.execute" % name):
+                getattr(ksdata, name).execute(storage, ksdata, instClass)
 
     if not flags.flags.imageInstall and not flags.flags.dirInstall:
         with progress_report(_("Writing network configuration")):
@@ -81,13 +77,14 @@ def doConfiguration(storage, payload, ksdata, instClass):
     with progress_report(_("Creating users")):
         createLuserConf(ROOT_PATH, algoname=getPassAlgo(ksdata.authconfig.authconfig))
         u = Users()
-        ksdata.rootpw.execute(storage, ksdata, instClass, u)
-        ksdata.group.execute(storage, ksdata, instClass, u)
-        ksdata.user.execute(storage, ksdata, instClass, u)
+        for name in ("rootpw", "group", "user"):
+            with install_phase("ksdata.%s.execute" % name):
+                getattr(ksdata, name).execute(storage, ksdata, instClass, u)
 
     with progress_report(_("Configuring addons")):
-        ksdata.addons.execute(storage, ksdata, instClass, u)
-        ksdata.configured_spokes.execute(storage, ksdata, instClass, u)
+        for name in ("addons", "configured_spokes"):
+            with install_phase("ksdata.%s.execute" % name):
+                getattr(ksdata, name).execute(storage, ksdata, instClass, u)
 
     with progress_report(_("Generating initramfs")):
         payload.recreateInitrds(force=True)
@@ -103,6 +100,10 @@ def doConfiguration(storage, payload, ksdata, instClass):
     # kickstart file over if one exists).
     _writeKS(ksdata)
 
+    # The post scripts copying the logs have run already, the profile is
+    # written to the installed system directly.
+    write_install_profile()
+
     progressQ.send_complete()
 
 def doInstall(storage, payload, ksdata, instClass):
@@ -137,11 +138,14 @@ def doInstall(storage, payload, ksdata, instClass):
     storage.updateKSData()  # this puts custom storage info into ksdata
 
     # Do partitioning.
-    payload.preStorage()
+    with install_phase("payload.preStorage"):
+        payload.preStorage()
 
-    turnOnFilesystems(storage, mountOnly=flags.flags.dirInstall)
+    with install_phase("turnOnFilesystems"):
+        turnOnFilesystems(storage, mountOnly=flags.flags.dirInstall)
     if not flags.flags.livecdInstall and not flags.flags.dirInstall:
-        storage.write()
+        with install_phase("storage.write"):
+            storage.write()
 
     # Do packaging.
 
@@ -158,18 +162,25 @@ def doInstall(storage, payload, ksdata, instClass):
 
     # don't try to install packages from the install class' ignored list
     packages = [p for p in packages if p not in instClass.ignoredPackages]
-    payload.preInstall(packages=packages, groups=payload.languageGroups())
-    payload.install()
+    with install_phase("payload.preInstall"):
+        payload.preInstall(packages=packages, groups=payload.languageGroups())
+    with install_phase("payload.install"):
+        payload.install()
 
     if flags.flags.livecdInstall:
-        storage.write()
+        with install_phase("storage.write"):
+            storage.write()
 
     with progress_report(_("Performing post-installation setup tasks")):
-        payload.postInstall()
+        with install_phase("payload.postInstall"):
+            payload.postInstall()
 
     # Do bootloader.
     if not flags.flags.dirInstall:
         with progress_report(_("Installing bootloader")):
             writeBootLoader(storage, payload, instClass, ksdata)
 
+    # Keep what is known so far in /tmp in case the configuration fails.
+    write_install_profile(root=None)
+
     progressQ.send_complete()
@@ -0,0 +1,252 @@
+#
+# iso9660.py: reading install media information straight from ISO images
+#
+# Copyright (C) 2015  Red Hat, Inc.  All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+    Finding the install image among the ISOs in a directory used to mean
+    loop-mounting every one of them.  The only things looked at are the
+    .discinfo file and the repodata directory in the root of the image, so
+    they are read from the image file here instead: the volume descriptors
+    point to the root directory, whose records carry the Rock Ridge (or
+    Joliet) names of the files.
+
+    The results are cached by the path, size and modification time of the
+    image, so looking at the same directory again reads nothing.
+"""
+
+import os
+import struct
+import threading
+from collections import namedtuple
+
+import logging
+log = logging.getLogger("anaconda")
+
+SECTOR_SIZE = 2048
+# the volume descriptors start at sector 16
+_DESCRIPTORS_START = 16 * SECTOR_SIZE
+_MAX_DESCRIPTORS = 32
+# don't read directories or .discinfo files larger than this
+_MAX_READ = 1024 * 1024
+
+_PRIMARY = 1
+_SUPPLEMENTARY = 2
+_TERMINATOR = 255
+_JOLIET_ESCAPES = ("%/@", "%/C", "%/E")
+
+_DIRECTORY_FLAG = 0x02
+
+# discinfo is (timestamp, description, arch) or None if the image has none.
+# names_found is False if the image has neither Rock Ridge nor Joliet names,
+# in which case the image has to be mounted to find out about it.
+IsoInfo = namedtuple("IsoInfo", ["discinfo", "has_repodata", "names_found"])
+
+class IsoReadError(Exception):
+    pass
+
+def _read(f, offset, size):
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) != size:
+        raise IsoReadError("short read at %d" % offset)
+    return data
+
+def _root_record(descriptor):
+    """Return (location, size, block size) of a descriptor's root directory."""
+    block_size = struct.unpack("<H", descriptor[128:130])[0]
+    (extent, size) = struct.unpack("<I4xI", descriptor[158:170])
+    return (extent * block_size, size, block_size)
+
+def _volume_descriptors(f):
+    """Return the root directories of the primary and Joliet descriptors."""
+    primary = None
+    joliet = None
+
+    for i in range(_MAX_DESCRIPTORS):
+        descriptor = _read(f, _DESCRIPTORS_START + i * SECTOR_SIZE, SECTOR_SIZE)
+        if descriptor[1:6] != "CD001":
+            break
+
+        vd_type = ord(descriptor[0])
+        if vd_type == _TERMINATOR:
+            break
+        elif vd_type == _PRIMARY and primary is None:
+            primary = _root_record(descriptor)
+        elif vd_type == _SUPPLEMENTARY and descriptor[88:91] in _JOLIET_ESCAPES:
+            joliet = _root_record(descriptor)
+
+    return (primary, joliet)
+
+def _rock_ridge_name(system_use):
+    """Return the alternate name from the NM entries of a system use area."""
+    name = None
+    i = 0
+    while i + 4 <= len(system_use):
+        signature = system_use[i:i+2]
+        length = ord(system_use[i+2])
+        if length < 4:
+            break
+
+        if signature == "NM":
+            flags = ord(system_use[i+4])
+            # skip the names of the current and parent directories
+            if not flags & 0x06:
+                name = (name or "") + system_use[i+5:i+length]
+        elif signature == "ST":
+            break
+
+        i += length
+
+    return name
+
+def _directory_records(f, location, size):
+    """Yield (name, extent, size, flags, system_use) of a directory's records."""
+    data = _read(f, location, min(size, _MAX_READ))
+    offset = 0
+    while offset < len(data):
+        length = ord(data[offset])
+        if length == 0:
+            # records don't cross sectors, continue with the next one
+            offset = (offset // SECTOR_SIZE + 1) * SECTOR_SIZE
+            continue
+
+        record = data[offset:offset+length]
+        if len(record) < 34:
+            break
+
+        (extent, data_length) = struct.unpack("<I4xI", record[2:14])
+        flags = ord(record[25])
+        name_length = ord(record[32])
+        name = record[33:33+name_length]
+        # the system use area follows the name padded to an even length
+        su_start = 33 + name_length + (1 - name_length % 2)
+        yield (name, extent, data_length, flags, record[su_start:])
+
+        offset += length
+
+def _root_entries(f, root, joliet):
+    """Return a dict of root directory names to (location, size, flags).
+
+       The names are the Rock Ridge names, or the Joliet ones if the image
+       has no Rock Ridge extensions.  None is returned if it has neither.
+    """
+    (location, size, block_size) = root
+    entries = dict()
+    skip = 0
+    for (name, extent, data_length, flags, system_use) in _directory_records(f, location, size):
+        if name == "\0":
+            # the SP entry of the root's "." record says how many bytes to
+            # skip in the system use areas
+            if system_use[0:2] == "SP" and system_use[4:6] == "\xbe\xef":
+                skip = ord(system_use[6])
+            continue
+        elif name == "\1":
+            continue
+
+        rr_name = _rock_ridge_name(system_use[skip:])
+        if rr_name is None:
+            break
+        entries[rr_name] = (extent * block_size, data_length, flags)
+    else:
+        if entries:
+            return entries
+
+    if joliet is None:
+        return None
+
+    (location, size, block_size) = joliet
+    entries = dict()
+    for (name, extent, data_length, flags, _su) in _directory_records(f, location, size):
+        if name in ("\0", "\1"):
+            continue
+
+        try:
+            name = name.decode("utf-16-be")
+        except UnicodeDecodeError:
+            continue
+        entries[name.split(";")[0]] = (extent * block_size, data_length, flags)
+
+    return entries
+
+def parse_discinfo(lines):
+    """Return (timestamp, description, arch) from the lines of a .discinfo."""
+    lines = [line.strip() for line in lines[:3]]
+    lines += [""] * (3 - len(lines))
+    return tuple(lines)
+
+def read_iso_info(path):
+    """Read the install media information of an ISO image.
+
+       :param path: path to the image
+       :type path: str
+       :returns: the information or None if path is not an ISO image
+       :rtype: IsoInfo
+       :raises: IsoReadError, IOError
+    """
+    with open(path, "rb") as f:
+        try:
+            (primary, joliet) = _volume_descriptors(f)
+        except IsoReadError:
+            return None
+
+        if primary is None:
+            return None
+
+        entries = _root_entries(f, primary, joliet)
+        if entries is None:
+            return IsoInfo(None, False, False)
+
+        discinfo = None
+        if ".discinfo" in entries:
+            (location, size, flags) = entries[".discinfo"]
+            if not flags & _DIRECTORY_FLAG:
+                data = _read(f, location, min(size, _MAX_READ))
+                discinfo = parse_discinfo(data.splitlines())
+
+        return IsoInfo(discinfo, "repodata" in entries, True)
+
+_cache = dict()
+_cache_lock = threading.Lock()
+
+def iso_info(path):
+    """Return the install media information of an ISO image, see read_iso_info.
+
+       The result is cached by (path, size, mtime) of the image.  None is also
+       returned if the image can't be read.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    key = (st.st_size, st.st_mtime)
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    try:
+        info = read_iso_info(path)
+    except (IOError, IsoReadError) as e:
+        log.warning("cannot read %s: %s", path, e)
+        return None
+
+    with _cache_lock:
+        _cache[path] = (key, info)
+
+    return info
@@ -26,11 +26,24 @@ import stat
 import os.path
 import errno
 import subprocess
+import sys
+import select
 import unicodedata
 import string
 import types
-from threading import Thread
-from Queue import Queue, Empty
+from threading import Thread, Lock
+from Queue import Queue
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# number of threads used for changing owners of directory trees
+CHOWN_WORKERS = 4
 
 from pyanaconda.flags import flags
 from pyanaconda.constants import DRACUT_SHUTDOWN_EJECT, ROOT_PATH, TRANSLATIONS_UPDATE_DIR, UNSUPPORTED_HW
@@ -145,68 +158,118 @@ def execWithCapture(command, argv, stdin=None, root='/', log_output=True):
     argv = [command] + argv
     return _run_program(argv, stdin=stdin, root=root, log_output=log_output)[1]
 
-def execReadlines(command, argv, stdin=None, root='/', env_prune=None):
-    """ Execute an external command and return the line output of the command
-        in real-time.
+def startProgram(argv, root='/', stdin=None, stdout=subprocess.PIPE,
+                 env_prune=None, **kwargs):
+    """ Start an external program and return the Popen object.
 
-        :param command: The command to run
-        :param argv: The argument list
-        :param stdin: The file object to read stdin from.
-        :param stdout: Optional file object to redirect stdout and stderr to.
-        :param stderr: not used
+        The stderr of the program is redirected to its stdout.
+
+        :param argv: The command to run and argument
         :param root: The directory to chroot to before running command.
+        :param stdin: The file object to read stdin from.
+        :param stdout: The file object to write stdout and stderr to.
         :param env_prune: environment variable to remove before execution
-
-        Output from the file is not logged to program.log
-        This returns a generator with the lines from the command until it has finished
+        :param kwargs: Additional parameters to pass to subprocess.Popen
+        :return: A Popen object for the running command.
     """
     if env_prune is None:
         env_prune = []
 
-    # Return the lines from stdout via a Queue
-    def queue_lines(out, queue):
-        for line in iter(out.readline, b''):
-            queue.put(line.strip())
-        out.close()
-
     def chroot():
         if root and root != '/':
             os.chroot(root)
             os.chdir("/")
 
-    argv = [command] + argv
     with program_log_lock:
         program_log.info("Running... %s", " ".join(argv))
 
     env = augmentEnv()
     for var in env_prune:
         env.pop(var, None)
+
     try:
-        proc = subprocess.Popen(argv,
+        return subprocess.Popen(argv,
                                 stdin=stdin,
-                                stdout=subprocess.PIPE,
+                                stdout=stdout,
                                 stderr=subprocess.STDOUT,
-                                bufsize=1,
-                                preexec_fn=chroot, cwd=root, env=env)
+                                preexec_fn=chroot, cwd=root, env=env,
+                                **kwargs)
     except OSError as e:
         program_log.error("Error running %s: %s", argv[0], e.strerror)
         raise
 
-    q = Queue()
-    t = Thread(target=queue_lines, args=(proc.stdout, q))
-    t.daemon = True # thread dies with the program
-    t.start()
+def execReadlines(command, argv, stdin=None, root='/', env_prune=None):
+    """ Execute an external command and return the line output of the command
+        in real-time.
 
-    while True:
-        try:
-            line = q.get(timeout=.1)
-            yield line
-            q.task_done()
-        except Empty:
-            if proc.poll() is not None:
+        :param command: The command to run
+        :param argv: The argument list
+        :param stdin: The file object to read stdin from.
+        :param stdout: Optional file object to redirect stdout and stderr to.
+        :param stderr: not used
+        :param root: The directory to chroot to before running command.
+        :param env_prune: environment variable to remove before execution
+
+        Output from the file is not logged to program.log
+        This returns a generator with the lines from the command until it has finished
+    """
+    proc = startProgram([command] + argv, root=root, stdin=stdin,
+                        env_prune=env_prune)
+    return _readlines(proc)
+
+# maximum number of bytes read from a command's output at once
+READLINES_CHUNK_SIZE = 64 * 1024
+# lines longer than this are split so that the buffer doesn't grow endlessly
+READLINES_MAX_LINE = 1024 * 1024
+# how long to wait for output before checking if the process exited (seconds)
+READLINES_EXIT_CHECK = 5
+
+def _readlines(proc):
+    """ Generate the lines the process writes to its stdout.
+
+        Blocks in poll() until there is some output or the output is closed.
+        The process is only checked for exit if it stays silent for a while,
+        because its children might keep the output open after it exits.
+    """
+    fd = proc.stdout.fileno()
+    poller = select.poll()
+    poller.register(fd, select.POLLIN | select.POLLPRI)
+
+    partial = b""
+    try:
+        while True:
+            try:
+                events = poller.poll(READLINES_EXIT_CHECK * 1000)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            if not events:
+                if proc.poll() is not None:
+                    break
+                continue
+
+            data = os.read(fd, READLINES_CHUNK_SIZE)
+            if not data:
+                # EOF
                 break
-    q.join()
 
+            lines = (partial + data).split(b"\n")
+            partial = lines.pop()
+            for line in lines:
+                yield line.strip()
+
+            if len(partial) > READLINES_MAX_LINE:
+                yield partial.strip()
+                partial = b""
+
+        if partial:
+            yield partial.strip()
+    finally:
+        proc.stdout.close()
+
+    proc.wait()
 
 ## Run a shell.
 def execConsole():
@@ -216,44 +279,163 @@ def execConsole():
     except OSError as e:
         raise RuntimeError("Error running /bin/sh: " + e.strerror)
 
-def getDirSize(directory):
-    """ Get the size of a directory and all its subdirectories.
-    :param dir: The name of the directory to find the size of.
-    :return: The size of the directory in kilobytes.
+class _DirUsage(object):
+    """Space used by the entries of a single directory (not recursive)."""
+    __slots__ = ["size", "links", "subdirs"]
+
+    def __init__(self, size, links, subdirs):
+        # allocated bytes of the entries with a single link and subdirectories
+        self.size = size
+        # {(st_dev, st_ino): allocated bytes} of files with multiple links
+        self.links = links
+        # names of the subdirectories on the same device
+        self.subdirs = subdirs
+
+def _lstat_dir(directory):
+    """Return (name, lstat result) tuples for the entries of a directory.
+
+    Entries that can't be stat'ed (e.g. removed in the meantime) are skipped.
     """
-    def getSubdirSize(directory):
-        # returns size in bytes
-        try:
-            mydev = os.lstat(directory)[stat.ST_DEV]
-        except OSError as e:
-            log.debug("failed to stat %s: %s", directory, e)
-            return 0
+    entries = []
+    if scandir:
+        for entry in scandir(directory):
+            try:
+                entries.append((entry.name, entry.stat(follow_symlinks=False)))
+            except OSError as e:
+                log.debug("failed to stat %s/%s: %s", directory, entry.name, e)
+        return entries
 
+    for name in os.listdir(directory):
         try:
-            dirlist = os.listdir(directory)
+            entries.append((name, os.lstat(os.path.join(directory, name))))
         except OSError as e:
-            log.debug("failed to listdir %s: %s", directory, e)
-            return 0
+            log.debug("failed to stat %s/%s: %s", directory, name, e)
+    return entries
+
+def _dir_usage(directory, dir_stat):
+    """Get the _DirUsage of a directory."""
+    size = 0
+    links = {}
+    subdirs = []
+    try:
+        entries = _lstat_dir(directory)
+    except OSError as e:
+        log.debug("failed to listdir %s: %s", directory, e)
+        entries = []
 
-        dsize = 0
-        for f in dirlist:
-            curpath = '%s/%s' % (directory, f)
+    for (name, sinfo) in entries:
+        if sinfo.st_dev != dir_stat.st_dev:
+            # mount point
+            continue
+
+        allocated = sinfo.st_blocks * 512
+        if stat.S_ISDIR(sinfo.st_mode):
+            subdirs.append(name)
+            size += allocated
+        elif sinfo.st_nlink > 1:
+            links[(sinfo.st_dev, sinfo.st_ino)] = allocated
+        else:
+            size += allocated
+
+    return _DirUsage(size, links, subdirs)
+
+def _walk_tree(top, top_stat, handle_dir, workers=1):
+    """Call a function for a directory and all the directories under it.
+
+    :param top: path of the top directory
+    :param top_stat: lstat result of the top directory
+    :param handle_dir: a function taking a directory path and its lstat result
+                       and returning a list of (path, lstat result) tuples of
+                       the subdirectories that should be walked as well
+    :param workers: the number of threads calling handle_dir
+
+    The first exception raised by handle_dir stops the walk and is raised
+    again here, whatever the number of workers.
+    """
+    if workers <= 1:
+        stack = [(top, top_stat)]
+        while stack:
+            stack.extend(handle_dir(*stack.pop()))
+        return
+
+    q = Queue()
+    errors = []
+
+    def worker():
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            # after a failure the rest of the queue is only drained
+            if not errors:
+                try:
+                    for subdir in handle_dir(*item):
+                        q.put(subdir)
+                # pylint: disable-msg=W0703
+                except Exception:
+                    # list.append is atomic, only the first one is raised
+                    errors.append(sys.exc_info())
+            q.task_done()
+
+    q.put((top, top_stat))
+    threads = [Thread(target=worker) for _i in range(workers)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    # wait for all the directories to be processed and stop the workers
+    q.join()
+    for t in threads:
+        q.put(None)
+    for t in threads:
+        t.join()
+
+    if errors:
+        (exc_type, exc_value, exc_tb) = errors[0]
+        raise exc_type, exc_value, exc_tb
+
+def getDirSize(directory, workers=1):
+    """ Get the size of a directory and all its subdirectories.
+
+    The size is the space allocated on the disk, files with multiple hard links
+    are counted only once and other filesystems mounted under the directory are
+    skipped. Every entry is stat'ed once, nothing is kept between calls: the
+    mtime of a directory doesn't change when a file in it grows.
+
+    :param directory: The name of the directory to find the size of.
+    :param workers: The number of threads walking the subdirectories.
+    :return: The size of the directory in kilobytes.
+    """
+    try:
+        dir_stat = os.lstat(directory)
+    except OSError as e:
+        log.debug("failed to stat %s: %s", directory, e)
+        return 0
+
+    if not stat.S_ISDIR(dir_stat.st_mode):
+        return 0
+
+    totals = {"size": 0, "links": {}}
+    totals_lock = Lock()
+
+    def add_usage(path, path_stat):
+        usage = _dir_usage(path, path_stat)
+        with totals_lock:
+            totals["size"] += usage.size
+            totals["links"].update(usage.links)
+
+        subdirs = []
+        for name in usage.subdirs:
+            subdir = os.path.join(path, name)
             try:
-                sinfo = os.lstat(curpath)
+                subdirs.append((subdir, os.lstat(subdir)))
             except OSError as e:
-                log.debug("failed to stat %s/%s: %s", directory, f, e)
-                continue
+                log.debug("failed to stat %s: %s", subdir, e)
+        return subdirs
 
-            if stat.S_ISDIR(sinfo[stat.ST_MODE]):
-                if os.path.ismount(curpath):
-                    continue
-                if mydev == sinfo[stat.ST_DEV]:
-                    dsize += getSubdirSize(curpath)
-            elif stat.S_ISREG(sinfo[stat.ST_MODE]):
-                dsize += sinfo[stat.ST_SIZE]
+    _walk_tree(directory, dir_stat, add_usage, workers)
 
-        return dsize
-    return getSubdirSize(directory)/1024
+    return int((totals["size"] + sum(totals["links"].itervalues())) / 1024)
 
 ## Create a directory path.  Don't fail if the directory already exists.
 def mkdirChain(directory):
@@ -611,47 +793,110 @@ def cmp_obj_attrs(obj1, obj2, attr_list):
             return False
     return True
 
-def dir_tree_map(root, func, files=True, dirs=True):
+def _map_tree(root, func, files=True, dirs=True, dir_links=True, workers=1):
     """
     Apply the given function to all files and directories in the directory tree
-    under the given root directory.
+    under the given root directory. Symlinks are never followed.
 
-    :param root: root of the directory tree the function should be mapped to
-    :type root: str
-    :param func: a function taking the directory/file path
-    :type func: path -> None
-    :param files: whether to apply the function to the files in the dir. tree
-    :type files: bool
-    :param dirs: whether to apply the function to the directories in the dir. tree
-    :type dirs: bool
+    :param func: a function taking the path and its lstat result
+    :type func: (path, stat result) -> None
+    :param dir_links: whether to apply the function to the symlinks pointing
+                      to directories (they are never walked)
+    :type dir_links: bool
+    :return: number of entries the function was successfully applied to
+    :rtype: int
 
-    TODO: allow using globs and thus more trees?
+    See dir_tree_map for the other parameters.
 
     """
 
-    for (dir_ent, _dir_items, file_items) in os.walk(root):
+    try:
+        root_stat = os.lstat(root)
+    except OSError:
+        return 0
+
+    if not stat.S_ISDIR(root_stat.st_mode):
+        return 0
+
+    counts = []
+
+    def map_dir(path, path_stat):
+        count = 0
+        subdirs = []
+
         if dirs:
             # try to call the function on the directory entry
             try:
-                func(dir_ent)
+                func(path, path_stat)
+                count += 1
             except OSError:
                 pass
 
-        if files:
-            # try to call the function on the files in the directory entry
-            for file_ent in (os.path.join(dir_ent, f) for f in file_items):
+        try:
+            entries = _lstat_dir(path)
+        except OSError:
+            entries = []
+
+        for (name, entry_stat) in entries:
+            entry_path = os.path.join(path, name)
+            if stat.S_ISDIR(entry_stat.st_mode):
+                # directories are handled when their turn comes
+                subdirs.append((entry_path, entry_stat))
+            elif files:
+                if not dir_links and stat.S_ISLNK(entry_stat.st_mode) and \
+                        os.path.isdir(entry_path):
+                    continue
+
+                # try to call the function on the files in the directory entry
                 try:
-                    func(file_ent)
+                    func(entry_path, entry_stat)
+                    count += 1
                 except OSError:
                     pass
 
-        # directories under the directory entry will appear as directory entries
-        # in the loop
+        # list.append is atomic, no need for a lock
+        counts.append(count)
+        return subdirs
+
+    _walk_tree(root, root_stat, map_dir, workers)
+    return sum(counts)
+
+def dir_tree_map(root, func, files=True, dirs=True, workers=1):
+    """
+    Apply the given function to all files and directories in the directory tree
+    under the given root directory.
+
+    :param root: root of the directory tree the function should be mapped to
+    :type root: str
+    :param func: a function taking the directory/file path
+    :type func: path -> None
+    :param files: whether to apply the function to the files in the dir. tree
+    :type files: bool
+    :param dirs: whether to apply the function to the directories in the dir. tree
+    :type dirs: bool
+    :param workers: number of threads the subtrees are distributed to
+    :type workers: int
+    :return: number of entries the function was successfully applied to
+    :rtype: int
+
+    Symlinks are not followed. Like with os.walk, symlinks pointing to
+    directories are passed to the function neither as files nor as
+    directories. OSErrors raised by the function are ignored, the first other
+    exception stops the walk and is raised again.
+
+    TODO: allow using globs and thus more trees?
 
-def chown_dir_tree(root, uid, gid, from_uid_only=None, from_gid_only=None):
+    """
+
+    return _map_tree(root, lambda path, _stats: func(path), files=files,
+                     dirs=dirs, dir_links=False, workers=workers)
+
+def chown_dir_tree(root, uid, gid, from_uid_only=None, from_gid_only=None,
+                   workers=CHOWN_WORKERS):
     """
     Change owner (uid and gid) of the files and directories under the given
-    directory tree (recursively).
+    directory tree (recursively). Symlinks are not followed, the owner of the
+    symlinks themselves is changed.
 
     :param root: root of the directory tree that should be chown'ed
     :type root: str
@@ -665,27 +910,23 @@ def chown_dir_tree(root, uid, gid, from_uid_only=None, from_gid_only=None):
     :param from_gid_only: if given, the owner is changed only for the files and
                           directories owned by that GID
     :type from_gid_only: int or None
+    :param workers: number of threads the subtrees are distributed to
+    :type workers: int
+    :return: number of files and directories processed
+    :rtype: int
 
     """
 
-    def conditional_chown(path, uid, gid, from_uid=None, from_gid=None):
-        stats = os.stat(path)
-        if (from_uid and stats.st_uid != from_uid) or \
-                (from_gid and stats.st_gid != from_gid):
+    def conditional_chown(path, stats):
+        if (from_uid_only and stats.st_uid != from_uid_only) or \
+                (from_gid_only and stats.st_gid != from_gid_only):
             # owner UID or GID not matching, do nothing
             return
 
         # UID and GID matching or not required
-        os.chown(path, uid, gid)
+        os.lchown(path, uid, gid)
 
-    if not from_uid_only and not from_gid_only:
-        # the easy way
-        dir_tree_map(root, lambda path: os.chown(path, uid, gid))
-    else:
-        # conditional chown
-        dir_tree_map(root, lambda path: conditional_chown(path, uid, gid,
-                                                          from_uid_only,
-                                                          from_gid_only))
+    return _map_tree(root, conditional_chown, workers=workers)
 
 def is_unsupported_hw():
     """ Check to see if the hardware is supported or not.
@@ -23,9 +23,11 @@
 import gettext
 import os
 import re
+import cPickle
 import langtable
 import locale as locale_mod
 import glob
+import threading
 
 from pyanaconda import constants
 from pyanaconda.iutil import upcase_first_letter
@@ -35,6 +37,11 @@ log = logging.getLogger("anaconda")
 
 LOCALE_CONF_FILE_PATH = "/etc/locale.conf"
 
+#langtable's answers for the translated languages, built with the installer
+LANGTABLE_INDEX_PATH = "/usr/share/anaconda/langtable-index.pickle"
+#where langtable-data is installed if langtable doesn't say
+LANGTABLE_DATA_DIR = "/usr/share/langtable"
+
 #e.g. 'SR_RS.UTF-8@latin'
 LANGCODE_RE = re.compile(r'(?P<language>[A-Za-z]+)'
                          r'(_(?P<territory>[A-Za-z]+))?'
@@ -51,6 +58,8 @@ class InvalidLocaleSpec(LocalizationConfigError):
 
     pass
 
+_parsed_langcodes = dict()
+
 def parse_langcode(langcode):
     """
     For a given langcode (e.g. 'SR_RS.UTF-8@latin') returns a dictionary
@@ -68,11 +77,116 @@ def parse_langcode(langcode):
     if not langcode:
         return None
 
-    match = LANGCODE_RE.match(langcode)
-    if match:
-        return match.groupdict()
-    else:
-        return None
+    try:
+        parts = _parsed_langcodes[langcode]
+    except KeyError:
+        match = LANGCODE_RE.match(langcode)
+        parts = match.groupdict() if match else None
+        _parsed_langcodes[langcode] = parts
+
+    # callers may modify the dictionary
+    return dict(parts) if parts else None
+
+class _LangtableIndex(object):
+    """
+    langtable's answers to the queries the installer makes, by the langcode
+    they were asked for. The index is loaded from LANGTABLE_INDEX_PATH with
+    one read and the answers missing in it are added on their first use.
+
+    """
+
+    TABLES = ("language_locales", "territory_locales", "keyboards",
+              "timezones", "english_names", "native_names")
+
+    def __init__(self, data=None):
+        data = data or dict()
+        for table in self.TABLES:
+            setattr(self, table, data.get(table, dict()))
+
+    def to_data(self):
+        data = dict((table, getattr(self, table)) for table in self.TABLES)
+        data["langtable"] = _langtable_stamp()
+        return data
+
+def _langtable_files():
+    """
+    Return the paths of langtable's code and of the data files it reads,
+    they are looked for where langtable looks for them.
+
+    """
+
+    code = [os.path.splitext(langtable.__file__)[0] + ".py"]
+    moddir = os.path.dirname(os.path.realpath(code[0]))
+    if hasattr(langtable, "__path__"):
+        # a package, the code is in its modules
+        code = sorted(glob.glob(os.path.join(moddir, "*.py")))
+
+    data = []
+    datadir = getattr(langtable, "_DATADIR", LANGTABLE_DATA_DIR)
+    for directory in (moddir, os.path.join(moddir, "data"),
+                      datadir, os.path.join(datadir, "data")):
+        data.extend(sorted(glob.glob(os.path.join(directory, "*.xml")) +
+                           glob.glob(os.path.join(directory, "*.xml.gz"))))
+
+    return code + data
+
+def _langtable_stamp():
+    """
+    Identify the langtable the answers come from by its code and its data,
+    langtable-data is updated independently of langtable-python.
+
+    """
+
+    stamp = []
+    for path in _langtable_files():
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp.append("%s:%d:%d" % (path, st.st_size, int(st.st_mtime)))
+
+    return ";".join(stamp)
+
+_index = None
+_index_lock = threading.Lock()
+
+def _get_index():
+    global _index
+
+    with _index_lock:
+        if _index is None:
+            data = None
+            try:
+                with open(LANGTABLE_INDEX_PATH, "rb") as index_file:
+                    data = cPickle.load(index_file)
+            except (IOError, EOFError, cPickle.UnpicklingError) as err:
+                log.debug("cannot load langtable index: %s", err)
+
+            if data and data.get("langtable") != _langtable_stamp():
+                log.info("langtable index is out of date, not using it")
+                data = None
+
+            _index = _LangtableIndex(data)
+
+    return _index
+
+def _lookup(table, langcode, query):
+    """
+    Return the answer for the langcode from the given table of the index,
+    ask langtable with query(langcode) if it's not there yet.
+
+    """
+
+    answers = getattr(_get_index(), table)
+    try:
+        answer = answers[langcode]
+    except KeyError:
+        answer = query(langcode)
+        answers[langcode] = answer
+
+    if isinstance(answer, list):
+        return list(answer)
+    return answer
 
 def is_supported_locale(locale):
     """
@@ -143,10 +257,11 @@ def find_best_locale_match(locale, langcodes):
                   "script"   :   10,
                   "encoding" :    1 }
 
-    def get_match_score(locale, langcode):
+    locale_parts = parse_langcode(locale)
+
+    def get_match_score(langcode):
         score = 0
 
-        locale_parts = parse_langcode(locale)
         langcode_parts = parse_langcode(langcode)
         if not locale_parts or not langcode_parts:
             return score
@@ -169,7 +284,7 @@ def find_best_locale_match(locale, langcodes):
 
     # get score for each langcode
     for langcode in langcodes:
-        scores.append((langcode, get_match_score(locale, langcode)))
+        scores.append((langcode, get_match_score(langcode)))
 
     # find the best one
     sorted_langcodes = sorted(scores, key=lambda item_score: item_score[1], reverse=True)
@@ -212,6 +327,9 @@ def get_english_name(locale):
 
     """
 
+    return _lookup("english_names", locale, _query_english_name)
+
+def _query_english_name(locale):
     parts = parse_langcode(locale)
     if "language" not in parts:
         raise InvalidLocaleSpec("'%s' is not a valid locale" % locale)
@@ -235,6 +353,9 @@ def get_native_name(locale):
 
     """
 
+    return _lookup("native_names", locale, _query_native_name)
+
+def _query_native_name(locale):
     parts = parse_langcode(locale)
     if "language" not in parts:
         raise InvalidLocaleSpec("'%s' is not a valid locale" % locale)
@@ -292,6 +413,9 @@ def get_language_locales(lang):
 
     """
 
+    return _lookup("language_locales", lang, _query_language_locales)
+
+def _query_language_locales(lang):
     parts = parse_langcode(lang)
     if "language" not in parts:
         raise InvalidLocaleSpec("'%s' is not a valid language" % lang)
@@ -313,7 +437,8 @@ def get_territory_locales(territory):
 
     """
 
-    return langtable.list_locales(territoryId=territory)
+    return _lookup("territory_locales", territory,
+                   lambda territory: langtable.list_locales(territoryId=territory))
 
 def get_locale_keyboards(locale):
     """
@@ -327,6 +452,9 @@ def get_locale_keyboards(locale):
 
     """
 
+    return _lookup("keyboards", locale, _query_locale_keyboards)
+
+def _query_locale_keyboards(locale):
     parts = parse_langcode(locale)
     if "language" not in parts:
         raise InvalidLocaleSpec("'%s' is not a valid locale" % locale)
@@ -347,6 +475,9 @@ def get_locale_timezones(locale):
 
     """
 
+    return _lookup("timezones", locale, _query_locale_timezones)
+
+def _query_locale_timezones(locale):
     parts = parse_langcode(locale)
     if "language" not in parts:
         raise InvalidLocaleSpec("'%s' is not a valid locale" % locale)
@@ -373,6 +504,60 @@ def get_locale_territory(locale):
 
     return parts.get("territory", None)
 
+def build_langtable_index(languages):
+    """
+    Ask langtable everything the installer needs to know about the given
+    languages: their locales, the keyboards, timezones and names of the
+    locales and the locales of their territories.
+
+    :param languages: languages (e.g. translations of the installer)
+    :type languages: iterable of strings
+    :return: data of the index ready to be serialized
+    :rtype: dict
+
+    """
+
+    index = _LangtableIndex()
+    locales = set()
+
+    for lang in languages:
+        index.language_locales[lang] = _query_language_locales(lang)
+        locales.update(index.language_locales[lang])
+
+    for langcode in set(index.language_locales) | locales:
+        index.english_names[langcode] = _query_english_name(langcode)
+        index.native_names[langcode] = _query_native_name(langcode)
+
+    territories = set()
+    for locale in locales:
+        index.keyboards[locale] = _query_locale_keyboards(locale)
+        index.timezones[locale] = _query_locale_timezones(locale)
+        territory = get_locale_territory(locale)
+        if territory:
+            territories.add(territory)
+
+    for territory in territories:
+        index.territory_locales[territory] = langtable.list_locales(territoryId=territory)
+
+    return index.to_data()
+
+def write_langtable_index(languages, path):
+    """
+    Write the index of langtable's answers for the given languages to a file
+    that can be installed as LANGTABLE_INDEX_PATH.
+
+    :type languages: iterable of strings
+    :type path: str
+
+    """
+
+    # pickle keeps langtable's str and unicode objects as they are
+    with open(path, "wb") as index_file:
+        cPickle.dump(build_langtable_index(languages), index_file,
+                     cPickle.HIGHEST_PROTOCOL)
+
+_xlated_timezones = dict()
+
 def get_xlated_timezone(tz_spec_part):
     """
     Function returning translated name of a region, city or complete timezone
@@ -386,6 +571,11 @@ def get_xlated_timezone(tz_spec_part):
     """
 
     locale = os.environ.get("LANG", constants.DEFAULT_LANG)
+    try:
+        return _xlated_timezones[(locale, tz_spec_part)]
+    except KeyError:
+        pass
+
     parts = parse_langcode(locale)
     if "language" not in parts:
         raise InvalidLocaleSpec("'%s' is not a valid locale" % locale)
@@ -394,7 +584,9 @@ def get_xlated_timezone(tz_spec_part):
                                      territoryIdQuery=parts.get("territory", ""),
                                      scriptIdQuery=parts.get("script", ""))
 
-    return xlated.encode("utf-8")
+    xlated = xlated.encode("utf-8")
+    _xlated_timezones[(locale, tz_spec_part)] = xlated
+    return xlated
 
 def write_language_configuration(lang, root):
     """
@@ -29,7 +29,6 @@ import shutil
 from pyanaconda import iutil
 import socket
 import os
-import time
 import threading
 import re
 import dbus
@@ -45,6 +44,7 @@ from pyanaconda import nm
 from pyanaconda import constants
 from pyanaconda.flags import flags, can_touch_runtime_system
 from pyanaconda.i18n import _
+from pyanaconda.timing import monotonic
 
 from gi.repository import NetworkManager
 
@@ -264,6 +264,153 @@ class IfcfgFile(SimpleConfigFile):
         ifcfglog.debug("IfcfgFile.unset %s: %s", self.filename, args)
         SimpleConfigFile.unset(self, *args)
 
+def _file_stamp(path):
+    st = os.stat(path)
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+class IfcfgRepository(object):
+    """Parsed ifcfg files of a directory indexed by the keys they are
+       looked up by.
+
+       The directory is listed again only when its modification time
+       changes and a file is parsed again only when its modification time,
+       size or inode changes, so a lookup costs a stat of the directory and
+       of every file but doesn't read any of them.
+    """
+    INDEXED_KEYS = ("DEVICE", "HWADDR", "MASTER", "TEAM_MASTER", "UUID", "ESSID")
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._dir_stamp = None
+        # paths of the files in the order of the listing
+        self._paths = []
+        self._order = {}
+        # path -> (stamp, values)
+        self._files = {}
+        # key -> value -> set of paths
+        self._indexes = dict((key, {}) for key in self.INDEXED_KEYS)
+
+    @staticmethod
+    def _index_value(key, value):
+        # hardware addresses are compared case insensitively
+        if key == "HWADDR":
+            return value.upper()
+        return value
+
+    def _add(self, path, stamp, values):
+        self._files[path] = (stamp, values)
+        for key in self.INDEXED_KEYS:
+            value = values.get(key)
+            if value:
+                self._indexes[key].setdefault(self._index_value(key, value), set()).add(path)
+
+    def _drop(self, path):
+        if path not in self._files:
+            return
+
+        (_stamp, values) = self._files.pop(path)
+        for key in self.INDEXED_KEYS:
+            value = values.get(key)
+            if not value:
+                continue
+            index = self._indexes[key]
+            paths = index[self._index_value(key, value)]
+            paths.discard(path)
+            if not paths:
+                del index[self._index_value(key, value)]
+
+    def _refresh(self):
+        try:
+            dir_stamp = _file_stamp(self.directory)
+        except OSError:
+            dir_stamp = None
+
+        if dir_stamp != self._dir_stamp:
+            self._paths = _ifcfg_files(self.directory) if dir_stamp else []
+            self._order = dict((path, i) for (i, path) in enumerate(self._paths))
+            self._dir_stamp = dir_stamp
+            for path in [p for p in self._files if p not in self._order]:
+                self._drop(path)
+
+        for path in self._paths:
+            try:
+                stamp = _file_stamp(path)
+            except OSError:
+                self._drop(path)
+                continue
+
+            cached = self._files.get(path)
+            if cached and cached[0] == stamp:
+                continue
+
+            ifcfg = IfcfgFile(path)
+            try:
+                ifcfg.read()
+            except IOError as e:
+                log.debug("network: can't read %s: %s", path, e)
+                self._drop(path)
+                continue
+            self._drop(path)
+            self._add(path, stamp, ifcfg.info)
+
+    def _matches(self, values, key, value):
+        actual = values.get(key, "")
+        if callable(value):
+            return value(actual)
+        if key in self._indexes:
+            return self._index_value(key, actual) == self._index_value(key, value)
+        return actual == value
+
+    def find(self, values):
+        """Return the paths of the files matching all values.
+
+           :param values: list of (key, value) where value is either the
+                          value of the key or a function taking the value
+                          and returning whether it matches
+           :return: the paths in the order of the directory listing
+           :rtype: list of str
+        """
+        with self._lock:
+            self._refresh()
+
+            candidates = None
+            for (key, value) in values:
+                if key in self._indexes and not callable(value):
+                    paths = self._indexes[key].get(self._index_value(key, value), set())
+                    candidates = paths if candidates is None else candidates & paths
+
+            if candidates is None:
+                candidates = self._files
+            paths = sorted(candidates, key=self._order.get)
+
+            return [path for path in paths
+                    if all(self._matches(self._files[path][1], key, value)
+                           for (key, value) in values)]
+
+    def ifcfg(self, path):
+        """Return the IfcfgFile of path with its values already read or None
+           if there is no such file.
+        """
+        with self._lock:
+            self._refresh()
+            if path not in self._files:
+                return None
+            ifcfg = IfcfgFile(path)
+            ifcfg.info = dict(self._files[path][1])
+            return ifcfg
+
+_ifcfg_repositories = {}
+_ifcfg_repositories_lock = threading.Lock()
+
+def ifcfg_repository(directory=netscriptsDir):
+    """Return the IfcfgRepository of the directory."""
+    directory = os.path.normpath(directory)
+    with _ifcfg_repositories_lock:
+        if directory not in _ifcfg_repositories:
+            _ifcfg_repositories[directory] = IfcfgRepository(directory)
+        return _ifcfg_repositories[directory]
+
 def dumpMissingDefaultIfcfgs():
     """
     Dump missing default ifcfg file for wired devices.
@@ -579,8 +726,9 @@ def ksdata_from_ifcfg(devname, uuid=None):
     if not ifcfg_path:
         return None
 
-    ifcfg = IfcfgFile(ifcfg_path)
-    ifcfg.read()
+    ifcfg = ifcfg_repository().ifcfg(ifcfg_path)
+    if not ifcfg:
+        return None
     nd = ifcfg_to_ksdata(ifcfg, devname)
 
     if not nd:
@@ -747,36 +895,27 @@ def find_ifcfg_file_of_device(devname, root_path=""):
         except nm.PropertyNotFoundError:
             hwaddr = None
         if hwaddr:
-            hwaddr_check = lambda mac: mac.upper() == hwaddr.upper()
+            # HWADDR is compared case insensitively
             nonempty = lambda x: x
             # slave configration created in GUI takes precedence
-            ifcfg_path = find_ifcfg_file([("HWADDR", hwaddr_check),
+            ifcfg_path = find_ifcfg_file([("HWADDR", hwaddr),
                                           ("MASTER", nonempty)],
                                          root_path)
             if not ifcfg_path:
-                ifcfg_path = find_ifcfg_file([("HWADDR", hwaddr_check),
+                ifcfg_path = find_ifcfg_file([("HWADDR", hwaddr),
                                               ("TEAM_MASTER", nonempty)],
                                              root_path)
             if not ifcfg_path:
-                ifcfg_path = find_ifcfg_file([("HWADDR", hwaddr_check)], root_path)
+                ifcfg_path = find_ifcfg_file([("HWADDR", hwaddr)], root_path)
         if not ifcfg_path:
             ifcfg_path = find_ifcfg_file([("DEVICE", devname)], root_path)
 
     return ifcfg_path
 
 def find_ifcfg_file(values, root_path=""):
-    for filepath in _ifcfg_files(os.path.normpath(root_path+netscriptsDir)):
-        ifcfg = IfcfgFile(filepath)
-        ifcfg.read()
-        for key, value in values:
-            if callable(value):
-                if not value(ifcfg.get(key)):
-                    break
-            else:
-                if ifcfg.get(key) != value:
-                    break
-        else:
-            return filepath
+    paths = ifcfg_repository(root_path+netscriptsDir).find(values)
+    if paths:
+        return paths[0]
     return None
 
 def get_bond_slaves_from_ifcfgs(master_specs):
@@ -787,11 +926,16 @@ def get_bond_slaves_from_ifcfgs(master_specs):
     """
     slaves = []
 
-    for filepath in _ifcfg_files(netscriptsDir):
-        ifcfg = IfcfgFile(filepath)
-        ifcfg.read()
-        master = ifcfg.get("MASTER")
-        if master in master_specs:
+    repository = ifcfg_repository()
+    filepaths = []
+    for master in master_specs:
+        for filepath in repository.find([("MASTER", master)]):
+            if filepath not in filepaths:
+                filepaths.append(filepath)
+
+    for filepath in filepaths:
+        ifcfg = repository.ifcfg(filepath)
+        if ifcfg:
             device = ifcfg.get("DEVICE")
             if device:
                 slaves.append(device)
@@ -1235,7 +1379,7 @@ def _wait_for_connecting_NM():
     """If NM is in connecting state, wait for connection.
     Return value: NM has got connection."""
 
-    if nm.nm_is_connected:
+    if nm.nm_is_connected():
         return True
 
     if nm.nm_is_connecting():
@@ -1243,27 +1387,23 @@ def _wait_for_connecting_NM():
     else:
         return False
 
-    i = 0
-    while nm.nm_is_connecting() and i < constants.NETWORK_CONNECTION_TIMEOUT:
-        i += constants.NETWORK_CONNECTED_CHECK_INTERVAL
-        time.sleep(constants.NETWORK_CONNECTED_CHECK_INTERVAL)
-        if nm.nm_is_connected():
-            log.debug("connected, waited %d seconds", i)
-            return True
+    # woken up by NM's state changes, not polling
+    start = monotonic()
+    nm.nm_wait_for(lambda: not nm.nm_is_connecting(),
+                   constants.NETWORK_CONNECTION_TIMEOUT,
+                   constants.NETWORK_CONNECTED_CHECK_INTERVAL)
+    if nm.nm_is_connected():
+        log.debug("connected, waited %.1f seconds", monotonic() - start)
+        return True
 
-    log.debug("not connected, waited %d of %d secs", i, constants.NETWORK_CONNECTION_TIMEOUT)
+    log.debug("not connected, waited %.1f of %d secs", monotonic() - start,
+              constants.NETWORK_CONNECTION_TIMEOUT)
     return False
 
 def wait_for_network_devices(devices, timeout=constants.NETWORK_CONNECTION_TIMEOUT):
     devices = set(devices)
-    i = 0
     log.debug("waiting for connection of devices %s for iscsi", devices)
-    while  i < timeout:
-        if not devices - set(nm.nm_activated_devices()):
-            return True
-        i += 1
-        time.sleep(1)
-    return False
+    return nm.nm_wait_for(lambda: not devices - set(nm.nm_activated_devices()), timeout)
 
 def wait_for_connecting_NM_thread(ksdata):
     """This function is called from a thread which is run at startup
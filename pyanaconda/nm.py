@@ -25,8 +25,26 @@ import IPy
 import struct
 import socket
 import re
+import copy
+import time
+import threading
 
 from pyanaconda.constants import DEFAULT_DBUS_TIMEOUT
+from pyanaconda.timing import monotonic
+
+import logging
+log = logging.getLogger("anaconda")
+
+NM_SERVICE = "org.freedesktop.NetworkManager"
+NM_PATH = "/org/freedesktop/NetworkManager"
+NM_SETTINGS_PATH = "/org/freedesktop/NetworkManager/Settings"
+NM_DEVICE_IFACE = "org.freedesktop.NetworkManager.Device"
+NM_SETTINGS_IFACE = "org.freedesktop.NetworkManager.Settings"
+NM_CONNECTION_IFACE = "org.freedesktop.NetworkManager.Settings.Connection"
+DBUS_PROPERTIES_IFACE = "org.freedesktop.DBus.Properties"
+
+# seconds to wait for the signal subscriptions of the object cache
+NM_CACHE_START_TIMEOUT = 5
 
 supported_device_types = [
     NetworkManager.DeviceType.ETHERNET,
@@ -84,9 +102,8 @@ def _get_proxy(bus_type=Gio.BusType.SYSTEM,
                                            cancellable)
     return proxy
 
-def _get_property(object_path, prop, interface_name_suffix=""):
-    interface_name = "org.freedesktop.NetworkManager" + interface_name_suffix
-    proxy = _get_proxy(object_path=object_path, interface_name="org.freedesktop.DBus.Properties")
+def _get_property_uncached(object_path, prop, interface_name):
+    proxy = _get_proxy(object_path=object_path, interface_name=DBUS_PROPERTIES_IFACE)
     try:
         prop = proxy.Get('(ss)', interface_name, prop)
     except GLib.GError as e:
@@ -99,6 +116,519 @@ def _get_property(object_path, prop, interface_name_suffix=""):
 
     return prop
 
+def _get_all_properties(object_path, interface_name):
+    """Return a dict of all properties of the object's interface or None if
+       NM doesn't let us read them at once.
+    """
+    proxy = _get_proxy(object_path=object_path, interface_name=DBUS_PROPERTIES_IFACE)
+    try:
+        return proxy.GetAll('(s)', interface_name)
+    except GLib.GError as e:
+        if "org.freedesktop.DBus.Error.AccessDenied" in e.message:
+            return None
+        elif "org.freedesktop.DBus.Error.UnknownMethod" in e.message:
+            raise UnknownMethodGetError
+        else:
+            raise
+
+def _get_settings_uncached(settings_path):
+    proxy = _get_proxy(object_path=settings_path, interface_name=NM_CONNECTION_IFACE)
+    return proxy.GetSettings()
+
+# keys of the generations of the lists of devices and connections
+_DEVICES = "devices"
+_CONNECTIONS = "connections"
+
+# value of a setting a connection doesn't have (or can't be indexed by)
+_MISSING = object()
+
+class _SettingsIndex(object):
+    """Connections by the formatted value of one of their settings."""
+    def __init__(self, key1, key2, format_value):
+        self.key1 = key1
+        self.key2 = key2
+        self.format_value = format_value
+        # formatted value -> set of connection paths
+        self.values = {}
+        # connection path -> formatted value or _MISSING
+        self.paths = {}
+        # whether all the connections are in the index
+        self.complete = False
+
+    def formatted(self, settings):
+        try:
+            return self.format_value(settings[self.key1][self.key2])
+        except KeyError:
+            return _MISSING
+
+    def value(self, settings):
+        try:
+            value = self.formatted(settings)
+            hash(value)
+        except TypeError:
+            return _MISSING
+        return value
+
+    def add(self, path, settings):
+        self.remove(path)
+        value = self.value(settings)
+        self.paths[path] = value
+        if value is not _MISSING:
+            self.values.setdefault(value, set()).add(path)
+
+    def remove(self, path):
+        self.complete = False
+        value = self.paths.pop(path, _MISSING)
+        if value is not _MISSING:
+            paths = self.values[value]
+            paths.discard(path)
+            if not paths:
+                del self.values[value]
+
+class NMObjectCache(object):
+    """Properties of NetworkManager's objects and settings of its connections.
+
+       The cache is filled on demand: the properties of an interface of an
+       object are loaded with one GetAll call, the settings of a connection
+       with one GetSettings call.  It is kept up to date by NM's signals,
+       which are received by a thread running its own main loop, so it
+       doesn't depend on whether and where the UI runs a main loop.
+
+       Everything a signal touches gets a new generation.  Data loaded
+       while a signal was being handled is returned, but not cached.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = False
+        self.active = False
+        # notified after every signal
+        self._changed = threading.Condition(self._lock)
+        self._changes = 0
+
+        self._epoch = 0
+        # object path (or _DEVICES, _CONNECTIONS) -> number of changes
+        self._generations = {}
+        # object path -> interface name -> dict of properties
+        self._properties = {}
+        # device path -> name of the type specific interface of the device
+        self._device_ifaces = {}
+        # object paths of the devices
+        self._devices = None
+        # ip interface name -> device path
+        self._device_paths = None
+        # object paths of the connections
+        self._connections = None
+        # connection path -> settings
+        self._settings = {}
+        # (key1, key2, format_value) -> _SettingsIndex
+        self._settings_indexes = {}
+
+    def start(self):
+        """Start receiving NM's signals.
+
+           :return: whether the cache can be used
+           :rtype: bool
+        """
+        with self._lock:
+            if self._started:
+                return self.active
+            self._started = True
+
+        ready = threading.Event()
+        thread = threading.Thread(name="AnaNMSignalThread", target=self._run, args=(ready,))
+        thread.daemon = True
+        thread.start()
+        ready.wait(NM_CACHE_START_TIMEOUT)
+        return self.active
+
+    def _run(self, ready):
+        context = GLib.MainContext()
+        context.push_thread_default()
+        try:
+            bus = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+            bus.signal_subscribe(NM_SERVICE, None, None, None, None,
+                                 Gio.DBusSignalFlags.NONE, self._on_signal, None)
+            bus.signal_subscribe("org.freedesktop.DBus", "org.freedesktop.DBus",
+                                 "NameOwnerChanged", "/org/freedesktop/DBus", NM_SERVICE,
+                                 Gio.DBusSignalFlags.NONE, self._on_owner_changed, None)
+        except GLib.GError as e:
+            log.warning("NetworkManager objects will not be cached: %s", e)
+            ready.set()
+            return
+
+        # the match rules are sent before any call made on the shared bus
+        # connection later, so no signal is missed for data loaded from now
+        self.active = True
+        ready.set()
+        GLib.MainLoop.new(context, False).run()
+
+    def _generation(self, key):
+        return (self._epoch, self._generations.get(key, 0))
+
+    def _bump(self, key):
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        """Forget everything."""
+        with self._lock:
+            self._changes += 1
+            self._changed.notify_all()
+            self._epoch += 1
+            self._generations.clear()
+            self._properties.clear()
+            self._device_ifaces.clear()
+            self._devices = None
+            self._device_paths = None
+            self._connections = None
+            self._settings.clear()
+            self._settings_indexes.clear()
+
+    def _on_owner_changed(self, _connection, _sender, _path, _interface, _signal,
+                          parameters, *_args):
+        (name, _old, new) = parameters.unpack()
+        log.debug("%s is now owned by '%s', clearing its cached objects", name, new)
+        self.clear()
+
+    def _on_signal(self, _connection, _sender, path, interface, signal, parameters, *_args):
+        with self._lock:
+            self._bump(path)
+
+            if signal == "PropertiesChanged":
+                if interface == DBUS_PROPERTIES_IFACE:
+                    (interface, changed, invalidated) = parameters.unpack()
+                else:
+                    (changed,) = parameters.unpack()
+                    invalidated = []
+                self._update_properties(path, interface, changed, invalidated)
+            elif signal == "StateChanged":
+                # NM, devices and active connections all announce the new
+                # state as the first argument
+                self._update_properties(path, interface, {"State": parameters.unpack()[0]}, [])
+            elif signal in ("DeviceAdded", "DeviceRemoved") and interface == NM_SERVICE:
+                (device,) = parameters.unpack()
+                self._bump(_DEVICES)
+                self._bump(device)
+                self._devices = None
+                self._device_paths = None
+                self._properties.pop(device, None)
+                self._device_ifaces.pop(device, None)
+            elif signal == "NewConnection" and interface == NM_SETTINGS_IFACE:
+                self._bump(_CONNECTIONS)
+                self._connections = None
+                for index in self._settings_indexes.values():
+                    index.complete = False
+            elif signal == "Removed" and interface == NM_CONNECTION_IFACE:
+                self._bump(_CONNECTIONS)
+                self._connections = None
+                self._drop_settings(path)
+            elif signal == "Updated" and interface == NM_CONNECTION_IFACE:
+                self._drop_settings(path)
+
+            self._changes += 1
+            self._changed.notify_all()
+
+    def wait(self, predicate, timeout):
+        """Wait until predicate returns True, evaluating it again every time
+           NM announces a change.
+
+           :param predicate: function of no arguments, called without any
+                             lock held so it can query the cache
+           :param timeout: seconds to wait at most
+           :return: whether predicate returned True before the timeout
+           :rtype: bool
+        """
+        deadline = monotonic() + timeout
+        while True:
+            with self._lock:
+                changes = self._changes
+
+            if predicate():
+                return True
+
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+
+            with self._lock:
+                if self._changes == changes:
+                    self._changed.wait(remaining)
+
+    def _drop_settings(self, path):
+        self._settings.pop(path, None)
+        for index in self._settings_indexes.values():
+            index.remove(path)
+
+    def _update_properties(self, path, interface, changed, invalidated):
+        # Older NMs announce the changes of the generic device properties by
+        # the signal of the type specific interface, so a property is updated
+        # in every interface it was loaded from.
+        interfaces = self._properties.get(path, {})
+        for (prop, value) in changed.items():
+            for (name, props) in interfaces.items():
+                if prop in props or name == interface:
+                    props[prop] = value
+
+        if invalidated:
+            interfaces.pop(interface, None)
+
+        if "Interface" in changed or "IpInterface" in changed:
+            self._bump(_DEVICES)
+            self._device_paths = None
+
+    def properties(self, path, interface):
+        """Return the dict of the properties of the object's interface or
+           None if they can't be loaded at once.
+
+           :raise UnknownMethodGetError: if the object doesn't exist
+        """
+        with self._lock:
+            props = self._properties.get(path, {}).get(interface)
+            if props is not None:
+                return props
+            generation = self._generation(path)
+
+        props = _get_all_properties(path, interface)
+        if props is None:
+            return None
+
+        with self._lock:
+            if self._generation(path) == generation:
+                self._properties.setdefault(path, {})[interface] = props
+        return props
+
+    def devices(self):
+        """Return the object paths of all devices."""
+        with self._lock:
+            if self._devices is not None:
+                return list(self._devices)
+            generation = self._generation(_DEVICES)
+
+        devices = _get_proxy().GetDevices()
+        with self._lock:
+            if self._generation(_DEVICES) == generation:
+                self._devices = list(devices)
+        return list(devices)
+
+    def device_path(self, name):
+        """Return the object path of the device with the ip interface name or
+           None if there is no such device.
+        """
+        with self._lock:
+            if self._device_paths is not None:
+                return self._device_paths.get(name)
+            generation = self._generation(_DEVICES)
+
+        paths = {}
+        for device in self.devices():
+            try:
+                props = self.properties(device, NM_DEVICE_IFACE)
+            except UnknownMethodGetError:
+                # removed in the meantime
+                continue
+            if props is None:
+                return _get_device_path_uncached(name)
+            # this is what GetDeviceByIpIface looks for
+            paths[props.get("IpInterface") or props.get("Interface")] = device
+
+        with self._lock:
+            if self._generation(_DEVICES) == generation:
+                self._device_paths = paths
+        return paths.get(name)
+
+    def device_iface(self, device):
+        """Return the name of the type specific interface of the device."""
+        with self._lock:
+            if device in self._device_ifaces:
+                return self._device_ifaces[device]
+            generation = self._generation(device)
+
+        iface = _device_type_specific_interface_uncached(device)
+        with self._lock:
+            if self._generation(device) == generation:
+                self._device_ifaces[device] = iface
+        return iface
+
+    def connections(self):
+        """Return the object paths of all connections."""
+        with self._lock:
+            if self._connections is not None:
+                return list(self._connections)
+            generation = self._generation(_CONNECTIONS)
+
+        proxy = _get_proxy(object_path=NM_SETTINGS_PATH, interface_name=NM_SETTINGS_IFACE)
+        connections = proxy.ListConnections()
+        with self._lock:
+            if self._generation(_CONNECTIONS) == generation:
+                self._connections = list(connections)
+        return list(connections)
+
+    def settings(self, path):
+        """Return the settings of the connection."""
+        with self._lock:
+            if path in self._settings:
+                return self._settings[path]
+            generation = self._generation(path)
+
+        settings = _get_settings_uncached(path)
+        with self._lock:
+            if self._generation(path) == generation:
+                self._settings[path] = settings
+        return settings
+
+    def find_settings(self, value, key1, key2, format_value):
+        """Return the paths of the connections having the value of the key1,
+           key2 setting, in the order of ListConnections.
+
+           There is an index for every (key1, key2, format_value), built the
+           first time it is asked for and updated for the connections added,
+           updated or removed since then, so format_value should always be
+           the same function for the same setting.
+        """
+        connections = self.connections()
+        key = (key1, key2, format_value)
+
+        with self._lock:
+            index = self._settings_indexes.get(key)
+            if index is None:
+                index = self._settings_indexes[key] = _SettingsIndex(key1, key2, format_value)
+            if index.complete:
+                missing = []
+            else:
+                missing = [con for con in connections if con not in index.paths]
+            generation = self._generation(_CONNECTIONS)
+
+        try:
+            hash(value)
+        except TypeError:
+            # can't be in an index, compare with every connection's value
+            return [con for con in connections
+                    if index.formatted(self.settings(con)) == value]
+
+        matches = set()
+        complete = True
+        for con in missing:
+            with self._lock:
+                con_generation = self._generation(con)
+            settings = self.settings(con)
+            with self._lock:
+                if self._generation(con) == con_generation:
+                    index.add(con, settings)
+                else:
+                    complete = False
+            if index.value(settings) == value:
+                matches.add(con)
+
+        with self._lock:
+            if complete and self._generation(_CONNECTIONS) == generation:
+                index.complete = True
+            matches.update(index.values.get(value, ()))
+
+        if len(matches) > 1:
+            return [con for con in connections if con in matches]
+        return list(matches)
+
+    def invalidate_settings(self, path=None):
+        """Forget the settings of the connection after changing them.
+
+           The list of the connections is forgotten if path is None.
+        """
+        with self._lock:
+            if path is None:
+                self._bump(_CONNECTIONS)
+                self._connections = None
+                for index in self._settings_indexes.values():
+                    index.complete = False
+            else:
+                self._bump(path)
+                self._drop_settings(path)
+
+nm_object_cache = NMObjectCache()
+
+def _cache():
+    """Return the object cache or None if NM's signals can't be received."""
+    if nm_object_cache.start():
+        return nm_object_cache
+    return None
+
+def _get_property(object_path, prop, interface_name_suffix=""):
+    interface_name = "org.freedesktop.NetworkManager" + interface_name_suffix
+    cache = _cache()
+    if cache:
+        props = cache.properties(object_path, interface_name)
+        if props is not None:
+            return copy.deepcopy(props.get(prop))
+
+    return _get_property_uncached(object_path, prop, interface_name)
+
+def _get_settings(settings_path):
+    cache = _cache()
+    if cache:
+        return copy.deepcopy(cache.settings(settings_path))
+    return _get_settings_uncached(settings_path)
+
+def _list_connections():
+    cache = _cache()
+    if cache:
+        return cache.connections()
+    proxy = _get_proxy(object_path=NM_SETTINGS_PATH, interface_name=NM_SETTINGS_IFACE)
+    return proxy.ListConnections()
+
+def _invalidate_settings(settings_path=None):
+    if nm_object_cache.active:
+        nm_object_cache.invalidate_settings(settings_path)
+
+def _get_device_path_uncached(name):
+    proxy = _get_proxy()
+    try:
+        return proxy.GetDeviceByIpIface('(s)', name)
+    except GLib.GError as e:
+        if "org.freedesktop.NetworkManager.UnknownDevice" in e.message:
+            return None
+        raise
+
+def _get_device_path(name):
+    """Return the object path of the device.
+
+       :raise UnknownDeviceError: if device is not found
+    """
+    cache = _cache()
+    if cache:
+        device = cache.device_path(name)
+    else:
+        device = _get_device_path_uncached(name)
+
+    if device is None:
+        raise UnknownDeviceError(name)
+    return device
+
+def nm_wait_for(predicate, timeout, interval=1):
+    """Wait until the state of NetworkManager satisfies predicate.
+
+       The predicate is evaluated again as soon as NM announces a change of
+       its objects or, if NM's signals can't be received, every interval
+       seconds.
+
+       :param predicate: function of no arguments returning a bool, usually
+                         calling other nm_* functions
+       :param timeout: seconds to wait at most
+       :type timeout: int or float
+       :param interval: seconds between evaluations if there are no signals
+       :type interval: int or float
+       :return: whether predicate returned True before the timeout
+       :rtype: bool
+    """
+    cache = _cache()
+    if cache:
+        return cache.wait(predicate, timeout)
+
+    deadline = monotonic() + timeout
+    while not predicate():
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+    return True
+
 def nm_state():
     """Return state of NetworkManager
 
@@ -138,8 +668,11 @@ def nm_devices():
 
     interfaces = []
 
-    proxy = _get_proxy()
-    devices = proxy.GetDevices()
+    cache = _cache()
+    if cache:
+        devices = cache.devices()
+    else:
+        devices = _get_proxy().GetDevices()
     for device in devices:
         device_type = _get_property(device, "DeviceType", ".Device")
         if device_type not in supported_device_types:
@@ -184,13 +717,19 @@ def _get_object_iface_names(object_path):
     node_info = Gio.DBusNodeInfo.new_for_xml(res_xml[0])
     return [iface.name for iface in node_info.interfaces]
 
-def _device_type_specific_interface(device):
+def _device_type_specific_interface_uncached(device):
     ifaces = _get_object_iface_names(device)
     for iface in ifaces:
         if iface.startswith("org.freedesktop.NetworkManager.Device."):
             return iface
     return None
 
+def _device_type_specific_interface(device):
+    cache = _cache()
+    if cache:
+        return cache.device_iface(device)
+    return _device_type_specific_interface_uncached(device)
+
 def nm_device_property(name, prop):
     """Return value of device NM property
 
@@ -206,13 +745,7 @@ def nm_device_property(name, prop):
 
     retval = None
 
-    proxy = _get_proxy()
-    try:
-        device = proxy.GetDeviceByIpIface('(s)', name)
-    except GLib.GError as e:
-        if "org.freedesktop.NetworkManager.UnknownDevice" in e.message:
-            raise UnknownDeviceError(name, e)
-        raise
+    device = _get_device_path(name)
 
     retval = _get_property(device, prop, ".Device")
     if not retval:
@@ -533,6 +1066,17 @@ def nm_ntp_servers_from_dhcp():
         # NetworkManager does not request NTP/SNTP options for DHCP6
     return ntp_servers
 
+# The settings indexes are per format function, so the same function has to be
+# used for the same setting every time.
+def _identity(value):
+    return value
+
+def _format_ssid(ssid_ay):
+    return "".join(chr(b) for b in ssid_ay)
+
+def _format_hwaddr(hwaddr_ay):
+    return ":".join("%02X" % b for b in hwaddr_ay)
+
 def _device_settings(name):
     """Return list of object paths of device settings
 
@@ -567,8 +1111,7 @@ def _settings_for_ap(ssid):
        :return: list of paths of settings of access point
        :rtype: list
 `   """
-    return _find_settings(ssid, '802-11-wireless', 'ssid',
-            format_value=lambda ba: "".join(chr(b) for b in ba))
+    return _find_settings(ssid, '802-11-wireless', 'ssid', format_value=_format_ssid)
 
 def _settings_for_hwaddr(hwaddr):
     """Return list of object paths of settings of device specified by hw address.
@@ -578,10 +1121,9 @@ def _settings_for_hwaddr(hwaddr):
        :return: list of paths of settings found for hw address
        :rtype: list
     """
-    return _find_settings(hwaddr, '802-3-ethernet', 'mac-address',
-            format_value=lambda ba: ":".join("%02X" % b for b in ba))
+    return _find_settings(hwaddr, '802-3-ethernet', 'mac-address', format_value=_format_hwaddr)
 
-def _find_settings(value, key1, key2, format_value=lambda x:x):
+def _find_settings(value, key1, key2, format_value=_identity):
     """Return list of object paths of settings having given value of key1, key2 setting
 
        :param value: required value of setting
@@ -596,14 +1138,15 @@ def _find_settings(value, key1, key2, format_value=lambda x:x):
        :return: list of paths of settings
        :rtype: list
     """
-    retval = []
+    cache = _cache()
+    if cache:
+        return cache.find_settings(value, key1, key2, format_value)
 
-    proxy = _get_proxy(object_path="/org/freedesktop/NetworkManager/Settings", interface_name="org.freedesktop.NetworkManager.Settings")
+    retval = []
 
-    connections = proxy.ListConnections()
+    connections = _list_connections()
     for con in connections:
-        proxy = _get_proxy(object_path=con, interface_name="org.freedesktop.NetworkManager.Settings.Connection")
-        settings = proxy.GetSettings()
+        settings = _get_settings(con)
         try:
             v = settings[key1][key2]
         except KeyError:
@@ -613,7 +1156,7 @@ def _find_settings(value, key1, key2, format_value=lambda x:x):
 
     return retval
 
-def nm_get_settings(value, key1, key2, format_value=lambda x:x):
+def nm_get_settings(value, key1, key2, format_value=_identity):
     """Return settings having given value of key1, key2 setting
 
        Returns list of settings(dicts) , None if settings were not found.
@@ -621,8 +1164,7 @@ def nm_get_settings(value, key1, key2, format_value=lambda x:x):
     retval = []
     settings_paths = _find_settings(value, key1, key2, format_value)
     for settings_path in settings_paths:
-        proxy = _get_proxy(object_path=settings_path, interface_name="org.freedesktop.NetworkManager.Settings.Connection")
-        settings = proxy.GetSettings()
+        settings = _get_settings(settings_path)
         retval.append(settings)
 
     return retval
@@ -631,12 +1173,9 @@ def nm_get_all_settings():
     """Return all settings for logging."""
     retval = []
 
-    proxy = _get_proxy(object_path="/org/freedesktop/NetworkManager/Settings", interface_name="org.freedesktop.NetworkManager.Settings")
-
-    connections = proxy.ListConnections()
+    connections = _list_connections()
     for con in connections:
-        proxy = _get_proxy(object_path=con, interface_name="org.freedesktop.NetworkManager.Settings.Connection")
-        settings = proxy.GetSettings()
+        settings = _get_settings(con)
         retval.append(settings)
 
     return retval
@@ -663,8 +1202,7 @@ def nm_device_setting_value(name, key1, key2):
         raise SettingsNotFoundError(name)
     else:
         settings_path = settings_paths[0]
-    proxy = _get_proxy(object_path=settings_path, interface_name="org.freedesktop.NetworkManager.Settings.Connection")
-    settings = proxy.GetSettings()
+    settings = _get_settings(settings_path)
     try:
         value = settings[key1][key2]
     except KeyError:
@@ -692,8 +1230,7 @@ def nm_ap_setting_value(ssid, key1, key2):
         raise SettingsNotFoundError(ssid)
     else:
         settings_path = settings_paths[0]
-    proxy = _get_proxy(object_path=settings_path, interface_name="org.freedesktop.NetworkManager.Settings.Connection")
-    settings = proxy.GetSettings()
+    settings = _get_settings(settings_path)
     try:
         value = settings[key1][key2]
     except KeyError:
@@ -705,13 +1242,7 @@ def nm_disconnect_device(name):
 
        :raise UnknownDeviceError: if device is not found
     """
-    proxy = _get_proxy()
-    try:
-        device = proxy.GetDeviceByIpIface('(s)', name)
-    except GLib.GError as e:
-        if "org.freedesktop.NetworkManager.UnknownDevice" in e.message:
-            raise UnknownDeviceError(name, e)
-        raise
+    device = _get_device_path(name)
 
     device_proxy = _get_proxy(object_path=device, interface_name="org.freedesktop.NetworkManager.Device")
     try:
@@ -738,13 +1269,7 @@ def nm_activate_device_connection(dev_name, con_uuid):
         # virtual devices (eg bond, vlan)
         device_path = "/"
     else:
-        proxy = _get_proxy()
-        try:
-            device_path = proxy.GetDeviceByIpIface('(s)', dev_name)
-        except Exception as e:
-            if "org.freedesktop.NetworkManager.UnknownDevice" in e.message:
-                raise UnknownDeviceError(dev_name, e)
-            raise
+        device_path = _get_device_path(dev_name)
 
     con_paths = _find_settings(con_uuid, 'connection', 'uuid')
     if not con_paths:
@@ -784,6 +1309,7 @@ def nm_add_connection(values):
     proxy = _get_proxy(object_path="/org/freedesktop/NetworkManager/Settings",
                        interface_name="org.freedesktop.NetworkManager.Settings")
     connection = proxy.AddConnection('(a{sa{sv}})', settings)
+    _invalidate_settings()
     return connection
 
 def nm_delete_connection(uuid):
@@ -800,6 +1326,8 @@ def nm_delete_connection(uuid):
         return False
     proxy = _get_proxy(object_path=settings_paths[0], interface_name="org.freedesktop.NetworkManager.Settings.Connection")
     proxy.Delete()
+    _invalidate_settings(settings_paths[0])
+    _invalidate_settings()
 
 def nm_update_settings_of_device(name, new_values):
     """Update setting of device.
@@ -870,6 +1398,7 @@ def _update_settings(settings_path, new_values):
         new_settings = _gvariant_settings(settings, key1, key2, value, default_type_str)
 
     proxy.Update(settings.get_type_string(), new_settings)
+    _invalidate_settings(settings_path)
 
 def _gvariant_settings(settings, updated_key1, updated_key2, value, default_type_str=None):
     """Update setting of updated_key1, updated_key2 of settings object with value.
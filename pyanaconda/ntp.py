@@ -25,25 +25,228 @@ Module facilitating the work with NTP servers and NTP daemon's configuration
 
 import re
 import os
+import time
+import errno
+import select
 import tempfile
 import shutil
 import ntplib
 import socket
+import threading
+from collections import namedtuple
+from Queue import Queue, Empty
 
 from pyanaconda import isys
 from pyanaconda.threads import threadMgr, AnacondaThread
 from pyanaconda.constants import THREAD_SYNC_TIME_BASENAME
 
+import logging
+log = logging.getLogger("anaconda")
+
 NTP_CONFIG_FILE = "/etc/chrony.conf"
 
 #example line:
 #server 0.fedora.pool.ntp.org iburst
 SRV_LINE_REGEXP = re.compile(r"^\s*server\s*([-a-zA-Z.0-9]+)\s*[a-zA-Z]+\s*$")
 
+NTP_PORT = 123
+NTP_VERSION = 3
+#seconds all the servers probed together have to answer in
+NTP_PROBE_TIMEOUT = 5
+#maximum number of server names resolved at the same time
+NTP_RESOLVER_THREADS = 8
+
+#offset and delay are in seconds, distance is the root distance of the
+#server's clock (half the delay to the reference clock plus its dispersion)
+NTPMeasurement = namedtuple("NTPMeasurement",
+                            ["server", "address", "offset", "delay",
+                             "stratum", "distance"])
+
 class NTPconfigError(Exception):
     """Exception class for NTP related problems"""
     pass
 
+def _resolve_servers(servers, results):
+    """
+    Resolve the names of the servers in a few daemon threads. For every
+    server a (server, addresses) tuple is put to the results queue, where
+    addresses is a list of (family, sockaddr) tuples (empty if the name
+    couldn't be resolved).
+
+    """
+
+    names = Queue()
+    for server in servers:
+        names.put(server)
+
+    def resolve():
+        while True:
+            try:
+                server = names.get_nowait()
+            except Empty:
+                return
+
+            try:
+                infos = socket.getaddrinfo(server, NTP_PORT, 0, socket.SOCK_DGRAM)
+                addresses = [(info[0], info[4]) for info in infos
+                             if info[0] in (socket.AF_INET, socket.AF_INET6)]
+            except socket.error as err:
+                log.debug("cannot resolve NTP server %s: %s", server, err)
+                addresses = []
+
+            results.put((server, addresses))
+
+    for i in range(min(NTP_RESOLVER_THREADS, len(servers))):
+        thread = threading.Thread(name="AnaNTPResolver%d" % (i + 1), target=resolve)
+        thread.daemon = True
+        thread.start()
+
+def _measurement(server, address, stats):
+    distance = stats.delay / 2 + stats.root_delay / 2 + stats.root_dispersion
+    return NTPMeasurement(server, address, stats.offset, stats.delay,
+                          stats.stratum, distance)
+
+def probe_servers(servers, timeout=NTP_PROBE_TIMEOUT):
+    """
+    Query all the given NTP servers at once. The names are resolved
+    concurrently and every query is sent as soon as its server's address is
+    known, from one UDP socket per address family. Replies are collected
+    until all the servers answered or the timeout runs out, so this takes
+    at most $timeout seconds however many servers there are.
+
+    :param servers: hostnames or IP addresses of NTP servers
+    :type servers: iterable of strings
+    :param timeout: seconds to wait for the replies
+    :type timeout: float
+    :return: measurement for every server, None if the server didn't reply
+    :rtype: dict of server -> NTPMeasurement or None
+
+    """
+
+    servers = list(set(servers))
+    measurements = dict((server, None) for server in servers)
+    if not servers:
+        return measurements
+
+    deadline = time.time() + timeout
+    resolved = Queue()
+    _resolve_servers(servers, resolved)
+    unresolved = len(servers)
+
+    sockets = dict()
+    #(family, host, port, transmit timestamp of the query) -> servers, more
+    #names may resolve to the same address
+    queries = dict()
+    #servers that still may reply
+    waiting = set(servers)
+
+    try:
+        while waiting and time.time() < deadline:
+            #send the queries for the names resolved meanwhile
+            while unresolved:
+                try:
+                    (server, addresses) = resolved.get_nowait()
+                except Empty:
+                    break
+
+                unresolved -= 1
+                for (family, sockaddr) in addresses:
+                    if family not in sockets:
+                        try:
+                            sock = socket.socket(family, socket.SOCK_DGRAM)
+                        except socket.error as err:
+                            log.debug("cannot create NTP socket: %s", err)
+                            continue
+                        sock.setblocking(False)
+                        sockets[family] = sock
+
+                    query = ntplib.NTPPacket(mode=3, version=NTP_VERSION,
+                                tx_timestamp=ntplib.system_to_ntp_time(time.time()))
+                    data = query.to_data()
+                    try:
+                        sockets[family].sendto(data, sockaddr)
+                    except socket.error as err:
+                        log.debug("cannot query NTP server %s at %s: %s",
+                                  server, sockaddr[0], err)
+                        continue
+                    key = (family,) + sockaddr[:2] + (data[40:48],)
+                    queries.setdefault(key, set()).add(server)
+
+                if not any(server in names for names in queries.values()):
+                    waiting.discard(server)
+
+            if unresolved:
+                #check the resolver again soon
+                wait = min(0.05, deadline - time.time())
+            else:
+                if not queries:
+                    break
+                wait = deadline - time.time()
+
+            try:
+                (readable, _w, _x) = select.select(sockets.values(), [], [], max(wait, 0))
+            except select.error as err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for sock in readable:
+                try:
+                    (data, sockaddr) = sock.recvfrom(256)
+                except socket.error as err:
+                    #e.g. ICMP port unreachable from a previous query
+                    log.debug("NTP socket error: %s", err)
+                    continue
+
+                dest_timestamp = ntplib.system_to_ntp_time(time.time())
+                #the originate timestamp of the reply has to be one of ours
+                key = (sock.family,) + sockaddr[:2] + (data[24:32],)
+                if key not in queries:
+                    continue
+
+                stats = ntplib.NTPStats()
+                try:
+                    stats.from_data(data)
+                except ntplib.NTPException:
+                    continue
+                stats.dest_timestamp = dest_timestamp
+
+                for server in queries.pop(key) & waiting:
+                    waiting.discard(server)
+                    measurements[server] = _measurement(server, sockaddr[0], stats)
+    finally:
+        for sock in sockets.values():
+            sock.close()
+
+    for (server, measurement) in sorted(measurements.items()):
+        if measurement:
+            log.debug("NTP server %s (%s): offset %.3fs, delay %.3fs, stratum %d",
+                      server, measurement.address, measurement.offset,
+                      measurement.delay, measurement.stratum)
+        else:
+            log.debug("NTP server %s didn't reply", server)
+
+    return measurements
+
+def best_measurement(measurements):
+    """
+    Pick the measurement of the server whose time is most trustworthy, the
+    one with the lowest root distance. Servers that are not synchronized
+    themselves are never picked.
+
+    :param measurements: measurements as returned by probe_servers
+    :type measurements: iterable of NTPMeasurement or None
+    :return: the best measurement or None if there's none usable
+    :rtype: NTPMeasurement
+
+    """
+
+    usable = [m for m in measurements if m and 0 < m.stratum < 16]
+    if not usable:
+        return None
+
+    return min(usable, key=lambda m: (m.distance, m.stratum))
+
 def ntp_server_working(server):
     """
     Tries to do an NTP request to the $server (timeout may take some time).
@@ -55,21 +258,7 @@ def ntp_server_working(server):
 
     """
 
-    client = ntplib.NTPClient()
-
-    try:
-        client.request(server)
-    except ntplib.NTPException:
-        return False
-    # address related error
-    except socket.gaierror:
-        return False
-    # socket related error
-    # (including "Network is unreachable")
-    except socket.error:
-        return False
-
-    return True
+    return probe_servers([server])[server] is not None
 
 def get_servers_from_config(conf_file_path=NTP_CONFIG_FILE,
                             srv_regexp=SRV_LINE_REGEXP):
@@ -166,27 +355,31 @@ def save_servers_to_config(servers, conf_file_path=NTP_CONFIG_FILE,
 
             raise NTPconfigError(msg)
 
-def one_time_sync(server, callback=None):
+def one_time_sync(servers, callback=None):
     """
-    Synchronize the system time with a given NTP server. Note that this
-    function is blocking and will not return until the time gets synced or
-    querying server fails (may take some time before timeouting).
+    Synchronize the system time with the best of the given NTP servers. All
+    the servers are probed at once and the time is taken from the one with
+    the lowest root distance. Note that this function is blocking and will
+    not return until the time gets synced or the probe times out.
 
-    :param server: NTP server
+    :param servers: NTP server or servers
+    :type servers: string or list of strings
     :param callback: callback function to run after sync or failure
     :type callback: a function taking one boolean argument (success)
     :return: True if the sync was successful, False otherwise
 
     """
 
-    client = ntplib.NTPClient()
-    try:
-        results = client.request(server)
-        isys.set_system_time(int(results.tx_time))
+    if isinstance(servers, basestring):
+        servers = [servers]
+
+    best = best_measurement(probe_servers(servers).values())
+    if best is not None:
+        log.info("syncing time with NTP server %s (offset %.3fs)",
+                 best.server, best.offset)
+        isys.set_system_time(int(time.time() + best.offset))
         success = True
-    except ntplib.NTPException:
-        success = False
-    except socket.gaierror:
+    else:
         success = False
 
     if callback is not None:
@@ -194,23 +387,23 @@ def one_time_sync(server, callback=None):
 
     return success
 
-def one_time_sync_async(server, callback=None):
+def one_time_sync_async(servers, callback=None):
     """
-    Asynchronously synchronize the system time with a given NTP server. This
-    function is non-blocking it starts a new thread for synchronization and
-    returns. Use callback argument to specify the function called when the
-    new thread finishes if needed.
+    Asynchronously synchronize the system time with the best of the given
+    NTP servers. This function is non-blocking it starts a new thread for
+    synchronization and returns. Use callback argument to specify the
+    function called when the new thread finishes if needed.
 
-    :param server: NTP server
+    :param servers: NTP server or servers
+    :type servers: string or list of strings
     :param callback: callback function to run after sync or failure
     :type callback: a function taking one boolean argument (success)
 
     """
 
-    thread_name = "%s_%s" % (THREAD_SYNC_TIME_BASENAME, server)
-    if threadMgr.get(thread_name):
-        #syncing with the same server running
+    if threadMgr.get(THREAD_SYNC_TIME_BASENAME):
+        #syncing running
         return
 
-    threadMgr.add(AnacondaThread(name=thread_name, target=one_time_sync,
-                                 args=(server, callback)))
+    threadMgr.add(AnacondaThread(name=THREAD_SYNC_TIME_BASENAME, target=one_time_sync,
+                                 args=(servers, callback)))
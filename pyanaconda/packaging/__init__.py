@@ -29,9 +29,6 @@
 """
 
 import os, sys
-from urlgrabber.grabber import URLGrabber
-from urlgrabber.grabber import URLGrabError
-import ConfigParser
 import shutil
 import time
 
@@ -48,6 +45,8 @@ from pyanaconda.image import findFirstIsoImage
 from pyanaconda.image import mountImage
 from pyanaconda.image import opticalInstallMedia
 from pyanaconda.iutil import ProxyString, ProxyStringError
+from pyanaconda.packaging.initrd import build_initrds, record_built_initrds
+from pyanaconda.packaging.treeinfo import treeinfo_cache
 
 from pykickstart.parser import Group
 
@@ -114,6 +113,8 @@ class Payload(object):
         self.storage = None
         self._kernelVersionList = []
         self._createdInitrds = False
+        # InitrdRecords of the initramfs images built so far, by kernel
+        self._initrdRecords = {}
         self.txID = None
 
     def setup(self, storage):
@@ -193,6 +194,11 @@ class Payload(object):
     def needsNetwork(self):
         return any(self._repoNeedsNetwork(r) for r in self.data.repo.dataList())
 
+    @property
+    def needsStorage(self):
+        """ Does setup need the storage devices to be discovered first? """
+        return True
+
     def _resetMethod(self):
         self.data.method.method = ""
         self.data.method.url = None
@@ -353,7 +359,10 @@ class Payload(object):
     ## METHODS FOR TREE VERIFICATION
     ##
     def _getTreeInfo(self, url, proxy_url, sslverify):
-        """ Retrieve treeinfo and return the path to the local file.
+        """ Retrieve and parse the treeinfo of a tree.
+
+            The treeinfo comes from the cache shared by all the payloads and
+            is only downloaded again if it changed on the server.
 
             :param baseurl: url of the repo
             :type baseurl: string
@@ -361,8 +370,8 @@ class Payload(object):
             :type proxy_url: string
             :param sslverify: True if SSL certificate should be varified
             :type sslverify: bool
-            :returns: Path to retrieved .treeinfo file or None
-            :rtype: string or None
+            :returns: the treeinfo or None
+            :rtype: TreeInfo or None
         """
         if not url:
             return None
@@ -370,9 +379,6 @@ class Payload(object):
         log.debug("retrieving treeinfo from %s (proxy: %s ; sslverify: %s)",
                   url, proxy_url, sslverify)
 
-        ugopts = {"ssl_verify_peer": sslverify,
-                  "ssl_verify_host": sslverify}
-
         proxies = {}
         if proxy_url:
             try:
@@ -383,21 +389,7 @@ class Payload(object):
                 log.info("Failed to parse proxy for _getTreeInfo %s: %s",
                          proxy_url, e)
 
-        ug = URLGrabber()
-        try:
-            treeinfo = ug.urlgrab("%s/.treeinfo" % url,
-                                  "/tmp/.treeinfo", copy_local=True,
-                                  proxies=proxies, **ugopts)
-        except URLGrabError as e:
-            try:
-                treeinfo = ug.urlgrab("%s/treeinfo" % url,
-                                      "/tmp/.treeinfo", copy_local=True,
-                                      proxies=proxies, **ugopts)
-            except URLGrabError as e:
-                log.info("Error downloading treeinfo: %s", e)
-                treeinfo = None
-
-        return treeinfo
+        return treeinfo_cache.get(url, proxies, sslverify)
 
     def _getReleaseVersion(self, url):
         """ Return the release version of the tree at the specified URL. """
@@ -410,14 +402,9 @@ class Payload(object):
         else:
             proxy = None
         treeinfo = self._getTreeInfo(url, proxy, not flags.noverifyssl)
-        if treeinfo:
-            c = ConfigParser.ConfigParser()
-            c.read(treeinfo)
-            try:
-                # Trim off any -Alpha or -Beta
-                version = c.get("general", "version").split("-")[0]
-            except ConfigParser.Error:
-                pass
+        if treeinfo and treeinfo.version:
+            # Trim off any -Alpha or -Beta
+            version = treeinfo.version.split("-")[0]
 
         if version.startswith(time.strftime("%Y")):
             version = "rawhide"
@@ -526,37 +513,43 @@ class Payload(object):
                 #           prevent boot on some systems
 
     def recreateInitrds(self, force=False):
-        """ Recreate the initrds by calling new-kernel-pkg
+        """ Recreate the initrds by calling dracut
 
             This needs to be done after all configuration files have been
-            written, since dracut depends on some of them.
+            written, since dracut depends on some of them.  Images whose
+            inputs didn't change since they were built are kept.
 
-            :param force: Always recreate, default is to only do it on first call
+            :param force: Always check the images, default is to only do it
+                          on first call
             :type force: bool
             :returns: None
         """
         if not force and self._createdInitrds:
             return
 
-        for kernel in self.kernelVersionList:
-            log.info("recreating initrd for %s", kernel)
-            if not flags.imageInstall:
-                iutil.execWithRedirect("new-kernel-pkg",
-                                       ["--mkinitrd", "--dracut",
-                                        "--depmod", "--update", kernel],
-                                       root=ROOT_PATH)
-            else:
-                # hostonly is not sensible for disk image installations
-                # using /dev/disk/by-uuid/ is necessary due to disk image naming
-                iutil.execWithRedirect("dracut",
-                                       ["-N",
-                                        "--persistent-policy", "by-uuid",
-                                        "-f", "/boot/initramfs-%s.img" % kernel,
-                                        kernel],
-                                        root=ROOT_PATH)
-
+        build_initrds(self.kernelVersionList, image_install=flags.imageInstall,
+                      root=ROOT_PATH, records=self._initrdRecords)
         self._createdInitrds = True
 
+    def _recordInitrds(self, since):
+        """ Remember the initramfs images built while installing the payload,
+            so recreateInitrds only builds them again if their inputs changed.
+
+            :param since: time.time() before the payload was installed
+            :type since: float
+        """
+        if flags.imageInstall:
+            # the packages build hostonly images, image installs need generic ones
+            return
+
+        if os.path.exists(DD_ALL):
+            # the driver disk files are copied to the system after the images
+            # were built and aren't part of their fingerprints
+            return
+
+        record_built_initrds(self._initrdRecords, self.kernelVersionList, since,
+                             root=ROOT_PATH)
+
 
     def _setDefaultBootTarget(self):
         """ Set the default systemd target for the system. """
@@ -644,6 +637,13 @@ class PackagePayload(Payload):
         super(PackagePayload, self).__init__(data)
         self.install_device = None
 
+    @property
+    def needsStorage(self):
+        # Network sources are set up without looking at the devices, the
+        # others (and no method at all) may be on a disk, an ISO on a disk or
+        # an optical drive.
+        return self.data.method.method not in ("url", "nfs")
+
     @property
     def kernelPackages(self):
         kernels = ["kernel"]
@@ -878,44 +878,110 @@ class PackagePayload(Payload):
     ### METHODS FOR WORKING WITH ENVIRONMENTS
     ###
     @property
-    def environments(self):
+    def compsCatalog(self):
+        """ CompsCatalog of the enabled repos or None if there is no comps
+            information available.
+        """
         raise NotImplementedError()
 
+    def _getEnvironment(self, environmentid):
+        """ Return the CompsEnvironment for the id or None if there is no
+            comps information available.
+        """
+        catalog = self.compsCatalog
+        if not catalog:
+            return None
+
+        environment = catalog.environment(environmentid)
+        if environment is None:
+            raise NoSuchGroup(environmentid)
+        return environment
+
+    @property
+    def environments(self):
+        """ List of environment ids. """
+        catalog = self.compsCatalog
+        if not catalog:
+            return []
+        return list(catalog.environment_ids)
+
     def environmentHasOption(self, environmentid, grpid):
-        raise NotImplementedError()
+        if not self._getEnvironment(environmentid):
+            return False
+        return self.compsCatalog.environmentHasOption(environmentid, grpid)
 
     def environmentOptionIsDefault(self, environmentid, grpid):
-        raise NotImplementedError()
+        environment = self._getEnvironment(environmentid)
+        if not environment:
+            return False
+        return grpid in environment.default_options
 
     def environmentDescription(self, environmentid):
-        raise NotImplementedError()
+        """ Return name/description tuple for the environment specified by id. """
+        environment = self._getEnvironment(environmentid)
+        if not environment:
+            return (environmentid, environmentid)
+        return (environment.name, environment.description)
 
     def selectEnvironment(self, environmentid):
         raise NotImplementedError()
 
     def environmentGroups(self, environmentid):
-        raise NotImplementedError()
+        environment = self._getEnvironment(environmentid)
+        if not environment:
+            return []
+        return list(environment.groups + environment.options)
 
     ###
     ### METHODS FOR WORKING WITH GROUPS
     ###
     @property
     def groups(self):
-        raise NotImplementedError()
+        """ List of group ids. """
+        catalog = self.compsCatalog
+        if not catalog:
+            return []
+        return list(catalog.group_ids)
 
     def groupDescription(self, groupid):
-        raise NotImplementedError()
+        """ Return name/description tuple for the group specified by id. """
+        catalog = self.compsCatalog
+        if not catalog:
+            return (groupid, groupid)
 
+        group = catalog.group(groupid)
+        if group is None:
+            raise NoSuchGroup(groupid)
+        return (group.name, group.description)
 
-def payloadInitialize(storage, ksdata, payload):
-    from pyanaconda.threads import threadMgr
+    def _isGroupVisible(self, groupid):
+        catalog = self.compsCatalog
+        group = catalog and catalog.group(groupid)
+        return bool(group and group.visible)
+
+    def _groupHasInstallableMembers(self, groupid):
+        catalog = self.compsCatalog
+        group = catalog and catalog.group(groupid)
+        return bool(group and group.installable)
 
-    threadMgr.wait(THREAD_STORAGE)
 
+def payloadDependencies(payload):
+    """ Return the names of the threads payloadInitialize has to wait for.
+
+        The payload thread is to be added with these as its depends_on, so
+        the setup of a network source runs while the storage is discovered.
+    """
     # FIXME: condition for cases where we don't want network
     # (set and use payload.needsNetwork ?)
-    threadMgr.wait(THREAD_WAIT_FOR_CONNECTING_NM)
+    dependencies = [THREAD_WAIT_FOR_CONNECTING_NM]
+    if payload.needsStorage:
+        dependencies.insert(0, THREAD_STORAGE)
+    return dependencies
 
+def payloadInitialize(storage, ksdata, payload):
+    """ Set up the payload.  Run in a thread depending on the threads
+        returned by payloadDependencies.
+    """
     payload.setup(storage)
 
 def show_groups(payload):
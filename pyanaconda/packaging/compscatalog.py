@@ -0,0 +1,77 @@
+# compscatalog.py
+# Read-only index of the environments and groups of the enabled repos.
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+"""
+    The payloads build a CompsCatalog from their backend's comps objects once
+    every time the metadata changes.  The catalog is never modified after it
+    is created, so the UI can query it without taking the backend's locks.
+"""
+
+from collections import namedtuple
+
+# groups and options are tuples of group ids in the order of the comps file,
+# default_options is a frozenset of group ids
+CompsEnvironment = namedtuple("CompsEnvironment",
+                              ["id", "name", "description", "groups",
+                               "options", "default_options"])
+
+# installable is True if the group has any mandatory or default packages,
+# langonly is the locale the group is meant for or None
+CompsGroup = namedtuple("CompsGroup",
+                        ["id", "name", "description", "visible",
+                         "installable", "langonly"])
+
+class CompsCatalog(object):
+    """ Environments and groups indexed by their ids. """
+    def __init__(self, environments, groups):
+        """ :param environments: the environments in the order they should
+                                 be presented in
+            :type environments: iterable of CompsEnvironment
+            :param groups: the groups in the order they should be presented in
+            :type groups: iterable of CompsGroup
+        """
+        environments = tuple(environments)
+        groups = tuple(groups)
+
+        self._environments = dict((env.id, env) for env in environments)
+        self._groups = dict((grp.id, grp) for grp in groups)
+        self._options = dict((env.id, frozenset(env.options)) for env in environments)
+
+        self.environment_ids = tuple(env.id for env in environments)
+        self.group_ids = tuple(grp.id for grp in groups)
+
+    def environment(self, environmentid):
+        """ Return the CompsEnvironment with the given id or None. """
+        return self._environments.get(environmentid)
+
+    def group(self, groupid):
+        """ Return the CompsGroup with the given id or None. """
+        return self._groups.get(groupid)
+
+    def groups(self):
+        """ Return all the CompsGroups. """
+        return self._groups.values()
+
+    def environmentHasOption(self, environmentid, groupid):
+        """ Return whether the group is an option of the environment.
+
+            The environment has to exist.
+        """
+        return groupid in self._options[environmentid]
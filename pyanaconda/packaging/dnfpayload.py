@@ -23,21 +23,25 @@
 from blivet.size import Size
 from pyanaconda.flags import flags
 from pyanaconda.i18n import _
-from pyanaconda.progress import progressQ
+from pyanaconda.packaging.compscatalog import CompsCatalog, CompsEnvironment, CompsGroup
+from pyanaconda.progress import progressQ, ProgressRate
 
-import itertools
+import errno
 import logging
 import multiprocessing
+import os
 import pyanaconda.constants as constants
 import pyanaconda.errors as errors
 import pyanaconda.packaging as packaging
 import sys
 import time
+from Queue import Empty
 
 log = logging.getLogger("packaging")
 
 try:
     import dnf
+    import dnf.callback
     import dnf.exceptions
     import dnf.repo
     import dnf.output
@@ -54,16 +58,108 @@ REPO_DIRS = ['/etc/yum.repos.d',
              '/tmp/updates/anaconda.repos.d',
              '/tmp/product/anaconda.repos.d']
 
+# At most this many bytes of packages are downloaded ahead of the transaction
+# when downloading and installing is pipelined (inst.dnfpipeline).  The
+# packages are split into batches of half of this size, one is being
+# installed while the next one is being downloaded.
+DNF_STAGING_SIZE = 1024 * 1024 * 1024
+DNF_STAGING_BATCHES = 2
+
+# number of connections packages are downloaded over at the same time
+DNF_DOWNLOAD_CONNECTIONS = 8
+# how many times a failed download is restarted
+DNF_DOWNLOAD_RETRIES = 3
+# seconds between two download progress messages
+DNF_DOWNLOAD_PROGRESS_INTERVAL = 1.0
+# seconds to wait for a message of a child process before checking it still runs
+DNF_EVENT_TIMEOUT = 5
+
 def _failure_limbo():
     progressQ.send_quit(1)
     while True:
         time.sleep(10000)
 
+class PayloadDownloadProgress(dnf.callback.DownloadProgress):
+    """ Report the number of downloaded packages and bytes and the download
+        speed about once a second.
+    """
+    def __init__(self, report):
+        """ :param report: function the progress messages are passed to
+            :type report: str -> None
+        """
+        super(PayloadDownloadProgress, self).__init__()
+        self._report = report
+        self._rate = None
+        self._downloaded = {}
+        self._total_files = 0
+        self._done_files = 0
+        self._last_report = 0
+
+    def start(self, total_files, total_size):
+        self._rate = ProgressRate(total_size)
+        self._downloaded = {}
+        self._total_files = total_files
+        self._done_files = 0
+        self._send(force=True)
+
+    def progress(self, payload, done):
+        self._downloaded[payload] = done
+        self._send()
+
+    def end(self, payload, status, msg):
+        if status == dnf.callback.STATUS_MIRROR:
+            log.info("download of %s failed on a mirror, trying the next one: %s",
+                     payload, msg)
+            return
+        elif status == dnf.callback.STATUS_FAILED:
+            log.error("download of %s failed: %s", payload, msg)
+            return
+
+        self._downloaded[payload] = payload.download_size
+        self._done_files += 1
+        self._send(force=self._done_files == self._total_files)
+
+    def _send(self, force=False):
+        now = time.time()
+        if not force and now - self._last_report < DNF_DOWNLOAD_PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+
+        self._rate.update(sum(self._downloaded.itervalues()))
+        msg = _("Downloading packages (%(done)d/%(total)d, %(size)s of %(total_size)s, %(rate)s/s)") % \
+              {"done": self._done_files, "total": self._total_files,
+               "size": Size(self._rate.done), "total_size": Size(self._rate.total),
+               "rate": Size(int(self._rate.rate))}
+        self._report(msg)
+
+def _download_packages(base, packages, progress=None):
+    """ Download the packages, restarting the download if it fails.
+
+        librepo already fails over to the other mirrors of a repo, the
+        restart helps with errors all the mirrors ran into.  The packages
+        downloaded before are not downloaded again.
+    """
+    for attempt in range(1, DNF_DOWNLOAD_RETRIES + 1):
+        try:
+            base.download_packages(packages, progress)
+            return
+        except dnf.exceptions.DownloadError as e:
+            if attempt == DNF_DOWNLOAD_RETRIES:
+                raise
+            log.warning("downloading packages failed (attempt %d of %d): %s",
+                        attempt, DNF_DOWNLOAD_RETRIES, e)
+
 class PayloadRPMDisplay(dnf.output.LoggingTransactionDisplay):
-    def __init__(self, queue):
+    def __init__(self, queue, offset=0, total=None):
+        """ :param offset: number of packages installed by previous transactions
+            :param total: number of packages installed by all the transactions,
+                          defaults to the size of this transaction
+        """
         super(PayloadRPMDisplay, self).__init__()
         self._queue = queue
         self._last_ts = None
+        self._offset = offset
+        self._total = total
         self.cnt = 0
 
     def event(self, package, action, te_current, te_total, ts_current, ts_total):
@@ -74,12 +170,32 @@ class PayloadRPMDisplay(dnf.output.LoggingTransactionDisplay):
             self._last_ts = ts_current
 
             msg = '%s.%s (%d/%d)' % \
-                (package.name, package.arch, ts_current, ts_total)
+                (package.name, package.arch, self._offset + ts_current,
+                 self._total or ts_total)
             self.cnt += 1
             self._queue.put(('install', msg))
         elif action == self.TRANS_POST:
             self._queue.put(('post', None))
 
+def _next_event(queue, process):
+    """ Return the next (token, msg) message of the queue.
+
+        If the process the message is expected from exits without posting
+        one, a ('quit', reason) message is returned instead of waiting forever.
+    """
+    while True:
+        try:
+            return queue.get(timeout=DNF_EVENT_TIMEOUT)
+        except Empty:
+            if not process.is_alive():
+                break
+
+    # what it posted right before exiting may still be on the way
+    try:
+        return queue.get(timeout=1)
+    except Empty:
+        return ('quit', "%s exited with code %s" % (process.name, process.exitcode))
+
 def do_transaction(base, queue):
     try:
         display = PayloadRPMDisplay(queue)
@@ -89,6 +205,155 @@ def do_transaction(base, queue):
         log.info(e)
         queue.put(('quit', str(e)))
 
+def _remove_downloaded(packages):
+    """ Remove the packages downloaded to the cache. """
+    for pkg in packages:
+        path = pkg.localPkg()
+        if not path.startswith(DNF_CACHE_DIR):
+            continue
+        try:
+            os.unlink(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                log.warning("failed to remove %s: %s", path, e)
+
+def do_batch_transaction(base, nevras, offset, total, queue):
+    """ Install a batch of the pipelined installation.
+
+        The packages the batch needs are either in it or were installed by
+        the previous batches, so the goal is resolved against the target's
+        rpmdb.
+    """
+    try:
+        base.reset(sack=True, goal=True)
+        base.fill_sack(load_system_repo=True)
+        for nevra in nevras:
+            pkgs = base.sack.query().filter(nevra=nevra).run()
+            if not pkgs:
+                raise packaging.NoSuchPackage(nevra)
+            base.package_install(pkgs[0])
+        base.resolve()
+
+        # the solver may have picked something that wasn't downloaded yet,
+        # that is downloaded here, outside of the staging limit
+        install_set = base.transaction.install_set
+        extra = len(set(str(pkg) for pkg in install_set) - set(nevras))
+        if extra:
+            log.warning("the batch needs %d packages that are not in it", extra)
+        _download_packages(base, install_set)
+
+        display = PayloadRPMDisplay(queue, offset, total)
+        base.do_transaction(display=display)
+        _remove_downloaded(install_set)
+        queue.put(('done', None))
+    except BaseException as e:
+        log.error('The transaction process has ended abruptly')
+        log.info(e)
+        queue.put(('quit', str(e)))
+
+def download_batches(base, batches, events, slots):
+    """ Download the batches in order.
+
+        A slot of the staging area is taken before a batch is downloaded, the
+        installation gives it back when the batch is installed.  The index
+        of every downloaded batch and the download progress messages are put
+        to the events queue, the transactions of the batches put their
+        messages there as well.
+    """
+    progress = PayloadDownloadProgress(lambda msg: events.put(('download', msg)))
+    try:
+        for (index, batch) in enumerate(batches):
+            slots.acquire()
+            _download_packages(base, batch, progress)
+            events.put(('ready', index))
+    except BaseException as e:
+        log.error('Downloading packages failed: %s', e)
+        events.put(('download_failed', str(e)))
+
+def _install_order(sack, packages):
+    """ Return the packages split into groups in the order they can be
+        installed in.
+
+        Every group only requires packages from itself and from the groups
+        before it.  Packages requiring each other end up in the same group.
+        This is Tarjan's algorithm for strongly connected components, which
+        finds them dependencies first.
+    """
+    install_query = sack.query().filter(pkg=packages)
+    requires = {}
+    for pkg in packages:
+        deps = set()
+        for reldep in pkg.requires:
+            if str(reldep).startswith("rpmlib("):
+                continue
+            deps.update(install_query.filter(provides=reldep).run())
+        deps.discard(pkg)
+        requires[pkg] = list(deps)
+
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in packages:
+        if root in index:
+            continue
+
+        # iterative DFS, every frame is a package and the iterator of its deps
+        work = [(root, iter(requires[root]))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            (pkg, deps) = work[-1]
+            for dep in deps:
+                if dep not in index:
+                    index[dep] = lowlink[dep] = len(index)
+                    stack.append(dep)
+                    on_stack.add(dep)
+                    work.append((dep, iter(requires[dep])))
+                    break
+                elif dep in on_stack:
+                    lowlink[pkg] = min(lowlink[pkg], index[dep])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[pkg])
+
+                if lowlink[pkg] == index[pkg]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == pkg:
+                            break
+                    components.append(component)
+
+    return components
+
+def _split_batches(components, batch_size):
+    """ Join the ordered groups of packages into batches of about batch_size
+        bytes to download.
+    """
+    batches = []
+    batch = []
+    size = 0
+    for component in components:
+        batch.extend(component)
+        size += sum(pkg.downloadsize for pkg in component
+                    if not os.path.exists(pkg.localPkg()))
+        if size >= batch_size:
+            batches.append(batch)
+            batch = []
+            size = 0
+
+    if batch:
+        batches.append(batch)
+    return batches
+
 class DNFPayload(packaging.PackagePayload):
     def __init__(self, data):
         packaging.PackagePayload.__init__(self, data)
@@ -96,6 +361,7 @@ class DNFPayload(packaging.PackagePayload):
             raise packaging.PayloadError("unsupported payload type")
 
         self._base = None
+        self._comps_catalog = None
         self._required_groups = []
         self._required_pkgs = []
         self._configure()
@@ -143,6 +409,26 @@ class DNFPayload(packaging.PackagePayload):
             self.txID += 1
         return self.txID
 
+    def _build_comps_catalog(self):
+        comps = self._base.comps
+        if comps is None:
+            return None
+
+        environments = []
+        for env in comps.environments_iter():
+            options = tuple(id_.name for id_ in env.option_ids)
+            defaults = frozenset(id_.name for id_ in env.option_ids if id_.default)
+            environments.append(CompsEnvironment(env.id, env.ui_name, env.ui_description,
+                                                 tuple(id_.name for id_ in env.group_ids),
+                                                 options, defaults))
+
+        groups = [CompsGroup(grp.id, grp.ui_name, grp.ui_description, grp.visible,
+                             bool(grp.mandatory_packages or grp.default_packages),
+                             grp.lang_only)
+                  for grp in comps.groups_iter()]
+
+        return CompsCatalog(environments, groups)
+
     def _configure(self):
         self._base = dnf.Base()
         conf = self._base.conf
@@ -163,6 +449,18 @@ class DNFPayload(packaging.PackagePayload):
 
         conf.reposdir = REPO_DIRS
 
+        # librepo spreads the downloads over the mirrors, keeps the
+        # connections open and fails over to the next mirror by itself
+        try:
+            connections = int(flags.cmdline.get("dnfconnections",
+                                                DNF_DOWNLOAD_CONNECTIONS))
+        except ValueError:
+            connections = DNF_DOWNLOAD_CONNECTIONS
+        if hasattr(conf, "max_parallel_downloads"):
+            conf.max_parallel_downloads = max(1, connections)
+        else:
+            log.info("dnf can't limit parallel downloads, using its default")
+
     def _install_package(self, pkg_name):
         try:
             return self._base.install(pkg_name)
@@ -227,14 +525,10 @@ class DNFPayload(packaging.PackagePayload):
         return None
 
     @property
-    def environments(self):
-        environments = self._base.comps.environments_iter()
-        return [env.id for env in environments]
-
-    @property
-    def groups(self):
-        groups = self._base.comps.groups_iter()
-        return [g.id for g in groups]
+    def compsCatalog(self):
+        if self._comps_catalog is None:
+            self._comps_catalog = self._build_comps_catalog()
+        return self._comps_catalog
 
     @property
     def mirrorEnabled(self):
@@ -257,15 +551,6 @@ class DNFPayload(packaging.PackagePayload):
         size *= 1.35
         return Size(size)
 
-    def _isGroupVisible(self, grpid):
-        grp = self._base.comps.group_by_pattern(grpid)
-        if grp is None:
-            raise packaging.NoSuchGroup(grpid)
-        return grp.visible
-
-    def _groupHasInstallableMembers(self, grpid):
-        return True
-
     def checkSoftwareSelection(self):
         log.info("checking software selection")
         self._bump_tx_id()
@@ -301,45 +586,14 @@ class DNFPayload(packaging.PackagePayload):
             pass
         super(DNFPayload, self).enableRepo(repo_id)
 
-    def environmentDescription(self, environmentid):
-        env = self._base.comps.environment_by_pattern(environmentid)
-        if env is None:
-            raise packaging.NoSuchGroup(environmentid)
-        return (env.ui_name, env.ui_description)
-
-    def environmentGroups(self, environmentid):
-        env = self._base.comps.environment_by_pattern(environmentid)
-        if env is None:
-            raise packaging.NoSuchGroup(environmentid)
-        group_ids = (id_.name for id_ in env.group_ids)
-        option_ids = (id_.name for id_ in env.option_ids)
-        return list(itertools.chain(group_ids, option_ids))
-
-    def environmentHasOption(self, environmentid, grpid):
-        env = self._base.comps.environment_by_pattern(environmentid)
-        if env is None:
-            raise packaging.NoSuchGroup(environmentid)
-        return grpid in (id_.name for id_ in env.option_ids)
-
-    def environmentOptionIsDefault(self, environmentid, grpid):
-        env = self._base.comps.environment_by_pattern(environmentid)
-        if env is None:
-            raise packaging.NoSuchGroup(environmentid)
-        return False
-
-    def groupDescription(self, grpid):
-        """ Return name/description tuple for the group specified by id. """
-        grp = self._base.comps.group_by_pattern(grpid)
-        if grp is None:
-            raise packaging.NoSuchGroup(grpid)
-        return (grp.ui_name, grp.ui_description)
-
     def gatherRepoMetadata(self):
         map(self._sync_metadata, self._base.repos.iter_enabled())
         self._base.fill_sack(load_system_repo=False)
         self._base.read_comps()
+        self._comps_catalog = self._build_comps_catalog()
 
     def install(self):
+        since = time.time()
         progressQ.send_message(_('Starting package installation process'))
         if self.install_device:
             self._setupMedia(self.install_device)
@@ -350,9 +604,17 @@ class DNFPayload(packaging.PackagePayload):
                 _failure_limbo()
 
         pkgs_to_download = self._base.transaction.install_set
+        batches = self._pipeline_batches(pkgs_to_download)
+        if len(batches) > 1:
+            # the later batches may install what the images built by the
+            # kernel's %posttrans should have contained, don't record them
+            self._install_pipelined(batches)
+            return
+
         log.info('Downloading pacakges.')
         progressQ.send_message(_('Downloading packages'))
-        self._base.download_packages(pkgs_to_download)
+        _download_packages(self._base, pkgs_to_download,
+                           PayloadDownloadProgress(progressQ.send_message))
         log.info('Downloading packages finished.')
 
         pre_msg = _("Preparing transaction from installation source")
@@ -362,19 +624,131 @@ class DNFPayload(packaging.PackagePayload):
         process = multiprocessing.Process(target=do_transaction,
                                           args=(self._base, queue))
         process.start()
-        (token, msg) = queue.get()
+        (token, msg) = _next_event(queue, process)
         while token not in ('post', 'quit'):
             if token == 'install':
                 msg = _("Installing %s") % msg
                 progressQ.send_message(msg)
-            (token, msg) = queue.get()
+            (token, msg) = _next_event(queue, process)
 
         if token == 'quit':
+            log.error("the transaction failed: %s", msg)
             _failure_limbo()
 
         post_msg = _("Performing post-installation setup tasks")
         progressQ.send_message(post_msg)
         process.join()
+        self._recordInitrds(since)
+
+    def _staging_size(self):
+        """ Number of bytes of packages that may be downloaded ahead of the
+            transaction.
+        """
+        try:
+            size = int(flags.cmdline.get("dnfstagingsize", 0)) * 1024 * 1024
+        except ValueError:
+            size = 0
+        if size > 0:
+            return size
+
+        # don't let the packages fill a RAM backed /tmp
+        path = DNF_CACHE_DIR
+        if not os.path.isdir(path):
+            path = os.path.dirname(path)
+        st = os.statvfs(path)
+        return min(DNF_STAGING_SIZE, st.f_bavail * st.f_frsize / 2)
+
+    def _pipeline_batches(self, install_set):
+        """ Split the transaction into batches that are downloaded while the
+            previous ones are installed, if inst.dnfpipeline asks for it.
+
+            Every batch is a transaction of its own: %posttrans scriptlets
+            run once per batch, every batch is an entry of dnf's history, the
+            metadata is loaded again for every batch and an interrupted
+            installation can't be rolled back as a whole.  That's why the
+            packages are installed in one transaction by default.
+
+            :returns: list of lists of packages, empty if the transaction
+                      isn't pipelined
+        """
+        if not flags.cmdline.getbool("dnfpipeline") or \
+           len(self._base.transaction) != len(install_set):
+            return []
+
+        components = _install_order(self._base.sack, list(install_set))
+        batch_size = self._staging_size() / DNF_STAGING_BATCHES
+        return _split_batches(components, batch_size)
+
+    def _install_pipelined(self, batches):
+        """ Download and install the batches, downloading the next batches
+            while the current one is being installed.
+        """
+        total = sum(len(batch) for batch in batches)
+        log.info("Installing %d packages in %d batches", total, len(batches))
+        progressQ.send_message(_('Downloading packages'))
+
+        # the downloader and the transactions report to the same queue, so
+        # the download of the next batch is reported while one is installed
+        events = multiprocessing.Queue()
+        slots = multiprocessing.Semaphore(DNF_STAGING_BATCHES)
+        downloader = multiprocessing.Process(target=download_batches,
+                                             args=(self._base, batches, events, slots))
+        downloader.start()
+
+        downloaded = 0
+        # a failed download is reported once the batch being installed is done
+        download_error = None
+        offset = 0
+        for (index, batch) in enumerate(batches):
+            while downloaded <= index:
+                if download_error is not None:
+                    errors.errorHandler.cb(packaging.PayloadInstallError(download_error))
+                    _failure_limbo()
+                (token, msg) = _next_event(events, downloader)
+                if token == 'ready':
+                    downloaded += 1
+                elif token in ('download_failed', 'quit'):
+                    download_error = msg
+                else:
+                    self._pipeline_event(token, msg, index == len(batches) - 1)
+            log.info('Installing batch %d of %d (%d packages)',
+                     index + 1, len(batches), len(batch))
+
+            process = multiprocessing.Process(target=do_batch_transaction,
+                                              args=(self._base, [str(pkg) for pkg in batch],
+                                                    offset, total, events))
+            process.start()
+            (token, msg) = _next_event(events, process)
+            while token not in ('done', 'quit'):
+                if token == 'ready':
+                    downloaded += 1
+                elif token == 'download_failed':
+                    download_error = msg
+                else:
+                    self._pipeline_event(token, msg, index == len(batches) - 1)
+                (token, msg) = _next_event(events, process)
+            process.join()
+
+            if token == 'quit':
+                log.error("the transaction of batch %d failed: %s", index + 1, msg)
+                _failure_limbo()
+
+            # the batch is installed and its packages removed, make room for
+            # the next one
+            offset += len(batch)
+            slots.release()
+
+        downloader.join()
+
+    @staticmethod
+    def _pipeline_event(token, msg, last_batch):
+        """ Report a message of the downloader or of a batch's transaction. """
+        if token == 'download':
+            progressQ.send_message(msg)
+        elif token == 'install':
+            progressQ.send_message(_("Installing %s") % msg)
+        elif token == 'post' and last_batch:
+            progressQ.send_message(_("Performing post-installation setup tasks"))
 
     def isRepoEnabled(self, repo_id):
         try:
@@ -393,6 +767,7 @@ class DNFPayload(packaging.PackagePayload):
     def reset(self, root=None, releasever=None):
         super(DNFPayload, self).reset()
         self.txID = None
+        self._comps_catalog = None
         self._base.reset(sack=True, repos=True)
 
     def selectEnvironment(self, environmentid):
@@ -0,0 +1,353 @@
+# initrd.py
+# Generating the initramfs images of the installed kernels.
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+"""
+    dracut runs for minutes and installs with several kernels used to run it
+    for one kernel after another.  The images are built by several dracut
+    processes at the same time here, as many as there are CPUs and as fit in
+    the memory.  The output of every kernel's commands is kept together in
+    program.log and the failures are reported at once when all are done.
+
+    new-kernel-pkg also updates the bootloader configuration, which must not
+    be done concurrently, so it is run for one kernel after another once the
+    images are built.
+
+    An image is only rebuilt if the inputs of dracut changed since it was
+    built.  The images built while the payload is installed, by the %posttrans
+    of the kernel packages, are recorded together with the inputs at the end
+    of the installation, as are the images built here.  Images the payload
+    brings along (e.g. the one copied from a live image) are never trusted.
+    The inputs are summed up in a fingerprint: the configuration files
+    dracut copies into the image (including the network, iSCSI, FCoE,
+    multipath and modprobe configuration), the module dependencies of the
+    kernel, dracut itself and, for hostonly images, the devices the installed
+    system is mounted from.
+"""
+
+import os
+import glob
+import hashlib
+import multiprocessing
+import threading
+from Queue import Queue, Empty
+
+from pyanaconda import iutil
+from pyanaconda import isys
+from pyanaconda.anaconda_log import program_log_lock
+from pyanaconda.constants import ROOT_PATH
+from pyanaconda.flags import flags
+
+import logging
+log = logging.getLogger("packaging")
+program_log = logging.getLogger("program")
+
+# memory (in kB) dracut is expected to need
+DRACUT_MEMORY = 512 * 1024
+
+# lines of a failed command's output shown in the report
+INITRD_REPORT_LINES = 5
+
+# files in the installed system whose content goes into the fingerprint
+DRACUT_INPUT_FILES = ["/usr/bin/dracut", "/etc/dracut.conf", "/etc/crypttab",
+                      "/etc/mdadm.conf", "/etc/multipath.conf", "/etc/lvm/lvm.conf",
+                      "/etc/vconsole.conf", "/etc/locale.conf", "/etc/fstab",
+                      "/etc/sysconfig/keyboard", "/etc/sysconfig/i18n",
+                      "/etc/multipath/wwids", "/etc/sysconfig/network",
+                      "/etc/iscsi/initiatorname.iscsi"]
+DRACUT_INPUT_DIRS = ["/etc/dracut.conf.d", "/usr/lib/dracut/dracut.conf.d",
+                     "/etc/cmdline.d", "/etc/modprobe.d", "/etc/fcoe",
+                     "/etc/sysconfig/network-scripts"]
+# files in /lib/modules/<kernel> that change with the set of modules
+KERNEL_MODULE_FILES = ["modules.dep", "modules.builtin", "modules.order"]
+
+def initrd_workers(count):
+    """ Return how many initramfs images may be built at the same time.
+
+        :param count: number of images to build
+        :type count: int
+    """
+    try:
+        cpus = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cpus = 1
+
+    try:
+        memory = isys.total_memory() // DRACUT_MEMORY
+    except RuntimeError:
+        memory = 1
+
+    return max(1, min(count, cpus, memory))
+
+def _dracut_commands(kernel, image_install):
+    """ Return the list of commands building the initramfs for a kernel. """
+    if image_install:
+        # hostonly is not sensible for disk image installations
+        # using /dev/disk/by-uuid/ is necessary due to disk image naming
+        return [["dracut", "-N", "--persistent-policy", "by-uuid",
+                 "-f", "/boot/initramfs-%s.img" % kernel, kernel]]
+
+    return [["depmod", "-a", kernel],
+            ["dracut", "-f", "/boot/initramfs-%s.img" % kernel, kernel]]
+
+def _run_commands(commands, root):
+    """ Run the commands until one of them fails.
+
+        :returns: the return code of the last command and the output of all
+        :rtype: (int, str)
+    """
+    output = []
+    rc = 0
+    for argv in commands:
+        output.append("$ %s\n" % " ".join(argv))
+        try:
+            proc = iutil.startProgram(argv, root=root)
+            output.append(proc.communicate()[0])
+            rc = proc.returncode
+        except OSError as e:
+            output.append("%s\n" % e.strerror)
+            rc = -1
+        if rc != 0:
+            break
+
+    return (rc, "".join(output))
+
+def _image_path(kernel, root):
+    return "%s/boot/initramfs-%s.img" % (root, kernel)
+
+def _hostonly_devices(root):
+    """ Return the (device, mountpoint) pairs the installed system is on. """
+    devices = []
+    with open("/proc/self/mounts") as mounts:
+        for line in mounts:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            if fields[1] == root or fields[1].startswith(root + "/"):
+                devices.append((fields[0], fields[1][len(root):] or "/"))
+    return sorted(devices)
+
+def initrd_fingerprint(kernel, image_install=False, root=ROOT_PATH):
+    """ Return a fingerprint of dracut's inputs for the kernel.
+
+        :param kernel: version of the kernel
+        :type kernel: str
+        :param image_install: whether the image is a generic (not hostonly) one
+        :type image_install: bool
+        :param root: the installed system
+        :type root: str
+        :rtype: str
+    """
+    paths = list(DRACUT_INPUT_FILES)
+    for directory in DRACUT_INPUT_DIRS:
+        paths.extend(sorted(p[len(root):] for p in glob.glob(root + directory + "/*")))
+    paths.extend("/lib/modules/%s/%s" % (kernel, name) for name in KERNEL_MODULE_FILES)
+
+    digest = hashlib.sha1()
+    digest.update("%s %s\n" % (kernel, "generic" if image_install else "hostonly"))
+    for path in paths:
+        try:
+            with open(root + path, "rb") as f:
+                digest.update("%s\n" % path)
+                digest.update(hashlib.sha1(f.read()).digest())
+        except IOError:
+            digest.update("%s missing\n" % path)
+
+    if not image_install:
+        for (device, mountpoint) in _hostonly_devices(root):
+            digest.update("%s on %s\n" % (device, mountpoint))
+
+    return digest.hexdigest()
+
+class InitrdRecord(object):
+    """ What an initramfs image was built from. """
+    def __init__(self, fingerprint, image_stat):
+        self.fingerprint = fingerprint
+        self.mtime = image_stat.st_mtime
+        self.size = image_stat.st_size
+
+    def matches(self, fingerprint, image_stat):
+        return self.fingerprint == fingerprint and self.mtime == image_stat.st_mtime \
+               and self.size == image_stat.st_size
+
+def record_initrd(records, kernel, image_install=False, root=ROOT_PATH):
+    """ Remember the inputs of a freshly built initramfs image.
+
+        :param records: InitrdRecords by kernel version
+        :type records: dict
+    """
+    try:
+        image_stat = os.stat(_image_path(kernel, root))
+    except OSError as e:
+        log.debug("not recording initramfs of %s: %s", kernel, e)
+        records.pop(kernel, None)
+        return
+
+    fingerprint = initrd_fingerprint(kernel, image_install, root)
+    records[kernel] = InitrdRecord(fingerprint, image_stat)
+    log.debug("initramfs of %s built from %s", kernel, fingerprint)
+
+def record_built_initrds(records, kernels, since, root=ROOT_PATH):
+    """ Remember the inputs of the hostonly images built since a point in time.
+
+        The kernel packages build the images in their %posttrans, with the
+        configuration of the system as it is when they are done.  Images
+        older than since weren't built by the installation and are not
+        recorded.
+
+        :param records: InitrdRecords by kernel version
+        :type records: dict
+        :param kernels: versions of the kernels
+        :type kernels: list of str
+        :param since: time.time() before the images could have been built
+        :type since: float
+    """
+    for kernel in kernels:
+        try:
+            image_stat = os.stat(_image_path(kernel, root))
+        except OSError:
+            continue
+
+        if image_stat.st_mtime < int(since):
+            log.debug("initramfs of %s wasn't built by the installation", kernel)
+            continue
+        record_initrd(records, kernel, root=root)
+
+def _initrd_outdated(records, kernel, image_install, root):
+    """ Return why the initramfs of the kernel needs to be built or None. """
+    record = records.get(kernel)
+    if record is None:
+        return "not built by the installer"
+
+    try:
+        image_stat = os.stat(_image_path(kernel, root))
+    except OSError:
+        return "the image is missing"
+
+    fingerprint = initrd_fingerprint(kernel, image_install, root)
+    if record.fingerprint != fingerprint:
+        return "its inputs changed (%s -> %s)" % (record.fingerprint, fingerprint)
+    if not record.matches(fingerprint, image_stat):
+        return "the image changed since it was built"
+    return None
+
+class InitrdFailure(object):
+    """ A kernel whose initramfs couldn't be built. """
+    def __init__(self, kernel, rc, output):
+        self.kernel = kernel
+        self.rc = rc
+        self.output = output
+
+    def __str__(self):
+        tail = self.output.rstrip().splitlines()[-INITRD_REPORT_LINES:]
+        return "%s (exit code %d):\n    %s" % (self.kernel, self.rc, "\n    ".join(tail))
+
+def build_initrds(kernels, image_install=False, root=ROOT_PATH, workers=None,
+                  records=None):
+    """ Build the initramfs images of the kernels concurrently.
+
+        :param kernels: versions of the kernels
+        :type kernels: list of str
+        :param image_install: whether this is an image installation
+        :type image_install: bool
+        :param root: the installed system
+        :type root: str
+        :param workers: how many images to build at the same time, defaults to
+                        what the CPUs and the memory allow
+        :type workers: int
+        :param records: InitrdRecords by kernel version of the images built
+                        before, the kernels whose inputs didn't change are
+                        skipped and the records of the new images are added
+        :type records: dict
+        :returns: the kernels that failed
+        :rtype: list of InitrdFailure
+    """
+    if flags.testing:
+        log.info("not building initramfs because we're testing: %s", kernels)
+        return []
+
+    if records is not None:
+        outdated = []
+        for kernel in kernels:
+            reason = _initrd_outdated(records, kernel, image_install, root)
+            if reason:
+                log.info("building initramfs for %s: %s", kernel, reason)
+                outdated.append(kernel)
+            else:
+                log.info("initramfs for %s is up to date (%s), not rebuilding it",
+                         kernel, records[kernel].fingerprint)
+        kernels = outdated
+
+    if not kernels:
+        return []
+
+    if workers is None:
+        workers = initrd_workers(len(kernels))
+
+    queue = Queue()
+    for kernel in kernels:
+        queue.put(kernel)
+
+    errors = []
+    errors_lock = threading.Lock()
+
+    def build():
+        while True:
+            try:
+                kernel = queue.get_nowait()
+            except Empty:
+                return
+
+            log.info("recreating initrd for %s", kernel)
+            (rc, output) = _run_commands(_dracut_commands(kernel, image_install), root)
+            with program_log_lock:
+                program_log.info("initramfs for %s:", kernel)
+                for line in output.splitlines():
+                    program_log.info(line)
+                program_log.debug("Return code: %d", rc)
+
+            if rc != 0:
+                with errors_lock:
+                    errors.append(InitrdFailure(kernel, rc, output))
+                    if records is not None:
+                        records.pop(kernel, None)
+            elif records is not None:
+                record_initrd(records, kernel, image_install, root)
+
+    log.info("building %d initramfs images, %d at a time", len(kernels), workers)
+    threads = []
+    for i in range(min(workers, len(kernels))):
+        t = threading.Thread(name="AnaInitrdWorker%d" % (i + 1), target=build)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    for t in threads:
+        t.join()
+
+    if not image_install:
+        # new-kernel-pkg picks up the new image for the bootloader entry
+        for kernel in kernels:
+            iutil.execWithRedirect("new-kernel-pkg", ["--update", kernel], root=root)
+
+    if errors:
+        log.error("failed to build initramfs for %d of %d kernels:\n%s",
+                  len(errors), len(kernels), "\n".join(str(e) for e in errors))
+
+    return errors
@@ -0,0 +1,544 @@
+# livecopy.py
+# Parallel, resumable copy engine for live image installations.
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+"""
+    A replacement for the single 'rsync -pogAXtlHrDx' run that used to copy
+    the live image to the target system.
+
+    The source tree is walked once and the regular files are split into work
+    units of roughly the same size.  The units are then copied by a pool of
+    worker threads while directories, symlinks, hardlinks and special files
+    are handled by the main thread.  Every finished unit is recorded in a
+    manifest on the target, so an interrupted copy can be resumed without
+    copying the same data again.
+"""
+
+import os
+import stat
+import errno
+import fnmatch
+import hashlib
+import time
+import ctypes
+import threading
+import multiprocessing
+from Queue import Queue, Empty
+
+from pyanaconda import iutil
+
+import logging
+log = logging.getLogger("packaging")
+
+try:
+    import xattr
+except ImportError:
+    log.info("import of xattr failed, extended attributes will be copied by rsync")
+    xattr = None
+
+# same as the --exclude options the rsync used to get
+LIVE_COPY_EXCLUDES = ["/dev/", "/proc/", "/sys/", "/run/", "/boot/*rescue*",
+                      "/etc/machine-id"]
+
+# name of the file (relative to the destination) recording the finished units
+LIVE_COPY_MANIFEST = ".anaconda-livecopy"
+
+LIVE_COPY_BUFSIZE = 1024 * 1024
+LIVE_COPY_MAX_WORKERS = 8
+
+# how often (in seconds) the progress callback is called by default
+LIVE_COPY_PROGRESS_INTERVAL = 1.0
+
+# a work unit is never smaller than this unless the whole tree is
+LIVE_COPY_MIN_UNIT_SIZE = 64 * 1024 * 1024
+# how many units each worker should get on average
+LIVE_COPY_UNITS_PER_WORKER = 4
+
+_sendfile = getattr(os, "sendfile", None)
+
+_AT_FDCWD = -100
+_AT_SYMLINK_NOFOLLOW = 0x100
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+try:
+    _utimensat = ctypes.CDLL("libc.so.6", use_errno=True).utimensat
+    _utimensat.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                           ctypes.POINTER(_timespec), ctypes.c_int]
+except (OSError, AttributeError):
+    log.info("utimensat is not available, times of symlinks will not be copied")
+    _utimensat = None
+
+def _lutime(path, times):
+    """ Like os.utime, but set the times of a symlink, not of its target.
+
+        python 2 has no way to do that, so utimensat is called directly.  The
+        times are left alone if utimensat is not available.
+    """
+    if _utimensat is None:
+        return
+
+    spec = (_timespec * 2)()
+    for (i, t) in enumerate(times):
+        spec[i].tv_sec = int(t)
+        spec[i].tv_nsec = int((t - int(t)) * 1e9)
+    if _utimensat(_AT_FDCWD, path, spec, _AT_SYMLINK_NOFOLLOW) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+
+def _match_path(parts, pattern):
+    """ Check if the last components of a path match an exclude pattern.
+
+        Like in rsync, the wildcards never match a '/', so every component of
+        the pattern is matched against one component of the path.  '**' is
+        not supported.
+
+        :param parts: components of the path
+        :type parts: list of str
+        :param pattern: the pattern without the leading and trailing '/'
+        :type pattern: str
+    """
+    pattern_parts = pattern.split("/")
+    if len(pattern_parts) > len(parts):
+        return False
+
+    return all(fnmatch.fnmatchcase(part, pattern_part)
+               for (part, pattern_part) in zip(parts[-len(pattern_parts):], pattern_parts))
+
+class LiveCopyError(Exception):
+    pass
+
+class LiveCopy(object):
+    """ Copy a directory tree to another place preserving permissions, owners,
+        groups, ACLs, xattrs, times, symlinks, hardlinks, devices and special
+        files without crossing filesystem boundaries.
+    """
+    def __init__(self, source, dest, excludes=None, workers=None,
+                 callback=None, interval=LIVE_COPY_PROGRESS_INTERVAL):
+        """
+            :param source: root of the tree to copy
+            :type source: str
+            :param dest: directory the tree should be copied to
+            :type dest: str
+            :param excludes: rsync-style exclude patterns relative to source
+                             (a leading '/' anchors the pattern to the source
+                             root, a trailing '/' matches only directories,
+                             the wildcards don't match '/')
+            :type excludes: list of str
+            :param workers: number of threads copying the file data, the
+                            default is based on the number of CPUs
+            :type workers: int
+            :param callback: function called with the number of bytes and
+                             files copied so far, at most once per interval
+                             and once more when the copy is finished; it is
+                             called from the worker threads, but never by
+                             two of them at the same time
+            :type callback: (int, int) -> None
+            :param interval: minimal number of seconds between two calls of
+                             the callback
+            :type interval: float
+        """
+        self.source = os.path.normpath(source)
+        self.dest = os.path.normpath(dest)
+        if excludes is None:
+            excludes = LIVE_COPY_EXCLUDES
+        self.excludes = excludes
+        self.workers = workers or min(multiprocessing.cpu_count(),
+                                      LIVE_COPY_MAX_WORKERS)
+        self.callback = callback
+        self.interval = interval
+        self._last_report = 0
+
+        self.total_bytes = 0
+        self.total_files = 0
+        self.bytes_copied = 0
+        self.files_copied = 0
+        self._counter_lock = threading.Lock()
+        self._callback_lock = threading.Lock()
+
+        # lists of paths relative to the source filled by scan()
+        self._dirs = []
+        self._files = []
+        self._symlinks = []
+        self._specials = []
+        # (path, path of the first link to the same inode)
+        self._hardlinks = []
+        self._units = []
+        self._scanned = False
+
+        self._manifest_lock = threading.Lock()
+        self._error = None
+        self._abort = threading.Event()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.dest, LIVE_COPY_MANIFEST)
+
+    def _excluded(self, relpath, is_dir):
+        """ Check if the path (relative to the source with a leading '/')
+            matches any of the exclude patterns.
+        """
+        parts = relpath.strip("/").split("/")
+        for pattern in self.excludes:
+            if pattern.endswith("/"):
+                if not is_dir:
+                    continue
+                pattern = pattern[:-1]
+
+            if pattern.startswith("/"):
+                # anchored, the whole path has to match
+                pattern = pattern[1:]
+                if len(pattern.split("/")) != len(parts):
+                    continue
+
+            if _match_path(parts, pattern):
+                return True
+
+        return False
+
+    def scan(self):
+        """ Walk the source tree once and split it into work units. """
+        root_dev = os.lstat(self.source).st_dev
+        inodes = {}
+
+        stack = ["/"]
+        while stack:
+            reldir = stack.pop()
+            try:
+                names = sorted(os.listdir(self.source + reldir))
+            except OSError as e:
+                log.error("failed to list %s: %s", self.source + reldir, e)
+                continue
+
+            subdirs = []
+            for name in names:
+                relpath = os.path.join(reldir, name)
+                try:
+                    st = os.lstat(self.source + relpath)
+                except OSError as e:
+                    log.error("failed to stat %s: %s", self.source + relpath, e)
+                    continue
+
+                is_dir = stat.S_ISDIR(st.st_mode)
+                if self._excluded(relpath, is_dir):
+                    continue
+
+                if is_dir:
+                    self._dirs.append((relpath, st))
+                    # like rsync -x, create the mount point but don't descend
+                    if st.st_dev == root_dev:
+                        subdirs.append(relpath)
+                elif stat.S_ISLNK(st.st_mode):
+                    self._symlinks.append((relpath, st))
+                elif stat.S_ISREG(st.st_mode):
+                    if st.st_nlink > 1:
+                        first = inodes.setdefault((st.st_dev, st.st_ino), relpath)
+                        if first != relpath:
+                            self._hardlinks.append((relpath, first))
+                            continue
+                    self._files.append((relpath, st))
+                    self.total_bytes += st.st_size
+                else:
+                    self._specials.append((relpath, st))
+
+            # keep the walk depth-first in sorted order
+            stack.extend(reversed(subdirs))
+
+        self.total_files = len(self._files)
+        self._split()
+        self._scanned = True
+        log.info("live copy: %d files (%d bytes) in %d units, %d directories, "
+                 "%d symlinks, %d hardlinks, %d special files",
+                 self.total_files, self.total_bytes, len(self._units),
+                 len(self._dirs), len(self._symlinks), len(self._hardlinks),
+                 len(self._specials))
+
+    def _split(self):
+        """ Split the files into work units of about the same size.
+
+            The files are kept in the walk order so that every unit covers
+            a few neighbouring directories.
+        """
+        unit_size = max(LIVE_COPY_MIN_UNIT_SIZE,
+                        self.total_bytes // (self.workers * LIVE_COPY_UNITS_PER_WORKER))
+
+        self._units = []
+        unit = []
+        size = 0
+        for (relpath, st) in self._files:
+            unit.append((relpath, st))
+            size += st.st_size
+            if size >= unit_size:
+                self._units.append(unit)
+                unit = []
+                size = 0
+        if unit:
+            self._units.append(unit)
+
+    @staticmethod
+    def _unit_digest(unit):
+        """ Identify a work unit by the paths, sizes and times of its files. """
+        digest = hashlib.sha1()
+        for (relpath, st) in unit:
+            digest.update("%s\0%d\0%d\n" % (relpath, st.st_size, int(st.st_mtime)))
+        return digest.hexdigest()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return set(line.strip() for line in f)
+        except IOError:
+            return set()
+
+    def _unit_done(self, digest):
+        with self._manifest_lock:
+            with open(self.manifest_path, "a") as f:
+                f.write(digest + "\n")
+
+    def _unit_present(self, unit):
+        """ Check that the files of a unit recorded in the manifest are
+            really present on the destination.
+        """
+        for (relpath, st) in unit:
+            try:
+                dst_st = os.lstat(self.dest + relpath)
+            except OSError:
+                return False
+            if not stat.S_ISREG(dst_st.st_mode) or dst_st.st_size != st.st_size \
+               or int(dst_st.st_mtime) != int(st.st_mtime):
+                return False
+        return True
+
+    def _count(self, nbytes, nfiles=0):
+        with self._counter_lock:
+            self.bytes_copied += nbytes
+            self.files_copied += nfiles
+
+            if not self.callback:
+                return
+            now = time.time()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+
+        self._report()
+
+    def _report(self):
+        """ Call the callback with the current counts.
+
+            The callback (e.g. a ProgressRate update) is not thread-safe, so
+            the workers call it one at a time.  The counts are read with the
+            lock held, so they never go back between two calls.
+        """
+        with self._callback_lock:
+            with self._counter_lock:
+                copied = (self.bytes_copied, self.files_copied)
+            self.callback(*copied)
+
+    @staticmethod
+    def _remove(path):
+        """ Remove whatever non-directory is in the way of a new entry. """
+        try:
+            os.unlink(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _copy_xattrs(self, src, dst):
+        if not xattr:
+            return
+
+        for name in xattr.list(src, nofollow=True):
+            xattr.set(dst, name, xattr.get(src, name, nofollow=True),
+                      nofollow=True)
+
+    def _copy_metadata(self, src, dst, st):
+        """ Copy owner, group, permissions, xattrs and times. """
+        # chown first, it clears the setuid and setgid bits
+        os.lchown(dst, st.st_uid, st.st_gid)
+        if not stat.S_ISLNK(st.st_mode):
+            os.chmod(dst, stat.S_IMODE(st.st_mode))
+        self._copy_xattrs(src, dst)
+        if stat.S_ISLNK(st.st_mode):
+            _lutime(dst, (st.st_atime, st.st_mtime))
+        else:
+            os.utime(dst, (st.st_atime, st.st_mtime))
+
+    def _copy_data(self, src, dst, size):
+        with open(src, "rb") as fsrc:
+            if os.path.lexists(dst) and not os.path.isfile(dst):
+                self._remove(dst)
+
+            with open(dst, "wb") as fdst:
+                if _sendfile:
+                    offset = 0
+                    while offset < size:
+                        sent = _sendfile(fdst.fileno(), fsrc.fileno(), offset,
+                                         min(LIVE_COPY_BUFSIZE, size - offset))
+                        if not sent:
+                            break
+                        offset += sent
+                        self._count(sent)
+                else:
+                    while True:
+                        buf = fsrc.read(LIVE_COPY_BUFSIZE)
+                        if not buf:
+                            break
+                        fdst.write(buf)
+                        self._count(len(buf))
+
+    def _copy_unit(self, unit):
+        for (relpath, st) in unit:
+            if self._abort.is_set():
+                return
+            src = self.source + relpath
+            dst = self.dest + relpath
+            self._copy_data(src, dst, st.st_size)
+            self._copy_metadata(src, dst, st)
+            self._count(0, 1)
+
+    def _worker(self, queue):
+        while not self._abort.is_set():
+            try:
+                (digest, unit) = queue.get_nowait()
+            except Empty:
+                return
+
+            try:
+                self._copy_unit(unit)
+            # pylint: disable-msg=W0703
+            except Exception as e:
+                log.error("live copy worker failed: %s", e)
+                self._error = e
+                self._abort.set()
+                return
+
+            self._unit_done(digest)
+
+    def _make_dirs(self):
+        iutil.mkdirChain(self.dest)
+        for (relpath, _st) in self._dirs:
+            try:
+                os.mkdir(self.dest + relpath, 0700)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def _copy_unit_queue(self):
+        done = self._read_manifest()
+        queue = Queue()
+        for unit in self._units:
+            digest = self._unit_digest(unit)
+            if digest in done and self._unit_present(unit):
+                self._count(sum(st.st_size for (_path, st) in unit), len(unit))
+                continue
+            queue.put((digest, unit))
+
+        if self.files_copied:
+            log.info("live copy: resuming, %d files already copied",
+                     self.files_copied)
+
+        threads = []
+        for i in range(min(self.workers, queue.qsize())):
+            t = threading.Thread(name="AnaLiveCopyWorker%d" % (i + 1),
+                                 target=self._worker, args=(queue,))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        for t in threads:
+            t.join()
+
+        if self._error:
+            raise LiveCopyError(str(self._error))
+
+    def _make_links(self):
+        for (relpath, st) in self._symlinks:
+            dst = self.dest + relpath
+            self._remove(dst)
+            os.symlink(os.readlink(self.source + relpath), dst)
+            self._copy_metadata(self.source + relpath, dst, st)
+
+        for (relpath, st) in self._specials:
+            dst = self.dest + relpath
+            self._remove(dst)
+            os.mknod(dst, st.st_mode, st.st_rdev)
+            self._copy_metadata(self.source + relpath, dst, st)
+
+        for (relpath, first) in self._hardlinks:
+            dst = self.dest + relpath
+            self._remove(dst)
+            os.link(self.dest + first, dst)
+
+    def _set_dir_metadata(self):
+        # deepest first so that setting the times is not undone by changes
+        # in the subdirectories
+        for (relpath, st) in reversed(self._dirs):
+            self._copy_metadata(self.source + relpath, self.dest + relpath, st)
+        root_st = os.lstat(self.source)
+        self._copy_metadata(self.source, self.dest, root_st)
+
+    def _rsync_attrs(self):
+        """ Let rsync copy ACLs and xattrs if we cannot do it ourselves.
+
+            All the data are already in place, so rsync's quick check skips
+            every file and only the attributes are updated.
+        """
+        args = ["-pogAXtlHrDx"]
+        for pattern in self.excludes:
+            args.extend(["--exclude", pattern])
+        args.extend(["--exclude", "/" + LIVE_COPY_MANIFEST])
+        args.extend([self.source + "/", self.dest])
+        try:
+            rc = iutil.execWithRedirect("rsync", args)
+        except (OSError, RuntimeError) as e:
+            raise LiveCopyError(str(e))
+
+        log.info("rsync exited with code %d", rc)
+        # like the rsync run that copied everything, only fail on protocol
+        # errors, a partial transfer (23, 24) leaves a usable system
+        if rc == 12:
+            raise LiveCopyError("rsync exited with code %d" % rc)
+
+    def run(self):
+        """ Copy the tree.
+
+            :raises LiveCopyError: if the copy fails
+        """
+        try:
+            if not self._scanned:
+                self.scan()
+            self._make_dirs()
+            self._copy_unit_queue()
+            self._make_links()
+
+            if self.callback:
+                self._report()
+
+            # all the data is in place, nothing left to resume
+            if os.path.exists(self.manifest_path):
+                os.unlink(self.manifest_path)
+
+            self._set_dir_metadata()
+
+            if not xattr:
+                self._rsync_attrs()
+        except (IOError, OSError) as e:
+            raise LiveCopyError(str(e))
@@ -31,8 +31,7 @@
 """
 import os
 import stat
-from time import sleep
-from threading import Lock
+import time
 from urlgrabber.grabber import URLGrabber
 from urlgrabber.grabber import URLGrabError
 from pyanaconda.iutil import ProxyString, ProxyStringError, lowerASCII
@@ -41,8 +40,10 @@ import hashlib
 import glob
 
 from pyanaconda.packaging import ImagePayload, PayloadSetupError, PayloadInstallError
+from pyanaconda.packaging.livecopy import LiveCopy, LiveCopyError
+from pyanaconda.packaging.livecopy import LIVE_COPY_MAX_WORKERS, LIVE_COPY_PROGRESS_INTERVAL
 
-from pyanaconda.constants import INSTALL_TREE, ROOT_PATH, THREAD_LIVE_PROGRESS
+from pyanaconda.constants import INSTALL_TREE, ROOT_PATH
 from pyanaconda.constants import IMAGE_DIR
 
 from pyanaconda import iutil
@@ -51,20 +52,29 @@ import logging
 log = logging.getLogger("packaging")
 
 from pyanaconda.errors import errorHandler, ERROR_RAISE
-from pyanaconda.progress import progressQ
+from pyanaconda.flags import flags
+from pyanaconda.progress import progressQ, ProgressRate
 from blivet.size import Size
 import blivet.util
-from pyanaconda.threads import threadMgr, AnacondaThread
 from pyanaconda.i18n import _
 
 class LiveImagePayload(ImagePayload):
     """ A LivePayload copies the source image onto the target system. """
     def __init__(self, *args, **kwargs):
         super(LiveImagePayload, self).__init__(*args, **kwargs)
-        # Used to adjust size of ROOT_PATH when files are already present
-        self._adj_size = 0
-        self.pct = 0
-        self.pct_lock = None
+        self._copy = None
+        self._rate = None
+        # size of the live image in KiB, walked once in setup
+        self._image_size = None
+
+    @property
+    def progress_interval(self):
+        """ Number of seconds between two progress updates during the copy. """
+        try:
+            return float(flags.cmdline.get("progressinterval",
+                                           LIVE_COPY_PROGRESS_INTERVAL))
+        except ValueError:
+            return LIVE_COPY_PROGRESS_INTERVAL
 
     def setup(self, storage):
         super(LiveImagePayload, self).setup(storage)
@@ -77,70 +87,55 @@ class LiveImagePayload(ImagePayload):
                 raise exn
         blivet.util.mount(osimg.path, INSTALL_TREE, fstype="auto", options="ro")
 
+        # The hub asks for spaceRequired on every refresh, don't walk the
+        # whole live image each time.
+        self._image_size = None
+        self._live_image_size()
+
+    def _live_image_size(self):
+        """ Size of the running live image in KiB, computed only once. """
+        if self._image_size is None:
+            self._image_size = iutil.getDirSize("/", workers=LIVE_COPY_MAX_WORKERS)
+        return self._image_size
+
     def preInstall(self, packages=None, groups=None):
         """ Perform pre-installation tasks. """
         super(LiveImagePayload, self).preInstall(packages=packages, groups=groups)
         progressQ.send_message(_("Installing software") + (" %d%%") % (0,))
 
-    def progress(self):
-        """Monitor the amount of disk space used on the target and source and
-           update the hub's progress bar.
-        """
-        source = os.statvfs(INSTALL_TREE)
-        source_size = source.f_frsize * (source.f_blocks - source.f_bfree)
-        mountpoints = self.storage.mountpoints.copy()
-        last_pct = -1
-        while self.pct < 100:
-            dest_size = 0
-            for mnt in mountpoints:
-                mnt_stat = os.statvfs(ROOT_PATH+mnt)
-                dest_size += mnt_stat.f_frsize * (mnt_stat.f_blocks - mnt_stat.f_bfree)
-            if dest_size >= self._adj_size:
-                dest_size -= self._adj_size
-
-            pct = int(100 * dest_size / source_size)
-            if pct != last_pct:
-                with self.pct_lock:
-                    self.pct = pct
-                last_pct = pct
-                progressQ.send_message(_("Installing software") + (" %d%%") % (min(100, self.pct),))
-            sleep(0.777)
+    def _copy_progress(self, bytes_copied, files_copied):
+        """ Update the hub's progress bar with the amount of data copied. """
+        self._rate.update(bytes_copied)
+        eta = self._rate.eta
+        if eta is None:
+            progressQ.send_message(_("Installing software") + (" %d%%") % (self._rate.pct,))
+            return
+
+        progressQ.send_message(_("Installing software %(pct)d%% (%(rate)s/s, "
+                                 "%(min)d:%(sec)02d remaining)") %
+                               {"pct": self._rate.pct,
+                                "rate": Size(bytes=int(self._rate.rate)),
+                                "min": eta // 60, "sec": eta % 60})
+        log.debug("copied %d of %d files", files_copied, self._copy.total_files)
 
     def install(self):
         """ Install the payload. """
-        self.pct_lock = Lock()
-        self.pct = 0
-        threadMgr.add(AnacondaThread(name=THREAD_LIVE_PROGRESS,
-                                     target=self.progress))
-
-        cmd = "rsync"
-        # preserve: permissions, owners, groups, ACL's, xattrs, times,
-        #           symlinks, hardlinks
-        # go recursively, include devices and special files, don't cross
-        # file system boundaries
-        args = ["-pogAXtlHrDx", "--exclude", "/dev/", "--exclude", "/proc/",
-                "--exclude", "/sys/", "--exclude", "/run/", "--exclude", "/boot/*rescue*",
-                "--exclude", "/etc/machine-id", INSTALL_TREE+"/", ROOT_PATH]
-        try:
-            rc = iutil.execWithRedirect(cmd, args)
-        except (OSError, RuntimeError) as e:
-            msg = None
-            err = str(e)
-            log.error(err)
-        else:
-            err = None
-            msg = "%s exited with code %d" % (cmd, rc)
-            log.info(msg)
+        self._copy = LiveCopy(INSTALL_TREE, ROOT_PATH,
+                              callback=self._copy_progress,
+                              interval=self.progress_interval)
 
-        if err or rc == 12:
-            exn = PayloadInstallError(err or msg)
+        try:
+            self._copy.scan()
+            self._rate = ProgressRate(self._copy.total_bytes)
+            self._copy.run()
+        except LiveCopyError as e:
+            log.error("live image copy failed: %s", e)
+            exn = PayloadInstallError(str(e))
             if errorHandler.cb(exn) == ERROR_RAISE:
                 raise exn
-
-        # Wait for progress thread to finish
-        with self.pct_lock:
-            self.pct = 100
-        threadMgr.wait(THREAD_LIVE_PROGRESS)
+        else:
+            log.info("copied %d files (%d bytes) from the live image",
+                     self._copy.files_copied, self._copy.bytes_copied)
 
     def postInstall(self):
         """ Perform post-installation tasks. """
@@ -150,11 +145,15 @@ class LiveImagePayload(ImagePayload):
         super(LiveImagePayload, self).postInstall()
 
         # Live needs to create the rescue image before bootloader is written
+        since = time.time()
         for kernel in self.kernelVersionList:
             log.info("Generating rescue image for %s", kernel)
             iutil.execWithRedirect("new-kernel-pkg",
                                    ["--rpmposttrans", kernel],
                                    root=ROOT_PATH)
+        # only the images these scripts built are recorded, not the ones
+        # copied from the live image
+        self._recordInitrds(since)
 
         # Make sure the new system has a machine-id, it won't boot without it
         if not os.path.exists(ROOT_PATH+"/etc/machine-id"):
@@ -162,7 +161,7 @@ class LiveImagePayload(ImagePayload):
 
     @property
     def spaceRequired(self):
-        return Size(bytes=iutil.getDirSize("/")*1024)
+        return Size(bytes=self._live_image_size()*1024)
 
 class URLGrabberProgress(object):
     """ Provide methods for urlgrabber progress."""
@@ -294,9 +293,6 @@ class LiveImageKSPayload(LiveImagePayload):
             if errorHandler.cb(exn) == ERROR_RAISE:
                 raise exn
 
-        # Used to make install progress % look correct
-        self._adj_size = os.stat(self.image_path)[stat.ST_SIZE]
-
         if self.data.method.checksum:
             progressQ.send_message(_("Checking image checksum"))
             sha256 = hashlib.sha256()
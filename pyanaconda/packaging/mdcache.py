@@ -0,0 +1,214 @@
+# mdcache.py
+# Content-addressed cache of yum repository metadata.
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+"""
+    The yum cache directory is thrown away every time the installation source
+    changes, because all the base repos share the same id.  This cache keeps
+    the metadata files outside of it, every file stored under the checksum
+    repomd.xml gives for it.  Before yum fetches the metadata of a repo, the
+    files it already has are put back into the repo's cache directory, where
+    yum finds them, verifies their checksums and skips the download.
+
+    repomd.xml itself is never cached.  It is always read from the source, so
+    only the files the source lists now are reused: the base URL doesn't tell
+    media apart (every ISO and DVD is file:// at the same mount point), and
+    remote trees like nightly composes change under the same URL.
+
+    The cache lives in /tmp by default, so it survives restart-anaconda.  When
+    it grows over its size limit the least recently used files are removed.
+"""
+
+import os
+import errno
+import shutil
+import hashlib
+import threading
+
+import logging
+log = logging.getLogger("packaging")
+
+METADATA_CACHE_DIR = "/tmp/anaconda-mdcache"
+# size limit of the cache in MiB
+METADATA_CACHE_SIZE = 512
+
+_REPOMD_FILE = "repomd.xml"
+_BUFSIZE = 1024 * 1024
+
+def _file_checksum(path, checksum_type):
+    """ Return the hex digest of a file.
+
+        :param checksum_type: checksum type as used by repomd.xml
+        :type checksum_type: str
+    """
+    if checksum_type == "sha":
+        checksum_type = "sha1"
+
+    digest = hashlib.new(checksum_type)
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(_BUFSIZE)
+            if not buf:
+                break
+            digest.update(buf)
+
+    return digest.hexdigest()
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(src, dst)
+
+class MetadataCache(object):
+    """ A size limited store of repo metadata files keyed by their checksums.
+
+        All the methods are safe to be called from multiple threads, but a
+        repo's cache directory must only be used by one thread at a time.
+    """
+    def __init__(self, path=METADATA_CACHE_DIR, max_size=METADATA_CACHE_SIZE):
+        """ :param path: directory the files are kept in
+            :type path: str
+            :param max_size: size limit of the cache in MiB
+            :type max_size: int
+        """
+        self.path = path
+        self.max_size = max_size * 1024 * 1024
+        self._lock = threading.Lock()
+
+    def _object_path(self, checksum):
+        return os.path.join(self.path, checksum)
+
+    def _restore_file(self, checksum, dest):
+        """ Put a cached file to dest if there is one.
+
+            :returns: whether the file was restored
+            :rtype: bool
+        """
+        obj_path = self._object_path(checksum)
+        try:
+            # mark the file as used for the eviction
+            os.utime(obj_path, None)
+            _link_or_copy(obj_path, dest)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                log.debug("failed to restore %s from metadata cache: %s", dest, e)
+            return False
+
+        return True
+
+    def _store_file(self, src, checksum):
+        obj_path = self._object_path(checksum)
+        if os.path.exists(obj_path):
+            os.utime(obj_path, None)
+            return
+
+        _link_or_copy(src, obj_path + ".new")
+        os.rename(obj_path + ".new", obj_path)
+
+    def restore(self, yumrepo):
+        """ Put the cached metadata files listed in the repo's repomd.xml to
+            its cache dir.
+
+            This reads (and possibly downloads) repomd.xml, the files are
+            looked up by the checksums it gives for them.
+
+            :returns: number of files restored
+            :rtype: int
+        """
+        restored = 0
+        repomd = yumrepo.repoXML
+        for mdtype in repomd.fileTypes():
+            data = repomd.getData(mdtype)
+            dest = os.path.join(yumrepo.cachedir, os.path.basename(data.location[1]))
+            if not os.path.exists(dest) and self._restore_file(data.checksum[1], dest):
+                restored += 1
+
+        if restored:
+            log.debug("restored %d metadata files of %s from cache", restored, yumrepo.id)
+        return restored
+
+    def store(self, yumrepo):
+        """ Add the metadata files in the repo's cache dir to the cache.
+
+            Only the files matching the checksums in repomd.xml are stored.
+        """
+        repomd_path = os.path.join(yumrepo.cachedir, _REPOMD_FILE)
+        if not os.path.exists(repomd_path):
+            return
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        repomd = yumrepo.repoXML
+        for mdtype in repomd.fileTypes():
+            data = repomd.getData(mdtype)
+            src = os.path.join(yumrepo.cachedir, os.path.basename(data.location[1]))
+            (checksum_type, checksum) = data.checksum
+            if not os.path.exists(src):
+                continue
+
+            try:
+                if not os.path.exists(self._object_path(checksum)) and \
+                   _file_checksum(src, checksum_type) != checksum:
+                    log.debug("not caching %s, checksum mismatch", src)
+                    continue
+                self._store_file(src, checksum)
+            except (IOError, OSError, ValueError) as e:
+                log.debug("failed to cache %s: %s", src, e)
+
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        """ Remove the least recently used files over the size limit.
+
+            This needs to be called with self._lock held.
+        """
+        objects = []
+        total = 0
+        for name in os.listdir(self.path):
+            if name.endswith(".new"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            objects.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+
+        if total <= self.max_size:
+            return
+
+        objects.sort()
+        removed = 0
+        for (_mtime, size, name) in objects:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except OSError as e:
+                log.debug("failed to remove %s from metadata cache: %s", name, e)
+                continue
+            total -= size
+            removed += 1
+
+        log.debug("removed %d files from metadata cache", removed)
@@ -0,0 +1,267 @@
+# treeinfo.py
+# Cache of the treeinfo files of installation trees.
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+"""
+    The treeinfo of the installation source is asked for several times every
+    time the source changes: for the release version, for the addons and by
+    the payloads.  The cache keeps the parsed treeinfo of every tree by its
+    URL and the proxies and SSL verification it was retrieved with.  For
+    TREEINFO_MAX_AGE seconds after it was retrieved it is used as it is, after
+    that the server is asked whether it changed, with the ETag and
+    Last-Modified it sent, so an unchanged treeinfo isn't downloaded again.
+
+    Trees that couldn't be retrieved are not cached, the next request tries
+    again.  Local trees (file:// URLs) are not cached either: every local
+    source (cdrom, hard drive ISO, NFS) is mounted at the same path, so the
+    URL doesn't tell which tree it is, and reading a local file is cheap.
+
+    Trees have either .treeinfo or treeinfo, both are requested at the same
+    time when a tree is seen for the first time.
+"""
+
+import os
+import time
+import hashlib
+import threading
+import ConfigParser
+from urlgrabber.grabber import URLGrabber
+from urlgrabber.grabber import URLGrabError
+
+import logging
+log = logging.getLogger("packaging")
+
+TREEINFO_FILENAMES = (".treeinfo", "treeinfo")
+TREEINFO_CACHE_DIR = "/tmp/treeinfo-cache"
+# seconds a treeinfo is used without asking the server whether it changed
+TREEINFO_MAX_AGE = 60
+
+# HTTP status of a successful conditional request for an unchanged file
+_NOT_MODIFIED = 304
+
+class TreeInfo(object):
+    """ The parsed treeinfo of an installation tree.
+
+        version and variant are None if the treeinfo doesn't have them.
+        variants, addons and images map the part of the section names after
+        'variant-', 'addon-' and 'images-' to dicts of the sections' options,
+        checksums maps the paths in the tree to their checksums.
+    """
+    def __init__(self, path):
+        """ :param path: local copy of the treeinfo
+            :type path: str
+            :raises: ConfigParser.Error if the file can't be parsed
+        """
+        self.path = path
+
+        self._config = ConfigParser.ConfigParser()
+        self._config.read(path)
+
+        self.version = self.get("general", "version")
+        self.variant = self.get("general", "variant")
+        self.variants = self._sections("variant-")
+        self.addons = self._sections("addon-")
+        self.images = self._sections("images-")
+        if self._config.has_section("checksums"):
+            self.checksums = dict(self._config.items("checksums", raw=True))
+        else:
+            self.checksums = {}
+
+    def get(self, section, option):
+        """ Return the value of an option or None if there's no such option. """
+        try:
+            return self._config.get(section, option, raw=True)
+        except ConfigParser.Error:
+            return None
+
+    def _sections(self, prefix):
+        return dict((section[len(prefix):], dict(self._config.items(section, raw=True)))
+                    for section in self._config.sections() if section.startswith(prefix))
+
+class _CacheEntry(object):
+    def __init__(self, filename, treeinfo, etag=None, last_modified=None):
+        self.filename = filename
+        self.treeinfo = treeinfo
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked = time.time()
+
+def _download(url, ugopts, headers=()):
+    """ Download url.
+
+        :returns: (HTTP status or None, content, ETag, Last-Modified)
+        :raises: URLGrabError
+    """
+    fo = URLGrabber().urlopen(url, http_headers=tuple(headers), **ugopts)
+    try:
+        data = fo.read()
+        code = getattr(fo, "http_code", None)
+        hdr = getattr(fo, "hdr", None)
+    finally:
+        fo.close()
+
+    if hdr is not None:
+        return (code, data, hdr.getheader("ETag"), hdr.getheader("Last-Modified"))
+
+    return (code, data, None, None)
+
+class TreeInfoCache(object):
+    """ Parsed treeinfo files of installation trees by the trees' URLs. """
+    def __init__(self, cachedir=TREEINFO_CACHE_DIR, max_age=TREEINFO_MAX_AGE):
+        """ :param cachedir: directory for the local copies of the treeinfos
+            :type cachedir: str
+            :param max_age: seconds a treeinfo is used without revalidation
+            :type max_age: int
+        """
+        self.cachedir = cachedir
+        self.max_age = max_age
+        # cache entries by (url, proxies, sslverify)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _local_path(self, url, filename):
+        return os.path.join(self.cachedir,
+                            "%s-%s" % (hashlib.sha1(url).hexdigest(), filename.lstrip(".")))
+
+    def _store(self, url, filename, data, etag, last_modified):
+        """ Write a downloaded treeinfo and return its cache entry. """
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+
+        path = self._local_path(url, filename)
+        with open(path + ".new", "w") as f:
+            f.write(data)
+        os.rename(path + ".new", path)
+
+        try:
+            treeinfo = TreeInfo(path)
+        except ConfigParser.Error as e:
+            log.info("Error parsing treeinfo of %s: %s", url, e)
+            treeinfo = None
+
+        return _CacheEntry(filename, treeinfo, etag, last_modified)
+
+    def _fetch(self, url, ugopts):
+        """ Download the treeinfo, trying both file names at the same time. """
+        results = {}
+
+        def grab(filename):
+            try:
+                results[filename] = _download("%s/%s" % (url, filename), ugopts)
+            except URLGrabError as e:
+                results[filename] = e
+
+        threads = []
+        for (i, filename) in enumerate(TREEINFO_FILENAMES):
+            thread = threading.Thread(name="AnaTreeInfoWorker%d" % (i + 1), target=grab,
+                                      args=(filename,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        # the names are in the order of preference, the first one found wins
+        for (filename, thread) in zip(TREEINFO_FILENAMES, threads):
+            thread.join()
+            result = results.get(filename)
+            if result is None or isinstance(result, URLGrabError):
+                log.debug("Error downloading %s/%s: %s", url, filename, result)
+                continue
+
+            (_code, data, etag, last_modified) = result
+            return self._store(url, filename, data, etag, last_modified)
+
+        log.info("Error downloading treeinfo from %s", url)
+        return _CacheEntry(None, None)
+
+    def _revalidate(self, url, entry, ugopts):
+        """ Ask the server whether the cached treeinfo changed.
+
+            :returns: the entry to use or None if the treeinfo has to be
+                      fetched again
+        """
+        headers = []
+        if entry.etag:
+            headers.append(("If-None-Match", entry.etag))
+        if entry.last_modified:
+            headers.append(("If-Modified-Since", entry.last_modified))
+        if not headers:
+            return None
+
+        try:
+            (code, data, etag, last_modified) = _download("%s/%s" % (url, entry.filename),
+                                                          ugopts, headers)
+        except URLGrabError as e:
+            if getattr(e, "code", None) == _NOT_MODIFIED:
+                code = _NOT_MODIFIED
+            else:
+                log.debug("Error revalidating treeinfo of %s: %s", url, e)
+                return None
+
+        if code == _NOT_MODIFIED:
+            log.debug("treeinfo of %s not modified", url)
+            entry.checked = time.time()
+            return entry
+
+        log.debug("treeinfo of %s changed", url)
+        return self._store(url, entry.filename, data, etag, last_modified)
+
+    def get(self, url, proxies=None, sslverify=True):
+        """ Return the parsed treeinfo of the tree at url.
+
+            :param url: url of the tree
+            :type url: str
+            :param proxies: proxies for urlgrabber
+            :type proxies: dict
+            :param sslverify: True if SSL certificate should be verified
+            :type sslverify: bool
+            :returns: the treeinfo or None if the tree doesn't have one
+            :rtype: TreeInfo or None
+        """
+        ugopts = {"ssl_verify_peer": sslverify,
+                  "ssl_verify_host": sslverify,
+                  "proxies": proxies or {}}
+
+        if url.startswith("file://"):
+            return self._fetch(url, ugopts).treeinfo
+
+        key = (url, tuple(sorted(ugopts["proxies"].items())), sslverify)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry.checked < self.max_age:
+                return entry.treeinfo
+
+            if entry:
+                entry = self._revalidate(url, entry, ugopts)
+
+            if entry is None:
+                entry = self._fetch(url, ugopts)
+
+            if entry.filename:
+                self._entries[key] = entry
+            else:
+                self._entries.pop(key, None)
+            return entry.treeinfo
+
+    def clear(self):
+        """ Forget all the treeinfos, they will be fetched again. """
+        with self._lock:
+            self._entries.clear()
+
+# the cache shared by all the payloads
+treeinfo_cache = TreeInfoCache()
@@ -35,13 +35,12 @@
 
 """
 
-import ConfigParser
 import os
 import shutil
 import sys
 import time
-from pyanaconda.iutil import execReadlines
 from functools import wraps
+from Queue import Queue, Empty
 
 import logging
 log = logging.getLogger("packaging")
@@ -67,7 +66,7 @@ from pyanaconda.flags import flags
 
 from pyanaconda import iutil
 from pyanaconda.iutil import ProxyString, ProxyStringError
-from pyanaconda.i18n import _
+from pyanaconda.i18n import _, N_
 from pyanaconda.nm import nm_is_connected
 from pyanaconda.product import productName, isFinal
 from blivet.size import Size
@@ -78,7 +77,11 @@ from pyanaconda.errors import ERROR_RAISE, errorHandler
 from pyanaconda.packaging import DependencyError, MetadataError, NoNetworkError, NoSuchGroup, \
                                  NoSuchPackage, PackagePayload, PayloadError, PayloadInstallError, \
                                  PayloadSetupError
-from pyanaconda.progress import progressQ
+from pyanaconda.progress import progressQ, ProgressThrottle
+from pyanaconda import eventchannel
+from pyanaconda.eventchannel import read_events
+from pyanaconda.packaging.compscatalog import CompsCatalog, CompsEnvironment, CompsGroup
+from pyanaconda.packaging.mdcache import MetadataCache, METADATA_CACHE_DIR, METADATA_CACHE_SIZE
 
 from pyanaconda.localization import langcode_matches_locale
 
@@ -88,6 +91,25 @@ YUM_PLUGINS = ["fastestmirror", "langpacks"]
 DEFAULT_REPOS = [productName.lower(), "rawhide"]
 BASE_REPO_NAMES = [BASE_REPO_NAME] + DEFAULT_REPOS
 
+# minimal number of seconds between two progress messages during the install
+YUM_PROGRESS_INTERVAL = 0.25
+
+# maximal number of repos whose metadata is downloaded at the same time
+YUM_METADATA_WORKERS = 4
+
+# progress keys of anaconda-yum's text protocol
+_yum_progress_map = {
+    "PROGRESS_PREP"    : N_("Preparing transaction from installation source"),
+    "PROGRESS_INSTALL" : N_("Installing"),
+    "PROGRESS_POST"    : N_("Performing post-installation setup tasks")
+}
+
+_yum_log_levels = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARN": logging.WARNING
+}
+
 import inspect
 import threading
 _private_yum_lock = threading.RLock()
@@ -179,6 +201,13 @@ class YumPayload(PackagePayload):
         self._base_repo = None
         self._base_repo_lock = threading.RLock()
 
+        try:
+            mdcache_size = int(flags.cmdline.get("mdcachesize", METADATA_CACHE_SIZE))
+        except ValueError:
+            mdcache_size = METADATA_CACHE_SIZE
+        self._mdcache = MetadataCache(flags.cmdline.get("mdcache", METADATA_CACHE_DIR),
+                                      mdcache_size)
+
         self.reset()
 
     def reset(self, root=None, releasever=None):
@@ -191,6 +220,7 @@ class YumPayload(PackagePayload):
         self._space_required = Size(en_spec="3000 MB")
 
         self._groups = None
+        self._comps_catalog = None
         self._packages = []
 
         self._resetYum(root=root, releasever=releasever)
@@ -224,6 +254,7 @@ class YumPayload(PackagePayload):
                     for repo in self._yum.repos.listEnabled():
                         if repo.name == BASE_REPO_NAME and \
                            os.path.isdir(repo.cachedir):
+                            self._storeRepoMetadata(repo)
                             shutil.rmtree(repo.cachedir)
 
                 del self._yum
@@ -487,12 +518,8 @@ reposdir=%s
         releasever = None
         method = self.data.method
         if method.method:
-            try:
-                releasever = self._getReleaseVersion(url)
-                log.debug("releasever from %s is %s", url, releasever)
-            except ConfigParser.MissingSectionHeaderError as e:
-                log.error("couldn't set releasever from base repo (%s): %s",
-                          method.method, e)
+            releasever = self._getReleaseVersion(url)
+            log.debug("releasever from %s is %s", url, releasever)
 
         # start with a fresh YumBase instance & tear down old install device
         self.reset(root=root, releasever=releasever)
@@ -595,23 +622,98 @@ reposdir=%s
                     # if a method/repo was given, disable all default repos
                     self.disableRepo(repo.id)
 
+    @property
+    def metadata_workers(self):
+        """ Number of repos whose metadata is downloaded at the same time. """
+        try:
+            return max(1, int(flags.cmdline.get("metadataworkers",
+                                                YUM_METADATA_WORKERS)))
+        except ValueError:
+            return YUM_METADATA_WORKERS
+
     @refresh_base_repo()
     def gatherRepoMetadata(self):
         # now go through and get metadata for all enabled repos
         log.info("gathering repo metadata")
-        for repo_id in self.repos:
+        with _yum_lock:
+            repos = [self._yum.repos.getRepo(repo_id) for repo_id in self.repos]
+        repos = [repo for repo in repos if repo.enabled]
+
+        self._fetchRepoMetadata(repos, self.metadata_workers, self._mdcache)
+
+        # The metadata is in the repos' caches now, so this only verifies and
+        # loads it and turns the failures into errors.
+        fetched = []
+        for repo in repos:
             with _yum_lock:
-                repo = self._yum.repos.getRepo(repo_id)
-                if repo.enabled:
-                    try:
-                        self._getRepoMetadata(repo)
-                    except PayloadError as e:
-                        log.error("failed to grab repo metadata for %s: %s",
-                                  repo_id, e)
-                        self.disableRepo(repo_id)
+                try:
+                    self._getRepoMetadata(repo)
+                    fetched.append(repo)
+                except PayloadError as e:
+                    log.error("failed to grab repo metadata for %s: %s",
+                              repo.id, e)
+                    self.disableRepo(repo.id)
+
+        for repo in fetched:
+            self._storeRepoMetadata(repo)
 
         log.info("metadata retrieval complete")
 
+    def _storeRepoMetadata(self, yumrepo):
+        """ Keep the metadata of a repo for when its source is used again. """
+        try:
+            self._mdcache.store(yumrepo)
+        # pylint: disable-msg=W0703
+        except Exception as e:
+            log.debug("failed to cache repo metadata for %s: %s", yumrepo.id, e)
+
+    @staticmethod
+    def _fetchRepoMetadata(yumrepos, workers, mdcache):
+        """ Download repomd, primary and comps of the repos in parallel.
+
+            :param yumrepos: the repos to download the metadata for
+            :type yumrepos: list of YumRepository
+            :param workers: number of repos downloaded at the same time
+            :type workers: int
+            :param mdcache: cache to take the already known metadata from
+            :type mdcache: MetadataCache
+
+            This runs without _yum_lock, every thread only touches the repo it
+            is downloading.  Errors are only logged here, the repo is retried
+            and its error reported by _getRepoMetadata.
+        """
+        queue = Queue()
+        for yumrepo in yumrepos:
+            queue.put(yumrepo)
+
+        def fetch():
+            while True:
+                try:
+                    yumrepo = queue.get_nowait()
+                except Empty:
+                    return
+
+                log.debug("downloading repo metadata for %s", yumrepo.id)
+                try:
+                    mdcache.restore(yumrepo)
+                    yumrepo.getPrimaryXML()
+                    yumrepo.getGroups()
+                # pylint: disable-msg=W0703
+                except Exception as e:
+                    log.debug("failed to download repo metadata for %s: %s",
+                              yumrepo.id, e)
+
+        threads = []
+        for i in range(min(workers, queue.qsize())):
+            t = threading.Thread(name="AnaRepoMetadataWorker%d" % (i + 1),
+                                 target=fetch)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        for t in threads:
+            t.join()
+
     @property
     def ISOImage(self):
         if not self.data.method.method == "harddrive":
@@ -695,27 +797,19 @@ reposdir=%s
 
         # We need to know which variant is being installed so we know what addons
         # are valid options.
-        try:
-            c = ConfigParser.ConfigParser()
-            ConfigParser.ConfigParser.read(c, treeinfo)
-            variant = c.get("general", "variant")
-        except ConfigParser.Error:
-            return retval
-
-        section = "variant-%s" % variant
-        if c.has_section(section) and c.has_option(section, "addons"):
-            validAddons = c.get(section, "addons").split(",")
-        else:
+        variant = treeinfo.variants.get(treeinfo.variant)
+        if not variant or "addons" not in variant:
             return retval
+        validAddons = variant["addons"].split(",")
         log.debug("Addons found: %s", validAddons)
 
         for addon in validAddons:
-            addonSection = "addon-%s" % addon
-            if not c.has_section(addonSection) or not c.has_option(addonSection, "repository"):
+            options = treeinfo.addons.get(addon)
+            if not options or "repository" not in options:
                 continue
 
-            url = "%s/%s" % (baseurl, c.get(addonSection, "repository"))
-            retval.append((addon, c.get(addonSection, "name"), url))
+            url = "%s/%s" % (baseurl, options["repository"])
+            retval.append((addon, options.get("name"), url))
 
         return retval
 
@@ -821,6 +915,7 @@ reposdir=%s
         # are out of date.  Clear them out now so the next reference to
         # either will cause it to be regenerated.
         self._groups = None
+        self._comps_catalog = None
         self._packages = []
 
     @refresh_base_repo(lambda s, r_id: r_id in BASE_REPO_NAMES)
@@ -835,6 +930,7 @@ reposdir=%s
             with _yum_lock:
                 self._yum.repos.delete(repo_id)
                 self._groups = None
+                self._comps_catalog = None
                 self._packages = []
 
     @refresh_base_repo(lambda s, r_id: r_id in BASE_REPO_NAMES)
@@ -878,79 +974,22 @@ reposdir=%s
                 self._yum.repos.disableRepo(repo_id)
 
             self._groups = None
+            self._comps_catalog = None
             self._packages = []
         super(YumPayload, self).disableRepo(repo_id)
 
     ###
     ### METHODS FOR WORKING WITH ENVIRONMENTS
     ###
-    @property
-    def environments(self):
-        """ List of environment ids. """
-        environments = []
-        yum_groups = self._yumGroups
-        if yum_groups:
-            with _yum_lock:
-                environments = [i.environmentid for i in yum_groups.get_environments()]
-
-        return environments
-
     def environmentSelected(self, environmentid):
-        groups = self._yumGroups
-        if not groups:
-            return False
-
-        with _yum_lock:
-            if not groups.has_environment(environmentid):
-                raise NoSuchGroup(environmentid)
-
-            environment = groups.return_environment(environmentid)
-            for group in environment.groups:
-                if not self.groupSelected(group):
-                    return False
-            return True
-
-    def environmentHasOption(self, environmentid, grpid):
-        groups = self._yumGroups
-        if not groups:
+        environment = self._getEnvironment(environmentid)
+        if not environment:
             return False
 
-        with _yum_lock:
-            if not groups.has_environment(environmentid):
-                raise NoSuchGroup(environmentid)
-
-            environment = groups.return_environment(environmentid)
-            if grpid in environment.options:
-                return True
-        return False
-
-    def environmentOptionIsDefault(self, environmentid, grpid):
-        groups = self._yumGroups
-        if not groups:
-            return False
-
-        with _yum_lock:
-            if not groups.has_environment(environmentid):
-                raise NoSuchGroup(environmentid)
-
-            environment = groups.return_environment(environmentid)
-            if grpid in environment.defaultoptions:
-                return True
-        return False
-
-    def environmentDescription(self, environmentid):
-        """ Return name/description tuple for the environment specified by id. """
-        groups = self._yumGroups
-        if not groups:
-            return (environmentid, environmentid)
-
-        with _yum_lock:
-            if not groups.has_environment(environmentid):
-                raise NoSuchGroup(environmentid)
-
-            environment = groups.return_environment(environmentid)
-
-            return (environment.ui_name, environment.ui_description)
+        for group in environment.groups:
+            if not self.groupSelected(group):
+                return False
+        return True
 
     def selectEnvironment(self, environmentid):
         groups = self._yumGroups
@@ -980,18 +1019,6 @@ reposdir=%s
             for group in environment.options:
                 self.deselectGroup(group)
 
-    def environmentGroups(self, environmentid):
-        groups = self._yumGroups
-        if not groups:
-            return []
-
-        with _yum_lock:
-            if not groups.has_environment(environmentid):
-                raise NoSuchGroup(environmentid)
-
-            environment = groups.return_environment(environmentid)
-            return environment.groups + environment.options
-
     ###
     ### METHODS FOR WORKING WITH GROUPS
     ###
@@ -1010,74 +1037,50 @@ reposdir=%s
         return self._groups
 
     @property
-    def groups(self):
-        """ List of group ids. """
-        groups = []
+    def compsCatalog(self):
+        """ CompsCatalog built from yum's comps, see PackagePayload. """
+        catalog = self._comps_catalog
+        if catalog:
+            return catalog
+
         yum_groups = self._yumGroups
-        if yum_groups:
-            with _yum_lock:
-                groups = [g.groupid for g in yum_groups.get_groups()]
+        if not yum_groups:
+            return None
 
-        return groups
+        with _yum_lock:
+            environments = [CompsEnvironment(env.environmentid, env.ui_name,
+                                             env.ui_description,
+                                             tuple(env.groups), tuple(env.options),
+                                             frozenset(env.defaultoptions))
+                            for env in yum_groups.get_environments()]
+            groups = [CompsGroup(grp.groupid, grp.ui_name, grp.ui_description,
+                                 grp.user_visible,
+                                 bool(grp.mandatory_packages or grp.default_packages),
+                                 grp.langonly)
+                      for grp in yum_groups.get_groups()]
+            catalog = CompsCatalog(environments, groups)
+
+            # don't keep the catalog if the repos changed in the meantime
+            if self._groups is yum_groups:
+                self._comps_catalog = catalog
+
+        return catalog
 
     def languageGroups(self):
-        yum_groups = self._yumGroups
-        if not yum_groups:
+        catalog = self.compsCatalog
+        if not catalog:
             return []
 
         lang_codes = [self.data.lang.lang] + self.data.lang.addsupport
         lang_groups = set()
 
-        with _yum_lock:
-            groups = yum_groups.get_groups()
-            for lang_code in lang_codes:
-                for group in groups:
-                    if langcode_matches_locale(group.langonly, lang_code):
-                        lang_groups.add(group.groupid)
+        for lang_code in lang_codes:
+            for group in catalog.groups():
+                if langcode_matches_locale(group.langonly, lang_code):
+                    lang_groups.add(group.id)
 
         return list(lang_groups)
 
-    def groupDescription(self, groupid):
-        """ Return name/description tuple for the group specified by id. """
-        groups = self._yumGroups
-        if not groups:
-            return (groupid, groupid)
-
-        with _yum_lock:
-            if not groups.has_group(groupid):
-                raise NoSuchGroup(groupid)
-
-            group = groups.return_group(groupid)
-
-            return (group.ui_name, group.ui_description)
-
-    def _isGroupVisible(self, groupid):
-        groups = self._yumGroups
-        if not groups:
-            return False
-
-        with _yum_lock:
-            if not groups.has_group(groupid):
-                return False
-
-            group = groups.return_group(groupid)
-            return group.user_visible
-
-    def _groupHasInstallableMembers(self, groupid):
-        groups = self._yumGroups
-        if not groups:
-            return False
-
-        with _yum_lock:
-            if not groups.has_group(groupid):
-                return False
-
-            group = groups.return_group(groupid)
-            pkgs = group.mandatory_packages.keys() + group.default_packages.keys()
-            if pkgs:
-                return True
-            return False
-
     def _selectYumGroup(self, groupid, default=True, optional=False):
         # select the group in comps
         pkg_types = ['mandatory']
@@ -1389,6 +1392,28 @@ reposdir=%s
         else:
             rpm.addMacro("__file_context_path", "%{nil}")
 
+    @staticmethod
+    def _handleYumTextLine(line, progress, install_errors):
+        """ Handle a line of anaconda-yum's text output.
+
+            anaconda-yum only writes the text protocol if it wasn't given an
+            event channel, anything else (e.g. tracebacks) is just logged.
+        """
+        if line.startswith("PROGRESS_"):
+            key, text = line.split(":", 2)
+            progress.send(_(_yum_progress_map[key]) + text, force=(key != "PROGRESS_INSTALL"))
+        elif line.startswith("DEBUG:"):
+            log.debug(line[6:])
+        elif line.startswith("INFO:"):
+            log.info(line[5:])
+        elif line.startswith("WARN:"):
+            log.warn(line[5:])
+        elif line.startswith("ERROR:"):
+            log.error(line[6:])
+            install_errors.append(line[6:])
+        else:
+            log.debug(line)
+
     def install(self):
         """ Install the payload.
 
@@ -1398,12 +1423,8 @@ reposdir=%s
             It monitors the status of the install and logs debug info, updates
             the progress meter and cleans up when it is done.
         """
-        progress_map = {
-            "PROGRESS_PREP"    : _("Preparing transaction from installation source"),
-            "PROGRESS_INSTALL" : _("Installing"),
-            "PROGRESS_POST"    : _("Performing post-installation setup tasks")
-        }
 
+        since = time.time()
         ts_file = ROOT_PATH+"/anaconda-yum.yumtx"
         with _yum_lock:
             # Save the transaction, this will be loaded and executed by the new
@@ -1416,37 +1437,53 @@ reposdir=%s
             self._yum.close()
 
         script_log = "/tmp/rpm-script.log"
+        timing_report = "/tmp/anaconda-yum-timing.json"
         release = self._getReleaseVersion(None)
 
         args = ["--config", "/tmp/anaconda-yum.conf",
                 "--tsfile", ts_file,
                 "--rpmlog", script_log,
+                "--timing-report", timing_report,
                 "--installroot", ROOT_PATH,
                 "--release", release,
                 "--arch", blivet.arch.getArch()]
 
         log.info("Running anaconda-yum to install packages")
-        # Watch output for progress, debug and error information
+        # Watch the events for progress, debug and error information
         install_errors = []
+        progress = ProgressThrottle(YUM_PROGRESS_INTERVAL)
         try:
-            for line in execReadlines("/usr/libexec/anaconda/anaconda-yum", args):
-                if line.startswith("PROGRESS_"):
-                    key, text = line.split(":", 2)
-                    msg = progress_map[key] + text
-                    progressQ.send_message(msg)
-                    log.debug(msg)
-                elif line.startswith("DEBUG:"):
-                    log.debug(line[6:])
-                elif line.startswith("INFO:"):
-                    log.info(line[5:])
-                elif line.startswith("WARN:"):
-                    log.warn(line[5:])
-                elif line.startswith("ERROR:"):
-                    log.error(line[6:])
-                    install_errors.append(line[6:])
-                else:
-                    log.debug(line)
-        except IOError as e:
+            # anaconda-yum must not keep the reading end open
+            (channel_r, channel_w) = eventchannel.channel_pipe()
+            try:
+                proc = iutil.startProgram(["/usr/libexec/anaconda/anaconda-yum",
+                                           "--channel-fd", str(channel_w)] + args)
+            except OSError:
+                os.close(channel_r)
+                raise
+            finally:
+                os.close(channel_w)
+
+            for (event, data) in read_events(proc, channel_r):
+                if event == eventchannel.EVENT_TEXT:
+                    self._handleYumTextLine(data[0], progress, install_errors)
+                elif event == eventchannel.EVENT_LOG:
+                    (level, msg) = data
+                    log.log(_yum_log_levels.get(level, logging.DEBUG), msg)
+                elif event == eventchannel.EVENT_ERROR:
+                    log.error(data[0])
+                    install_errors.append(data[0])
+                elif event == eventchannel.EVENT_PREP:
+                    progress.send(_("Preparing transaction from installation source"),
+                                  force=True)
+                elif event == eventchannel.EVENT_PKG_START:
+                    (package, index, total, _size) = data
+                    progress.send(_("Installing") + " %s (%d/%d)" % (package, index, total))
+                elif event == eventchannel.EVENT_POST:
+                    progress.send(_("Performing post-installation setup tasks"),
+                                  force=True)
+            progress.flush()
+        except (IOError, OSError) as e:
             log.error("Error running anaconda-yum: %s", e)
             exn = PayloadInstallError(str(e))
             if errorHandler.cb(exn) == ERROR_RAISE:
@@ -1468,6 +1505,8 @@ reposdir=%s
                 progressQ.send_quit(1)
                 sys.exit(1)
 
+        self._recordInitrds(since)
+
     def writeMultiLibConfig(self):
         if not self.data.packages.multiLib:
             return
@@ -1510,6 +1549,7 @@ reposdir=%s
             # remove cache dirs of install-specific repos
             for repo in self._yum.repos.listEnabled():
                 if repo.name == BASE_REPO_NAME or repo.id.startswith("anaconda-"):
+                    self._storeRepoMetadata(repo)
                     shutil.rmtree(repo.cachedir)
 
         self._removeTxSaveFile()
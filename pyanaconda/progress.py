@@ -21,9 +21,11 @@
 import logging
 log = logging.getLogger("anaconda")
 
+import time
 from contextlib import contextmanager
 
 from pyanaconda.queue import QueueFactory
+from pyanaconda.timing import install_phase
 
 # A queue to be used for communicating progress information between a subthread
 # doing all the hard work and the main thread that does the GTK updates.  This
@@ -43,9 +45,104 @@ progressQ.addMessage("quit", 1)             # exit_code
 # Surround a block of code with progress updating.  Before the code runs, the
 # message is updated so the user can tell what's about to take so long.
 # Afterwards, the progress bar is updated to reflect that the task is done.
+# The block is recorded as a phase of the installation profile.
 @contextmanager
 def progress_report(message):
     progressQ.send_message(message)
     log.info(message)
-    yield
+    with install_phase(message):
+        yield
     progressQ.send_step()
+
+class ProgressRate(object):
+    """Track how fast a long running task advances towards its total.
+
+       The rate is smoothed over the samples, so that a single slow or fast
+       sample doesn't make the estimated time left jump around.
+    """
+    def __init__(self, total, smoothing=0.3, clock=None):
+        """
+           :param total: the amount of work (e.g. bytes) to be done
+           :type total: int
+           :param smoothing: weight of the newest sample in the rate
+           :type smoothing: float
+           :param clock: function returning the current time in seconds,
+                         time.time by default
+           :type clock: () -> float
+        """
+        self.total = total
+        self.done = 0
+        self.rate = 0.0
+        self._smoothing = smoothing
+        self._clock = clock or time.time
+        self._last_time = self._clock()
+        self._last_done = 0
+
+    def update(self, done):
+        """Record that done units of work are finished by now."""
+        self.done = done
+
+        # the rate needs some time between the samples
+        now = self._clock()
+        elapsed = now - self._last_time
+        if elapsed <= 0:
+            return
+
+        rate = (done - self._last_done) / elapsed
+        if self.rate:
+            self.rate = self._smoothing * rate + (1 - self._smoothing) * self.rate
+        else:
+            self.rate = rate
+
+        self._last_done = done
+        self._last_time = now
+
+    @property
+    def pct(self):
+        """Percentage of the work done."""
+        if not self.total:
+            return 0
+        return min(100, int(100 * self.done / self.total))
+
+    @property
+    def eta(self):
+        """Estimated number of seconds left or None if not known yet."""
+        if self.rate <= 0:
+            return None
+        return max(0, int((self.total - self.done) / self.rate))
+
+class ProgressThrottle(object):
+    """Limit how often progress messages are sent to the progress queue.
+
+       Only the latest message is kept while the interval since the last
+       sent message has not passed yet.  Messages sent with force (like the
+       start of a new phase) always go out immediately.
+    """
+    def __init__(self, interval, clock=None):
+        """
+           :param interval: minimal number of seconds between two messages
+           :type interval: float
+           :param clock: function returning the current time in seconds,
+                         time.time by default
+           :type clock: () -> float
+        """
+        self._interval = interval
+        self._clock = clock or time.time
+        self._pending = None
+        self._last_sent = None
+
+    def send(self, message, force=False):
+        self._pending = message
+        now = self._clock()
+        if force or self._last_sent is None or now - self._last_sent >= self._interval:
+            self.flush(now)
+
+    def flush(self, now=None):
+        """Send the pending message, if any."""
+        if self._pending is None:
+            return
+
+        progressQ.send_message(self._pending)
+        log.debug(self._pending)
+        self._pending = None
+        self._last_sent = self._clock() if now is None else now
@@ -24,8 +24,28 @@ log = logging.getLogger("anaconda")
 
 import threading
 
+from pyanaconda.timing import monotonic
+
 _WORKER_THREAD_PREFIX = "AnaWorkerThread"
 
+class _TaskTiming(object):
+    """When a thread was added, started its work and finished.
+
+       blocker is the name of the dependency the thread waited for the
+       longest, None if it didn't have to wait.  path is the critical path
+       of the thread (see ThreadManager.critical_path) and path_added the
+       time the first thread on it was added.  They are kept here, because
+       the timings of finished threads are dropped.
+    """
+    def __init__(self, name, dependencies):
+        self.dependencies = dependencies
+        self.added = monotonic()
+        self.started = None
+        self.finished = None
+        self.blocker = None
+        self.path = [name]
+        self.path_added = self.added
+
 class ThreadManager(object):
     """A singleton class for managing threads and processes.
 
@@ -37,11 +57,20 @@ class ThreadManager(object):
        names are unique and meaningful.  This is an okay assumption for us
        to make given that anaconda is only ever going to have a handful of
        special purpose threads.
+
+       AnacondaThreads can depend on other threads by their names, they only
+       start their work when those have finished.  The dependencies have to
+       be added before the threads depending on them, so the dependencies
+       always form an acyclic graph.  When a thread is done, the time it
+       waited, the time it worked and its critical path -- the chain of the
+       dependencies it ended up waiting for -- are logged.  The timing of a
+       finished thread is only kept while a thread still waits for it.
     """
     def __init__(self):
         self._objs = {}
         self._objs_lock = threading.RLock()
         self._errors = {}
+        self._timings = {}
         self._main_thread = threading.current_thread()
 
     def __call__(self):
@@ -58,8 +87,20 @@ class ThreadManager(object):
             if obj.name in self._objs:
                 raise KeyError("Cannot add thread '%s', a thread with the same name already running" % obj.name)
 
+            dependencies = []
+            for dependency in getattr(obj, "depends_on", []):
+                if dependency in self._timings:
+                    dependencies.append(dependency)
+                else:
+                    # like wait(), there is nothing to wait for
+                    log.debug("Thread %s depends on %s which is already done or was never added",
+                              obj.name, dependency)
+            if hasattr(obj, "depends_on"):
+                obj.depends_on = dependencies
+
             self._objs[obj.name] = obj
             self._errors[obj.name] = None
+            self._timings[obj.name] = _TaskTiming(obj.name, dependencies)
             obj.start()
 
         return obj.name
@@ -71,6 +112,69 @@ class ThreadManager(object):
         """
         with self._objs_lock:
             self._objs.pop(name)
+            timing = self._timings.get(name)
+            if timing:
+                timing.finished = monotonic()
+                if timing.started is None:
+                    # no dependencies, started right away
+                    timing.started = timing.added
+
+        if timing:
+            self._log_timing(name, timing)
+            self._prune_timings()
+
+    def _prune_timings(self):
+        """Drop the timings of the finished threads no thread waits for."""
+        with self._objs_lock:
+            waited_for = set()
+            for timing in self._timings.itervalues():
+                if timing.started is None:
+                    waited_for.update(timing.dependencies)
+
+            for (name, timing) in self._timings.items():
+                if timing.finished is not None and name not in waited_for:
+                    del self._timings[name]
+
+    def wait_for_dependencies(self, name):
+        """Wait for the dependencies of the thread to finish and remember
+           which one it waited for the longest.  Errors of the dependencies
+           are re-raised like by wait().
+        """
+        timing = self._timings[name]
+        for dependency in timing.dependencies:
+            self.wait(dependency)
+
+        with self._objs_lock:
+            timing.started = monotonic()
+            finished = [(self._timings[d].finished, d) for d in timing.dependencies
+                        if self._timings[d].finished is not None]
+            if finished:
+                (last, blocker) = max(finished)
+                if last > timing.added:
+                    timing.blocker = blocker
+                    blocker_timing = self._timings[blocker]
+                    timing.path = blocker_timing.path + [name]
+                    timing.path_added = blocker_timing.path_added
+
+            self._prune_timings()
+
+    def critical_path(self, name):
+        """Return the names of the threads on the critical path of a thread
+           that is still known, ending with the thread itself.
+        """
+        with self._objs_lock:
+            return list(self._timings[name].path)
+
+    def _log_timing(self, name, timing):
+        path = timing.path
+        length = timing.finished - timing.path_added
+
+        if timing.blocker:
+            log.debug("Thread %s waited %.2f s for %s, worked %.2f s, critical path %s: %.2f s",
+                      name, timing.started - timing.added, timing.blocker,
+                      timing.finished - timing.started, " -> ".join(path), length)
+        else:
+            log.debug("Thread %s worked %.2f s", name, timing.finished - timing.started)
 
     def exists(self, name):
         """Determine if a thread or process exists with the given name."""
@@ -192,6 +296,9 @@ class AnacondaThread(threading.Thread):
 
        (3) All created threads are made daemonic, which means anaconda will quit
            when the main process is killed.
+
+       (4) Wait for the threads given by name in the depends_on keyword
+           argument before running the target.
     """
 
     # class-wide dictionary ensuring unique thread names
@@ -214,6 +321,8 @@ class AnacondaThread(threading.Thread):
         else:
             self._fatal = True
 
+        self.depends_on = list(kwargs.pop("depends_on", []))
+
         threading.Thread.__init__(self, *args, **kwargs)
         self.daemon = True
 
@@ -223,6 +332,9 @@ class AnacondaThread(threading.Thread):
 
         log.info("Running Thread: %s (%s)", self.name, self.ident)
         try:
+            if self.depends_on:
+                log.debug("Thread %s waiting for %s", self.name, ", ".join(self.depends_on))
+                threadMgr.wait_for_dependencies(self.name)
             threading.Thread.run(self, *args, **kwargs)
         # pylint: disable-msg=W0702
         except:
@@ -0,0 +1,273 @@
+#
+# timing.py: profile of the phases of an installation
+#
+# Copyright (C) 2015  Red Hat, Inc.  All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+    Where the time of an installation goes.  Every progress_report block and
+    every payload phase is recorded as a phase of the installation profile:
+    its start and end on the monotonic clock, the CPU time used by anaconda
+    and by the programs it waited for and the I/O counters of /proc/self/io.
+    A phase started while another one is running in the same thread is
+    nested under it.
+
+    The CPU times and I/O counters are those of the whole process, there are
+    no per-thread ones for the programs anaconda runs.  Phases of different
+    threads that overlap are marked as concurrent, their numbers include the
+    work of each other.
+
+    The profile is written as a JSON timeline and as a trace in the format of
+    the Chrome trace viewer (chrome://tracing), which other trace viewers can
+    load as well.  Both go to /tmp and to /var/log/anaconda of the installed
+    system.
+"""
+
+import os
+import json
+import time
+import ctypes
+import threading
+from contextlib import contextmanager
+
+from pyanaconda.constants import ROOT_PATH
+
+import logging
+log = logging.getLogger("anaconda")
+
+TIMING_FILENAME = "anaconda.timing.json"
+TRACE_FILENAME = "anaconda.timing-trace.json"
+TIMING_TMP_DIR = "/tmp"
+TIMING_LOG_DIR = "/var/log/anaconda"
+
+_CLOCK_MONOTONIC = 1
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+try:
+    _clock_gettime = ctypes.CDLL("librt.so.1", use_errno=True).clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+except (OSError, AttributeError):
+    _clock_gettime = None
+
+def monotonic():
+    """Return the seconds on a clock that never goes back.
+
+       The system time is changed during the installation (NTP, the time
+       spoke), so it can't be used for durations.  time.time() is only used
+       if clock_gettime is not available.
+    """
+    if _clock_gettime is None:
+        return time.time()
+
+    ts = _timespec()
+    if _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+def cpu_times():
+    """Return a dict of the CPU seconds used by anaconda and its children."""
+    t = os.times()
+    return {"user": t[0], "system": t[1],
+            "children_user": t[2], "children_system": t[3]}
+
+def io_counters(path="/proc/self/io"):
+    """Return a dict of the I/O counters of anaconda.
+
+       The counters include the programs anaconda waited for.  An empty dict
+       is returned if the kernel doesn't provide them.
+    """
+    counters = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                (key, _sep, value) = line.partition(":")
+                try:
+                    counters[key.strip()] = int(value)
+                except ValueError:
+                    continue
+    except IOError:
+        pass
+
+    return counters
+
+def _delta(before, after):
+    return dict((key, after[key] - before[key]) for key in after if key in before)
+
+class Phase(object):
+    """One phase of the installation.
+
+       start and end are seconds since the profile started, end is None while
+       the phase is running.  cpu and io are the differences of cpu_times() and
+       io_counters() over the phase, they are process-wide: concurrent is True
+       if a phase of another thread ran at the same time, whose work is then
+       included.  parent is the index of the phase this one is nested under or
+       None.
+    """
+    def __init__(self, name, thread, parent, depth, start):
+        self.name = name
+        self.thread = thread
+        self.parent = parent
+        self.depth = depth
+        self.start = start
+        self.end = None
+        self.cpu = {}
+        self.io = {}
+        self.failed = False
+        self.concurrent = False
+
+    @property
+    def duration(self):
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def asdict(self):
+        return {"name": self.name, "thread": self.thread,
+                "parent": self.parent, "depth": self.depth,
+                "start": self.start, "end": self.end,
+                "duration": self.duration, "cpu": self.cpu, "io": self.io,
+                "failed": self.failed, "concurrent": self.concurrent}
+
+class InstallProfile(object):
+    """The phases of an installation in the order they were started."""
+    def __init__(self):
+        self.started = time.time()
+        self._origin = monotonic()
+        self._phases = []
+        self._lock = threading.Lock()
+        # stacks of the indices of the running phases by thread ident
+        self._running = {}
+
+    @property
+    def phases(self):
+        with self._lock:
+            return list(self._phases)
+
+    @contextmanager
+    def phase(self, name):
+        """Record the block of code as a phase called name."""
+        thread = threading.current_thread()
+
+        with self._lock:
+            stack = self._running.setdefault(thread.ident, [])
+            index = len(self._phases)
+            phase = Phase(name, thread.name,
+                          stack[-1] if stack else None, len(stack),
+                          monotonic() - self._origin)
+            self._phases.append(phase)
+
+            for (ident, running) in self._running.items():
+                if ident != thread.ident and running:
+                    phase.concurrent = True
+                    for i in running:
+                        self._phases[i].concurrent = True
+            stack.append(index)
+
+        cpu = cpu_times()
+        io = io_counters()
+        try:
+            yield phase
+        # pylint: disable-msg=W0702
+        except:
+            phase.failed = True
+            raise
+        finally:
+            with self._lock:
+                stack.pop()
+                if not stack:
+                    del self._running[thread.ident]
+            phase.io = _delta(io, io_counters())
+            phase.cpu = _delta(cpu, cpu_times())
+            phase.end = monotonic() - self._origin
+            log.debug("phase %s took %.3f s", name, phase.duration)
+
+    def timeline(self):
+        """Return the profile as a dict that can be serialized as JSON."""
+        return {"started": self.started,
+                "clock": "monotonic" if _clock_gettime else "time",
+                "phases": [p.asdict() for p in self.phases]}
+
+    def chrome_trace(self):
+        """Return the profile in the Chrome trace event format.
+
+           Every phase is a complete event, the timestamps are microseconds
+           since the profile started.  Phases still running end now.
+        """
+        pid = os.getpid()
+        now = monotonic() - self._origin
+        tids = {}
+        events = []
+        for phase in self.phases:
+            if phase.thread not in tids:
+                tids[phase.thread] = len(tids) + 1
+                events.append({"name": "thread_name", "ph": "M", "pid": pid,
+                               "tid": tids[phase.thread],
+                               "args": {"name": phase.thread}})
+
+            end = phase.end if phase.end is not None else now
+            args = dict(("cpu_" + key, value) for (key, value) in phase.cpu.items())
+            args.update(("io_" + key, value) for (key, value) in phase.io.items())
+            if phase.failed:
+                args["failed"] = True
+            if phase.concurrent:
+                args["concurrent"] = True
+            events.append({"name": phase.name, "cat": "install", "ph": "X",
+                           "pid": pid, "tid": tids[phase.thread],
+                           "ts": int(phase.start * 1e6),
+                           "dur": int((end - phase.start) * 1e6),
+                           "args": args})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"started": self.started}}
+
+    def write(self, directory):
+        """Write the timeline and the trace into directory."""
+        for (filename, data) in ((TIMING_FILENAME, self.timeline()),
+                                 (TRACE_FILENAME, self.chrome_trace())):
+            path = os.path.join(directory, filename)
+            with open(path + ".new", "w") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.chmod(path + ".new", 0600)
+            os.rename(path + ".new", path)
+
+# the profile of this installation
+install_profile = InstallProfile()
+
+def install_phase(name):
+    """Record the block of code as a phase of the installation profile."""
+    return install_profile.phase(name)
+
+def write_install_profile(root=ROOT_PATH):
+    """Write the installation profile to /tmp and, if root is given, to the
+       log directory of the installed system.  Failures are only logged, the
+       profile is not worth failing the installation for.
+    """
+    directories = [TIMING_TMP_DIR]
+    if root and os.path.isdir(root):
+        directories.append(os.path.normpath(root + TIMING_LOG_DIR))
+
+    for directory in directories:
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0700)
+            install_profile.write(directory)
+        except (IOError, OSError) as e:
+            log.error("failed to write the installation profile to %s: %s", directory, e)
+        else:
+            log.info("installation profile written to %s", directory)
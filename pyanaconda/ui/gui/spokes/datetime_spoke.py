@@ -132,6 +132,11 @@ class NTPconfigDialog(GUIObject):
 
         return None
 
+    @property
+    def working_servers(self):
+        return [row[0] for row in self._serversStore
+                if row[1] == SERVER_OK and row[2]]
+
     @property
     def servers(self):
         ret = list()
@@ -170,24 +175,30 @@ class NTPconfigDialog(GUIObject):
         self._serversStore.clear()
 
         if self.data.timezone.ntpservers:
-            for server in self.data.timezone.ntpservers:
-                self._add_server(server)
+            servers = self.data.timezone.ntpservers
         else:
             try:
-                for server in ntp.get_servers_from_config():
-                    self._add_server(server)
+                servers = ntp.get_servers_from_config()
             except ntp.NTPconfigError:
                 log.warning("Failed to load NTP servers configuration")
+                servers = []
+
+        #probe all the servers together
+        itrs = [self._add_server(server, refresh=False) for server in servers]
+        self._refresh_servers_working([itr for itr in itrs if itr is not None])
 
     def refresh(self):
         self._serverEntry.grab_focus()
 
     def refresh_servers_state(self):
+        itrs = []
         itr = self._serversStore.get_iter_first()
         while itr:
-            self._refresh_server_working(itr)
+            itrs.append(itr)
             itr = self._serversStore.iter_next(itr)
 
+        self._refresh_servers_working(itrs)
+
     def run(self):
         self.window.show()
         rc = self.window.run()
@@ -216,12 +227,12 @@ class NTPconfigDialog(GUIObject):
 
         return rc
 
-    def _set_server_ok_nok(self, itr, epoch_started):
+    def _set_servers_ok_nok(self, itrs, epoch_started):
         """
-        If the server is working, set its data to SERVER_OK, otherwise set its
-        data to SERVER_NOK.
+        Probe all the servers at once. If a server is working, set its data to
+        SERVER_OK, otherwise set its data to SERVER_NOK.
 
-        :param itr: iterator of the $server's row in the self._serversStore
+        :param itrs: iterators of the servers' rows in the self._serversStore
 
         """
 
@@ -239,8 +250,8 @@ class NTPconfigDialog(GUIObject):
             (store, itr, column, value) = arg_tuple
             store.set_value(itr, column, value)
 
-        orig_hostname = self._serversStore[itr][0]
-        server_working = ntp.ntp_server_working(self._serversStore[itr][0])
+        orig_hostnames = [self._serversStore[itr][0] for itr in itrs]
+        measurements = ntp.probe_servers(orig_hostnames)
 
         #do not let dialog change epoch while we are modifying data
         self._epoch_lock.acquire()
@@ -248,49 +259,59 @@ class NTPconfigDialog(GUIObject):
         #check if we are in the same epoch as the dialog (and the serversStore)
         #and if the server wasn't changed meanwhile
         if epoch_started == self._epoch:
-            actual_hostname = self._serversStore[itr][0]
-
-            if orig_hostname == actual_hostname:
-                if server_working:
-                    set_store_value((self._serversStore,
-                                    itr, 1, SERVER_OK))
-                else:
-                    set_store_value((self._serversStore,
-                                    itr, 1, SERVER_NOK))
+            for (itr, orig_hostname) in zip(itrs, orig_hostnames):
+                actual_hostname = self._serversStore[itr][0]
+
+                if orig_hostname == actual_hostname:
+                    if measurements[orig_hostname] is not None:
+                        set_store_value((self._serversStore,
+                                        itr, 1, SERVER_OK))
+                    else:
+                        set_store_value((self._serversStore,
+                                        itr, 1, SERVER_NOK))
         self._epoch_lock.release()
 
     @gtk_action_nowait
-    def _refresh_server_working(self, itr):
-        """ Runs a new thread with _set_server_ok_nok(itr) as a taget. """
+    def _refresh_servers_working(self, itrs):
+        """ Runs a new thread with _set_servers_ok_nok(itrs) as a taget. """
 
-        self._serversStore.set_value(itr, 1, SERVER_QUERY)
+        if not itrs:
+            return
+
+        for itr in itrs:
+            self._serversStore.set_value(itr, 1, SERVER_QUERY)
         threadMgr.add(AnacondaThread(prefix="AnaNTPserver",
-                                     target=self._set_server_ok_nok,
-                                     args=(itr, self._epoch)))
+                                     target=self._set_servers_ok_nok,
+                                     args=(itrs, self._epoch)))
 
-    def _add_server(self, server):
+    def _add_server(self, server, refresh=True):
         """
         Checks if a given server is a valid hostname and if yes, adds it
         to the list of servers.
 
         :param server: string containing hostname
+        :param refresh: whether to check if the server is working
+        :return: iterator of the added row or None if nothing was added
 
         """
 
         (valid, error) = network.sanityCheckHostname(server)
         if not valid:
             log.error("'%s' is not a valid hostname: %s", server, error)
-            return
+            return None
 
         for row in self._serversStore:
             if row[0] == server:
                 #do not add duplicate items
-                return
+                return None
 
         itr = self._serversStore.append([server, SERVER_QUERY, True])
 
-        #do not block UI while starting thread (may take some time)
-        self._refresh_server_working(itr)
+        if refresh:
+            #do not block UI while starting thread (may take some time)
+            self._refresh_servers_working([itr])
+
+        return itr
 
     def on_entry_activated(self, entry, *args):
         self._add_server(entry.get_text())
@@ -323,7 +344,7 @@ class NTPconfigDialog(GUIObject):
         self._serversStore.set_value(itr, 0, new_text)
         self._serversStore.set_value(itr, 1, SERVER_QUERY)
 
-        self._refresh_server_working(itr)
+        self._refresh_servers_working([itr])
 
 class DatetimeSpoke(FirstbootSpokeMixIn, NormalSpoke):
     builderObjects = ["datetimeWindow",
@@ -993,13 +1014,13 @@ class DatetimeSpoke(FirstbootSpokeMixIn, NormalSpoke):
             else:
                 self.clear_info()
 
-                working_server = self._config_dialog.working_server
-                if working_server is None:
+                working_servers = self._config_dialog.working_servers
+                if not working_servers:
                     self._show_no_ntp_server_warning()
                 else:
                     #we need a one-time sync here, because chronyd would not change
                     #the time as drastically as we need
-                    ntp.one_time_sync_async(working_server)
+                    ntp.one_time_sync_async(working_servers)
 
             ret = iutil.start_service(NTP_SERVICE)
             self._set_date_time_setting_sensitive(False)
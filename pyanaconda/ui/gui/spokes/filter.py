@@ -19,6 +19,7 @@
 # Red Hat Author(s): Chris Lumens <clumens@redhat.com>
 #
 
+from bisect import bisect_left
 from collections import namedtuple
 import itertools
 
@@ -30,6 +31,7 @@ from pyanaconda.flags import flags
 from pyanaconda.i18n import CN_, CP_
 
 from pyanaconda.ui.lib.disks import getDisks, isLocalDisk
+from pyanaconda.ui.lib.diskcatalog import DiskCatalog
 from pyanaconda.ui.gui.utils import enlightbox
 from pyanaconda.ui.gui.spokes import NormalSpoke
 from pyanaconda.ui.gui.spokes.advstorage.fcoe import FCoEDialog
@@ -37,6 +39,9 @@ from pyanaconda.ui.gui.spokes.advstorage.iscsi import ISCSIDialog
 from pyanaconda.ui.gui.spokes.lib.cart import SelectedDisksDialog
 from pyanaconda.ui.gui.categories.system import SystemCategory
 
+import logging
+log = logging.getLogger("anaconda")
+
 __all__ = ["FilterSpoke"]
 
 DiskStoreRow = namedtuple("DiskStoreRow", ["visible", "selected", "mutable",
@@ -44,6 +49,8 @@ DiskStoreRow = namedtuple("DiskStoreRow", ["visible", "selected", "mutable",
                                            "vendor", "interconnect", "serial",
                                            "wwid", "paths", "port", "target",
                                            "lun", "ccw"])
+NAME_COLUMN = DiskStoreRow._fields.index("name")
+SELECTED_COLUMN = DiskStoreRow._fields.index("selected")
 
 class FilterPage(object):
     """A FilterPage is the logic behind one of the notebook tabs on the filter
@@ -60,23 +67,28 @@ class FilterPage(object):
        more specialized type of page.  Only one instance of each subclass should
        ever be created.
     """
-    def __init__(self, storage, builder):
+    def __init__(self, storage, builder, catalog):
         """Create a new FilterPage instance.
 
            Instance attributes:
 
            builder      -- A reference to the Gtk.Builder instance containing
                            this page's UI elements.
+           catalog      -- The DiskCatalog of all disks, shared by all pages.
            filterActive -- Whether the user has chosen to filter results down
-                           on this page.  If set, visible_func should take the
+                           on this page.  If set, filter_names should take the
                            filter UI elements into account.
+           members      -- The set of names of the disks on this page.
            storage      -- An instance of a blivet object.
         """
         self.builder = builder
         self.storage = storage
+        self.catalog = catalog
         self.model = None
 
         self.filterActive = False
+        self.members = set()
+        self._matches = None
 
     def ismember(self, device):
         """Does device belong on this page?  This function should taken into
@@ -96,29 +108,54 @@ class FilterPage(object):
            or via kickstart), and a list of all disk objects that belong on this
            page as determined from the ismember method.
 
-           At the least, this method should add all the disks to the store.  It
-           may also need to populate combos and other lists as appropriate.
+           The rows of the disks are added to the store by the spoke, see the
+           row method.  This method should populate combos and other lists as
+           appropriate.
         """
         pass
 
+    def row(self, disk, selected):
+        """Return the list of column values of disk's row in the master store,
+           or None if this page doesn't add a row for disk.  selected is
+           whether the user has selected the disk.
+        """
+        return None
+
     def clear(self):
         """Blank out any filtering-related fields on this page and return them
            to their defaults.  This is called when the Clear button is clicked.
         """
         pass
 
+    def filter_names(self):
+        """Return the set of names of the disks matching the filter UI elements
+           on this page.  This is only called when filterActive is set and
+           should answer from the catalog, not by looking at every disk.
+        """
+        return self.catalog.names
+
+    def refilter(self):
+        """Apply the current state of the filter UI elements to the model.
+           The matching disks are looked up once here, so visible_func only
+           needs to check a set for every row.
+        """
+        if self.filterActive:
+            self._matches = self.filter_names()
+        else:
+            self._matches = None
+
+        self.model.refilter()
+
     def visible_func(self, model, itr, *args):
         """This method is called for every row (disk) in the store, in order to
-           determine if it should be displayed on this page or not.  This method
-           should take into account whether filterActive is set, perhaps whether
-           something in pyanaconda.flags is setup, and other settings to make
-           a final decision.  Because filtering can be complicated, many pages
-           will want to farm this decision out to another method.
+           determine if it should be displayed on this page or not.  Pages may
+           override it to also take something in pyanaconda.flags into account.
 
            The return value is a boolean indicating whether the row is visible
            or not.
         """
-        return True
+        name = model[itr][NAME_COLUMN]
+        return name in self.members and (self._matches is None or name in self._matches)
 
     def setupCombo(self, combo, items):
         """Populate a given GtkComboBoxText instance with a list of items.  The
@@ -133,8 +170,8 @@ class FilterPage(object):
             combo.set_active(0)
 
 class SearchPage(FilterPage):
-    def __init__(self, storage, builder):
-        FilterPage.__init__(self, storage, builder)
+    def __init__(self, storage, builder, catalog):
+        FilterPage.__init__(self, storage, builder, catalog)
         self.model = self.builder.get_object("searchModel")
         self.model.set_visible_func(self.visible_func)
 
@@ -149,10 +186,11 @@ class SearchPage(FilterPage):
         self._combo.set_active(0)
         self._combo.emit("changed")
 
-        ports = []
-        for disk in disks:
-            if hasattr(disk, "node"):
-                ports.append(str(disk.node.port))
+        ports = set()
+        for name in self.members:
+            port = self.catalog.get(name).port
+            if port is not None:
+                ports.add(port)
 
         self.setupCombo(self.builder.get_object("searchPortCombo"), ports)
 
@@ -162,53 +200,48 @@ class SearchPage(FilterPage):
         self._targetEntry.set_text("")
         self._wwidEntry.set_text("")
 
-    def _port_equal(self, device):
+    def _port_equal(self):
+        # Disks without a port (not iSCSI) are not filtered out.
         active = self._portCombo.get_active_text()
-        if active and hasattr(device, "node"):
-            return device.node.port == active
+        if active:
+            return self.catalog.match("port", active) | self.catalog.match("port", None)
         else:
-            return True
+            return self.catalog.names
 
-    def _target_equal(self, device):
+    def _target_equal(self):
         active = self._targetEntry.get_text().strip()
         if active:
-            return active in getattr(device, "initiator", "")
+            return self.catalog.search("target", active)
         else:
-            return True
+            return self.catalog.names
 
-    def _lun_equal(self, device):
+    def _lun_equal(self):
         active = self._lunEntry.get_text().strip()
-        if active and hasattr(device, "node"):
+        if active:
             try:
-                return int(active) == device.node.tpgt
+                lun = str(int(active))
             except ValueError:
-                return True
-        else:
-            return True
+                return self.catalog.names
 
-    def _filter_func(self, device):
-        if not self.filterActive:
-            return True
+            return self.catalog.match("lun", lun) | self.catalog.match("lun", None)
+        else:
+            return self.catalog.names
 
+    def filter_names(self):
         filterBy = self._combo.get_active()
 
-        if filterBy == 0:
-            return True
-        elif filterBy == 1:
-            return self._port_equal(device) and self._target_equal(device) and self._lun_equal(device)
+        if filterBy == 1:
+            return self._port_equal() & self._target_equal() & self._lun_equal()
         elif filterBy == 2:
-            return hasattr(device, "wwid") and self._wwidEntry.get_text() in device.wwid
+            return self.catalog.search("wwid", self._wwidEntry.get_text())
         elif filterBy == 3:
-            return hasattr(device, "fcp_lun") and self._lunEntry.get_text() in device.fcp_lun
-
-    def visible_func(self, model, itr, *args):
-        obj = DiskStoreRow(*model[itr])
-        device = self.storage.devicetree.getDeviceByName(obj.name, hidden=True)
-        return self._filter_func(device)
+            return self.catalog.search("fcp_lun", self._lunEntry.get_text())
+        else:
+            return self.catalog.names
 
 class MultipathPage(FilterPage):
-    def __init__(self, storage, builder):
-        FilterPage.__init__(self, storage, builder)
+    def __init__(self, storage, builder, catalog):
+        FilterPage.__init__(self, storage, builder, catalog)
         self.model = self.builder.get_object("multipathModel")
         self.model.set_visible_func(self.visible_func)
 
@@ -220,24 +253,17 @@ class MultipathPage(FilterPage):
     def ismember(self, device):
         return isinstance(device, MultipathDevice)
 
-    def setup(self, store, selectedNames, disks):
-        vendors = []
-        interconnects = []
-
-        for disk in disks:
-            paths = [d.name for d in disk.parents]
-            selected = disk.name in selectedNames
-
-            store.append([True, selected, not disk.protected,
-                          disk.name, "", disk.model, str(disk.size),
-                          disk.vendor, disk.bus, disk.serial,
-                          disk.wwid, "\n".join(paths), "", "",
-                          "", ""])
-            if not disk.vendor in vendors:
-                vendors.append(disk.vendor)
+    def row(self, disk, selected):
+        paths = [d.name for d in disk.parents]
+        return [True, selected, not disk.protected,
+                disk.name, "", disk.model, str(disk.size),
+                disk.vendor, disk.bus, disk.serial,
+                disk.wwid, "\n".join(paths), "", "",
+                "", ""]
 
-            if not disk.bus in interconnects:
-                interconnects.append(disk.bus)
+    def setup(self, store, selectedNames, disks):
+        vendors = set(disk.vendor for disk in disks)
+        interconnects = set(disk.bus for disk in disks)
 
         self._combo.set_active(0)
         self._combo.emit("changed")
@@ -250,32 +276,27 @@ class MultipathPage(FilterPage):
         self._vendorCombo.set_active(0)
         self._wwidEntry.set_text("")
 
-    def _filter_func(self, device):
-        if not self.filterActive:
-            return True
-
+    def filter_names(self):
         filterBy = self._combo.get_active()
 
-        if filterBy == 0:
-            return True
-        elif filterBy == 1:
-            return device.vendor == self._vendorCombo.get_active_text()
+        if filterBy == 1:
+            return self.catalog.match("vendor", self._vendorCombo.get_active_text())
         elif filterBy == 2:
-            return device.bus == self._icCombo.get_active_text()
+            return self.catalog.match("interconnect", self._icCombo.get_active_text())
         elif filterBy == 3:
-            return self._wwidEntry.get_text() in device.wwid
+            return self.catalog.search("wwid", self._wwidEntry.get_text())
+        else:
+            return self.catalog.names
 
     def visible_func(self, model, itr, *args):
         if not flags.mpath:
             return False
 
-        obj = DiskStoreRow(*model[itr])
-        device = self.storage.devicetree.getDeviceByName(obj.name, hidden=True)
-        return self.ismember(device) and self._filter_func(device)
+        return FilterPage.visible_func(self, model, itr, *args)
 
 class OtherPage(FilterPage):
-    def __init__(self, storage, builder):
-        FilterPage.__init__(self, storage, builder)
+    def __init__(self, storage, builder, catalog):
+        FilterPage.__init__(self, storage, builder, catalog)
         self.model = self.builder.get_object("otherModel")
         self.model.set_visible_func(self.visible_func)
 
@@ -299,31 +320,23 @@ class OtherPage(FilterPage):
 
         return disk.name
 
-    def setup(self, store, selectedNames, disks):
-        vendors = []
-        interconnects = []
-
-        for disk in disks:
-            selected = disk.name in selectedNames
-
-            if hasattr(disk, "node"):
-                port = str(disk.node.port)
-                lun = str(disk.node.tpgt)
-            else:
-                port = ""
-                lun = ""
-
-            store.append([True, selected, not disk.protected,
-                          disk.name, "", disk.model, str(disk.size),
-                          disk.vendor, disk.bus, disk.serial,
-                          self._long_identifier(disk), "", port, getattr(disk, "initiator", ""),
-                          lun, ""])
+    def row(self, disk, selected):
+        if hasattr(disk, "node"):
+            port = str(disk.node.port)
+            lun = str(disk.node.tpgt)
+        else:
+            port = ""
+            lun = ""
 
-            if not disk.vendor in vendors:
-                vendors.append(disk.vendor)
+        return [True, selected, not disk.protected,
+                disk.name, "", disk.model, str(disk.size),
+                disk.vendor, disk.bus, disk.serial,
+                self._long_identifier(disk), "", port, getattr(disk, "initiator", ""),
+                lun, ""]
 
-            if not disk.bus in interconnects:
-                interconnects.append(disk.bus)
+    def setup(self, store, selectedNames, disks):
+        vendors = set(disk.vendor for disk in disks)
+        interconnects = set(disk.bus for disk in disks)
 
         self._combo.set_active(0)
         self._combo.emit("changed")
@@ -336,33 +349,21 @@ class OtherPage(FilterPage):
         self._idEntry.set_text("")
         self._vendorCombo.set_active(0)
 
-    def _filter_func(self, device):
-        if not self.filterActive:
-            return True
-
+    def filter_names(self):
         filterBy = self._combo.get_active()
 
-        if filterBy == 0:
-            return True
-        elif filterBy == 1:
-            return device.vendor == self._vendorCombo.get_active_text()
+        if filterBy == 1:
+            return self.catalog.match("vendor", self._vendorCombo.get_active_text())
         elif filterBy == 2:
-            return device.bus == self._icCombo.get_active_text()
+            return self.catalog.match("interconnect", self._icCombo.get_active_text())
         elif filterBy == 3:
-            for link in device.deviceLinks:
-                if "by-path" in link:
-                    return self._idEntry.get_text().strip() in link
-
-            return False
-
-    def visible_func(self, model, itr, *args):
-        obj = DiskStoreRow(*model[itr])
-        device = self.storage.devicetree.getDeviceByName(obj.name, hidden=True)
-        return self.ismember(device) and self._filter_func(device)
+            return self.catalog.search("path", self._idEntry.get_text().strip())
+        else:
+            return self.catalog.names
 
 class RaidPage(FilterPage):
-    def __init__(self, storage, builder):
-        FilterPage.__init__(self, storage, builder)
+    def __init__(self, storage, builder, catalog):
+        FilterPage.__init__(self, storage, builder, catalog)
         self.model = self.builder.get_object("raidModel")
         self.model.set_visible_func(self.visible_func)
 
@@ -373,13 +374,11 @@ class RaidPage(FilterPage):
         if not flags.dmraid:
             return False
 
-        obj = DiskStoreRow(*model[itr])
-        device = self.storage.devicetree.getDeviceByName(obj.name, hidden=True)
-        return self.ismember(device)
+        return FilterPage.visible_func(self, model, itr, *args)
 
 class ZPage(FilterPage):
-    def __init__(self, storage, builder):
-        FilterPage.__init__(self, storage, builder)
+    def __init__(self, storage, builder, catalog):
+        FilterPage.__init__(self, storage, builder, catalog)
         self.model = self.builder.get_object("zModel")
         self.model.set_visible_func(self.visible_func)
 
@@ -392,11 +391,6 @@ class ZPage(FilterPage):
         if not self._isS390:
             return
 
-    def visible_func(self, model, itr, *args):
-        obj = DiskStoreRow(*model[itr])
-        device = self.storage.devicetree.getDeviceByName(obj.name, hidden=True)
-        return self.ismember(device)
-
 class FilterSpoke(NormalSpoke):
     builderObjects = ["diskStore", "filterWindow",
                       "searchModel", "multipathModel", "otherModel", "raidModel", "zModel"]
@@ -411,10 +405,15 @@ class FilterSpoke(NormalSpoke):
         NormalSpoke.__init__(self, *args)
         self.applyOnSkip = True
 
-        self.ancestors = []
         self.disks = []
         self.selected_disks = []
 
+        self._catalog = DiskCatalog()
+        # name -> row values of the disks in the store, sorted by name like
+        # the store itself
+        self._rows = {}
+        self._rowNames = []
+
     @property
     def indirect(self):
         return True
@@ -426,9 +425,12 @@ class FilterSpoke(NormalSpoke):
 
     def apply(self):
         onlyuse = self.selected_disks[:]
-        for disk in [d for d in self.storage.disks if d.name in onlyuse]:
-            onlyuse.extend([d.name for d in disk.ancestors
-                                        if d.name not in onlyuse])
+        seen = set(onlyuse)
+        for disk in [d for d in self.storage.disks if d.name in seen]:
+            for d in disk.ancestors:
+                if d.name not in seen:
+                    onlyuse.append(d.name)
+                    seen.add(d.name)
 
         self.data.ignoredisk.onlyuse = onlyuse
         self.data.clearpart.drives = self.selected_disks[:]
@@ -436,11 +438,11 @@ class FilterSpoke(NormalSpoke):
     def initialize(self):
         NormalSpoke.initialize(self)
 
-        self.pages = [SearchPage(self.storage, self.builder),
-                      MultipathPage(self.storage, self.builder),
-                      OtherPage(self.storage, self.builder),
-                      RaidPage(self.storage, self.builder),
-                      ZPage(self.storage, self.builder)]
+        self.pages = [SearchPage(self.storage, self.builder, self._catalog),
+                      MultipathPage(self.storage, self.builder, self._catalog),
+                      OtherPage(self.storage, self.builder, self._catalog),
+                      RaidPage(self.storage, self.builder, self._catalog),
+                      ZPage(self.storage, self.builder, self._catalog)]
 
         self._notebook = self.builder.get_object("advancedNotebook")
 
@@ -454,22 +456,41 @@ class FilterSpoke(NormalSpoke):
         self._store = self.builder.get_object("diskStore")
         self._addDisksButton = self.builder.get_object("addDisksButton")
 
-    def _real_ancestors(self, disk):
-        # Return a list of all the ancestors of a disk, but remove the disk
-        # itself from this list.
-        return [d for d in disk.ancestors if d.name != disk.name]
+    def _update_rows(self, rows):
+        """Bring the store in line with rows, a dict of disk names to row
+           values.  Only the rows that appeared, disappeared or changed are
+           touched, so the views don't have to filter all the rows again.
+        """
+        for name in [n for n in self._rows if n not in rows]:
+            i = bisect_left(self._rowNames, name)
+            self._store.remove(self._store.get_iter((i,)))
+            del self._rowNames[i]
+            del self._rows[name]
+
+        for (name, row) in rows.items():
+            if self._rows.get(name) == row:
+                continue
+
+            i = bisect_left(self._rowNames, name)
+            if name in self._rows:
+                self._store[self._store.get_iter((i,))] = row
+            else:
+                self._store.insert(i, row)
+                self._rowNames.insert(i, name)
+            self._rows[name] = row
 
     def refresh(self):
         NormalSpoke.refresh(self)
 
         self.disks = getDisks(self.storage.devicetree)
         self.selected_disks = self.data.ignoredisk.onlyuse[:]
+        selected = set(self.selected_disks)
 
-        self.ancestors = itertools.chain(*map(self._real_ancestors, self.disks))
-        self.ancestors = map(lambda d: d.name, self.ancestors)
-
-        self._store.clear()
+        (added, removed) = self._catalog.update(self.disks)
+        log.debug("filter: %d disks, %d added, %d removed",
+                  len(self._catalog), len(added - removed), len(removed - added))
 
+        rows = {}
         allDisks = []
         multipathDisks = []
         otherDisks = []
@@ -482,22 +503,33 @@ class FilterSpoke(NormalSpoke):
         # because there could be page-specific setup to do that requires a complete
         # view of all the disks on that page.
         for disk in itertools.ifilterfalse(isLocalDisk, self.disks):
+            page = None
             if self.pages[1].ismember(disk):
                 multipathDisks.append(disk)
+                page = self.pages[1]
             elif self.pages[2].ismember(disk):
                 otherDisks.append(disk)
+                page = self.pages[2]
             elif self.pages[3].ismember(disk):
                 raidDisks.append(disk)
+                page = self.pages[3]
             elif self.pages[4].ismember(disk):
                 zDisks.append(disk)
+                page = self.pages[4]
 
             allDisks.append(disk)
 
-        self.pages[0].setup(self._store, self.selected_disks, allDisks)
-        self.pages[1].setup(self._store, self.selected_disks, multipathDisks)
-        self.pages[2].setup(self._store, self.selected_disks, otherDisks)
-        self.pages[3].setup(self._store, self.selected_disks, raidDisks)
-        self.pages[4].setup(self._store, self.selected_disks, zDisks)
+            row = page.row(disk, disk.name in selected) if page else None
+            if row is not None:
+                rows[disk.name] = row
+
+        self._update_rows(rows)
+
+        for (page, disks) in zip(self.pages, [allDisks, multipathDisks, otherDisks,
+                                              raidDisks, zDisks]):
+            page.members = set(disk.name for disk in disks)
+            page.setup(self._store, self.selected_disks, disks)
+            page.refilter()
 
         self._update_summary()
 
@@ -508,7 +540,8 @@ class FilterSpoke(NormalSpoke):
         # We need to remove ancestor devices from the count.  Otherwise, we'll
         # end up in a situation where selecting one multipath device could
         # potentially show three devices selected (mpatha, sda, sdb for instance).
-        count = len([disk for disk in self.selected_disks if disk not in self.ancestors])
+        count = len([disk for disk in self.selected_disks
+                     if not self._catalog.isAncestor(disk)])
 
         summary = CP_("GUI|Installation Destination|Filter",
                      "%d _storage device selected",
@@ -530,7 +563,8 @@ class FilterSpoke(NormalSpoke):
 
         # Include any disks selected in the initial storage spoke, plus any
         # selected in this filter UI.
-        disks = [disk for disk in self.disks if disk.name in self.selected_disks]
+        selected = set(self.selected_disks)
+        disks = [disk for disk in self.disks if disk.name in selected]
         free_space = self.storage.getFreeSpace(disks=disks)
 
         with enlightbox(self.window, dialog.window):
@@ -540,16 +574,16 @@ class FilterSpoke(NormalSpoke):
     def on_find_clicked(self, button):
         n = self._notebook.get_current_page()
         self.pages[n].filterActive = True
-        self.pages[n].model.refilter()
+        self.pages[n].refilter()
 
     def on_clear_clicked(self, button):
         n = self._notebook.get_current_page()
         self.pages[n].filterActive = False
-        self.pages[n].model.refilter()
+        self.pages[n].refilter()
         self.pages[n].clear()
 
     def on_page_switched(self, notebook, newPage, newPageNum, *args):
-        self.pages[newPageNum].model.refilter()
+        self.pages[newPageNum].refilter()
         notebook.get_nth_page(newPageNum).show_all()
 
     def on_row_toggled(self, button, path):
@@ -558,6 +592,7 @@ class FilterSpoke(NormalSpoke):
 
         itr = self._store.get_iter(path)
         self._store[itr][1] = not self._store[itr][1]
+        self._rows[self._store[itr][3]][SELECTED_COLUMN] = self._store[itr][1]
 
         if self._store[itr][1] and self._store[itr][3] not in self.selected_disks:
             self.selected_disks.append(self._store[itr][3])
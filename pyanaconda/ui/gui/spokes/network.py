@@ -1420,12 +1420,13 @@ class NetworkStandaloneSpoke(StandaloneSpoke):
 
         log.debug("network standalone spoke (apply) payload: %s completed: %s", self.payload.baseRepo, self._now_available)
         if not self.payload.baseRepo and not self._initially_available and self._now_available:
-            from pyanaconda.packaging import payloadInitialize
+            from pyanaconda.packaging import payloadInitialize, payloadDependencies
             from pyanaconda.threads import threadMgr, AnacondaThread
 
             threadMgr.wait(constants.THREAD_PAYLOAD)
 
-            threadMgr.add(AnacondaThread(name=constants.THREAD_PAYLOAD, target=payloadInitialize, args=(self.storage, self.data, self.payload)))
+            threadMgr.add(AnacondaThread(name=constants.THREAD_PAYLOAD, target=payloadInitialize, args=(self.storage, self.data, self.payload),
+                                         depends_on=payloadDependencies(self.payload)))
 
         self.network_control_box.kill_nmce(msg="leaving standalone network spoke")
 
@@ -27,11 +27,11 @@ log = logging.getLogger("anaconda")
 
 import os, signal, string
 
-from gi.repository import GLib
+from gi.repository import GLib, Gtk
 
 from pyanaconda.flags import flags
 from pyanaconda.i18n import _, N_, CN_
-from pyanaconda.image import opticalInstallMedia, potentialHdisoSources
+from pyanaconda.image import opticalInstallMedia, potentialHdisoSources, isInstallIsoImage
 from pyanaconda.ui.communication import hubQ
 from pyanaconda.ui.gui import GUIObject
 from pyanaconda.ui.gui.spokes import NormalSpoke
@@ -234,6 +234,17 @@ class IsoChooser(GUIObject):
     def __init__(self, data):
         GUIObject.__init__(self, data)
         self._chooser = self.builder.get_object("isoChooser")
+        # the image chosen last that can't be installed from
+        self.rejectedFile = None
+
+        # The filter runs in the main loop for every file shown, so it only
+        # looks at the names.  The chosen image is checked in run().
+        isoFilter = Gtk.FileFilter()
+        isoFilter.add_custom(Gtk.FileFilterFlags.FILENAME, self._is_iso_name, None)
+        self._chooser.set_filter(isoFilter)
+
+    def _is_iso_name(self, filterInfo, data):
+        return bool(filterInfo.filename) and filterInfo.filename.lower().endswith(".iso")
 
     # pylint: disable-msg=W0221
     def refresh(self, currentFile=""):
@@ -254,10 +265,16 @@ class IsoChooser(GUIObject):
             dev.format.mount(mountpoint=constants.ISO_DIR)
 
         # If any directory was chosen, return that.  Otherwise, return None.
+        # An image that can't be installed from is not returned, it is kept
+        # in rejectedFile.
+        self.rejectedFile = None
         rc = self.window.run()
         if rc == 1:
             f = self._chooser.get_filename()
-            if f:
+            if f and f.lower().endswith(".iso") and not isInstallIsoImage(f):
+                log.warning("%s is not an installation image", f)
+                self.rejectedFile = f.replace(constants.ISO_DIR, "")
+            elif f:
                 retval = f.replace(constants.ISO_DIR, "")
 
         if unmount:
@@ -825,11 +842,15 @@ class SourceSpoke(NormalSpoke):
         with enlightbox(self.window, dialog.window):
             f = dialog.run(self._get_selected_partition())
 
-        if f and f.endswith(".iso"):
+        if f and f.lower().endswith(".iso"):
+            self.clear_info()
             self._currentIsoFile = f
             button.set_label(os.path.basename(f))
             button.set_use_underline(False)
             self._verifyIsoButton.set_sensitive(True)
+        elif dialog.rejectedFile:
+            self.set_warning(_("%s is not an installation image for this system; choose another image.")
+                             % os.path.basename(dialog.rejectedFile))
 
     def on_proxy_clicked(self, button):
         dialog = ProxyDialog(self.data, self._proxyUrl)
@@ -0,0 +1,225 @@
+# Indexed catalog of the disks shown by the storage filter UI
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+"""
+    SAN fabrics can present thousands of LUNs.  Instead of asking the device
+    tree about every row each time a filter changes, the filter UI keeps the
+    attributes it filters by in a DiskCatalog.  The catalog is updated
+    incrementally from the disks found by every rescan and answers the filter
+    queries with sets of disk names:
+
+    - exact attributes (port, LUN, vendor, model, interconnect) are kept in
+      value -> names dicts
+    - text attributes the user searches for a part of (WWID, target, FCP LUN,
+      by-path link) are kept in a trigram index; a query is narrowed down to
+      the values containing all its trigrams and only those are compared
+    - the ancestors of all the disks are reference counted, so whether a disk
+      is an ancestor of another one is a dict lookup
+"""
+
+from collections import namedtuple
+
+__all__ = ["DiskInfo", "DiskCatalog", "diskInfo"]
+
+# Values are None if the disk doesn't have the attribute.  port and lun are
+# strings, ancestors is a frozenset of names not including the disk itself.
+DiskInfo = namedtuple("DiskInfo", ["name", "wwid", "port", "target", "lun",
+                                   "fcp_lun", "path", "vendor", "model",
+                                   "interconnect", "ancestors"])
+
+EXACT_ATTRIBUTES = ("port", "lun", "vendor", "model", "interconnect")
+TEXT_ATTRIBUTES = ("wwid", "target", "fcp_lun", "path")
+
+_GRAM = 3
+
+def _byPathLink(disk):
+    for link in getattr(disk, "deviceLinks", []):
+        if "by-path" in link:
+            return link
+
+    return None
+
+def diskInfo(disk):
+    """Return the DiskInfo of a blivet disk."""
+    node = getattr(disk, "node", None)
+    if node is not None:
+        port = str(node.port)
+        lun = str(node.tpgt)
+    else:
+        port = None
+        lun = None
+
+    return DiskInfo(name=disk.name,
+                    wwid=getattr(disk, "wwid", None),
+                    port=port,
+                    target=getattr(disk, "initiator", None),
+                    lun=lun,
+                    fcp_lun=getattr(disk, "fcp_lun", None),
+                    path=_byPathLink(disk),
+                    vendor=disk.vendor,
+                    model=disk.model,
+                    interconnect=disk.bus,
+                    ancestors=frozenset(d.name for d in disk.ancestors
+                                        if d.name != disk.name))
+
+def _grams(text):
+    return set(text[i:i+_GRAM] for i in range(len(text) - _GRAM + 1))
+
+class _TextIndex(object):
+    """Substring search over the values of one attribute."""
+    def __init__(self):
+        # value -> names of the disks having it
+        self._names = {}
+        # trigram -> values containing it
+        self._grams = {}
+
+    def add(self, value, name):
+        names = self._names.setdefault(value, set())
+        if not names:
+            for gram in _grams(value):
+                self._grams.setdefault(gram, set()).add(value)
+        names.add(name)
+
+    def remove(self, value, name):
+        names = self._names[value]
+        names.discard(name)
+        if names:
+            return
+
+        del self._names[value]
+        for gram in _grams(value):
+            values = self._grams[gram]
+            values.discard(value)
+            if not values:
+                del self._grams[gram]
+
+    def search(self, text):
+        """Return the names of the disks whose value contains text."""
+        if len(text) < _GRAM:
+            candidates = self._names.keys()
+        else:
+            postings = []
+            for gram in _grams(text):
+                values = self._grams.get(gram)
+                if not values:
+                    return set()
+                postings.append(values)
+
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+
+        result = set()
+        for value in candidates:
+            if text in value:
+                result.update(self._names[value])
+        return result
+
+class DiskCatalog(object):
+    """The disks of the filter UI indexed by the attributes it filters by."""
+    def __init__(self):
+        self._disks = {}
+        self._exact = dict((attr, {}) for attr in EXACT_ATTRIBUTES)
+        self._text = dict((attr, _TextIndex()) for attr in TEXT_ATTRIBUTES)
+        # ancestor name -> number of disks it is an ancestor of
+        self._ancestors = {}
+
+    def __contains__(self, name):
+        return name in self._disks
+
+    def __len__(self):
+        return len(self._disks)
+
+    @property
+    def names(self):
+        """Return the set of the names of all the disks."""
+        return set(self._disks)
+
+    def get(self, name):
+        """Return the DiskInfo of the named disk or None."""
+        return self._disks.get(name)
+
+    def _add(self, info):
+        self._disks[info.name] = info
+
+        for attr in EXACT_ATTRIBUTES:
+            self._exact[attr].setdefault(getattr(info, attr), set()).add(info.name)
+
+        for attr in TEXT_ATTRIBUTES:
+            value = getattr(info, attr)
+            if value is not None:
+                self._text[attr].add(value, info.name)
+
+        for ancestor in info.ancestors:
+            self._ancestors[ancestor] = self._ancestors.get(ancestor, 0) + 1
+
+    def _remove(self, name):
+        info = self._disks.pop(name)
+
+        for attr in EXACT_ATTRIBUTES:
+            index = self._exact[attr]
+            value = getattr(info, attr)
+            index[value].discard(name)
+            if not index[value]:
+                del index[value]
+
+        for attr in TEXT_ATTRIBUTES:
+            value = getattr(info, attr)
+            if value is not None:
+                self._text[attr].remove(value, name)
+
+        for ancestor in info.ancestors:
+            self._ancestors[ancestor] -= 1
+            if not self._ancestors[ancestor]:
+                del self._ancestors[ancestor]
+
+    def update(self, disks):
+        """Bring the catalog in line with the disks found by a rescan.
+
+           Only the disks that appeared, disappeared or changed are indexed
+           again.  Returns a tuple of the sets of added and removed names, a
+           disk that changed is in both.
+        """
+        infos = dict((disk.name, diskInfo(disk)) for disk in disks)
+
+        removed = set(name for (name, info) in self._disks.items()
+                      if infos.get(name) != info)
+        for name in removed:
+            self._remove(name)
+
+        added = set()
+        for (name, info) in infos.items():
+            if name not in self._disks:
+                self._add(info)
+                added.add(name)
+
+        return (added, removed)
+
+    def isAncestor(self, name):
+        """Is the named device an ancestor of any disk in the catalog?"""
+        return name in self._ancestors
+
+    def match(self, attr, value):
+        """Return the names of the disks whose attr equals value."""
+        return set(self._exact[attr].get(value, ()))
+
+    def search(self, attr, text):
+        """Return the names of the disks whose attr contains text.  Disks
+           without the attribute never match.
+        """
+        return self._text[attr].search(text)
@@ -26,7 +26,7 @@ from pyanaconda.ui.tui.simpleline import TextWidget, ColumnWidget
 from pyanaconda.threads import threadMgr, AnacondaThread
 from pyanaconda.packaging import PayloadError, MetadataError
 from pyanaconda.i18n import N_, _
-from pyanaconda.image import opticalInstallMedia, potentialHdisoSources
+from pyanaconda.image import opticalInstallMedia, potentialHdisoSources, findIsoImages
 
 from pyanaconda.constants import THREAD_SOURCE_WATCHER, THREAD_SOFTWARE_WATCHER, THREAD_PAYLOAD
 from pyanaconda.constants import THREAD_PAYLOAD_MD, THREAD_STORAGE, THREAD_STORAGE_WATCHER
@@ -39,7 +39,6 @@ from blivet.util import get_mount_paths
 
 import re
 import os
-import fnmatch
 
 import logging
 LOG = logging.getLogger("anaconda")
@@ -488,17 +487,13 @@ class SelectISOSpoke(NormalTUISpoke, SourceSwitchHandler):
 
     def _getISOs(self):
         """List all *.iso files in the root folder
-        of the currently selected device.
+        of the currently selected device that can be installed from.
 
         TODO: advanced ISO file selection
         :returns: a list of *.iso file paths
         :rtype: list
         """
-        isos = []
-        for filename in os.listdir(ISO_DIR):
-            if fnmatch.fnmatch(filename.lower(), "*.iso"):
-                isos.append(filename)
-        return isos
+        return findIsoImages(ISO_DIR)
 
     def apply(self):
         """ Apply all of our changes. """
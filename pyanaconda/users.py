@@ -338,10 +338,12 @@ class Users:
                     log.info("Home directory for the user %s already existed, "
                              "fixing the owner.", user_name)
                     # home directory already existed, change owner of it properly
-                    iutil.chown_dir_tree(userEnt.get(libuser.HOMEDIRECTORY)[0],
-                                         userEnt.get(libuser.UIDNUMBER)[0],
-                                         groupEnt.get(libuser.GIDNUMBER)[0],
-                                         orig_uid, orig_gid)
+                    count = iutil.chown_dir_tree(userEnt.get(libuser.HOMEDIRECTORY)[0],
+                                                 userEnt.get(libuser.UIDNUMBER)[0],
+                                                 groupEnt.get(libuser.GIDNUMBER)[0],
+                                                 orig_uid, orig_gid)
+                    log.info("Processed %d files and directories in the home "
+                             "directory of the user %s", count, user_name)
                 except OSError as e:
                     log.critical("Unable to change owner of existing home directory: %s",
                             os.strerror)
@@ -0,0 +1,127 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import unittest
+import mock
+import imp
+import json
+import os
+import shutil
+import tempfile
+
+TOP_SRCDIR = os.environ.get("top_srcdir",
+                            os.path.join(os.path.dirname(__file__), "..", ".."))
+anaconda_yum = imp.load_source("anaconda_yum", os.path.join(TOP_SRCDIR, "scripts", "anaconda-yum"))
+
+POSTIN = 1024
+POSTTRANS = 1152
+
+class TransactionMember(object):
+    """What the rpm callbacks get as their key."""
+    def __init__(self, name):
+        self.name = name
+        self.po = name
+
+class TimingReportTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.now = 1000.0
+        self.patches = [mock.patch.object(anaconda_yum, "out"),
+                        mock.patch.object(anaconda_yum.time, "time", lambda: self.now),
+                        mock.patch.object(anaconda_yum.rpm, "tagnames",
+                                          {POSTIN: "POSTIN", POSTTRANS: "POSTTRANS"},
+                                          create=True)]
+        for patch in self.patches:
+            patch.start()
+
+        yb = mock.Mock()
+        yb.conf.cachedir = "/nonexistent"
+        self.rpmcb = anaconda_yum.RPMCallback(yb, "x86_64", None)
+        self.rpmcb.total_actions = 2
+        self.rpmcb.completed_actions = 0
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def _install(self, name, seconds, scripts=()):
+        """Go through the callbacks rpm makes for a package."""
+        key = TransactionMember(name)
+        self.rpmcb.completed_actions += 1
+        self.rpmcb.package_name = name
+        self.rpmcb.package_file = open(os.path.join(self.tmpdir, name + ".rpm"), "w")
+        self.rpmcb.package_started = self.now
+        self.now += seconds
+        self.rpmcb.inst_close_file(0, 0, key, None)
+
+        for (tag, seconds, rc) in scripts:
+            self.rpmcb.script_start(tag, 0, key, None)
+            self.now += seconds
+            self.rpmcb.script_stop(tag, rc, key, None)
+
+    def _report(self):
+        path = os.path.join(self.tmpdir, "timing.json")
+        self.rpmcb.write_timing_report(path)
+        with open(path) as f:
+            return json.load(f)
+
+    def report_test(self):
+        """The report should hold every package and scriptlet, slowest first."""
+        self._install("glibc", 2.0, [(POSTIN, 0.5, 0)])
+        self._install("kernel", 1.0, [(POSTIN, 0.25, 0), (POSTTRANS, 30.0, 1)])
+
+        report = self._report()
+        self.assertEqual(sorted(report), ["package_seconds", "packages",
+                                          "scriptlet_seconds", "scriptlets"])
+        self.assertEqual(report["package_seconds"], 3.0)
+        self.assertEqual(report["scriptlet_seconds"], 30.75)
+        self.assertEqual(report["packages"],
+                         [{"package": "glibc", "seconds": 2.0},
+                          {"package": "kernel", "seconds": 1.0}])
+        self.assertEqual(report["scriptlets"],
+                         [{"package": "kernel", "scriptlet": "POSTTRANS", "seconds": 30.0, "rc": 1},
+                          {"package": "glibc", "scriptlet": "POSTIN", "seconds": 0.5, "rc": 0},
+                          {"package": "kernel", "scriptlet": "POSTIN", "seconds": 0.25, "rc": 0}])
+
+        # the events sent to anaconda
+        anaconda_yum.out.package_end.assert_any_call("kernel", 1.0)
+        anaconda_yum.out.script_end.assert_any_call("kernel", "POSTTRANS", 30.0, 1)
+        anaconda_yum.out.post.assert_called_once_with()
+
+    def unmatched_stop_test(self):
+        """A scriptlet stop without a start should not be recorded."""
+        key = TransactionMember("bash")
+        self.rpmcb.script_stop(POSTIN, 0, key, None)
+        self.rpmcb.script_start(POSTIN, 0, key, None)
+        self.now += 1.0
+        self.rpmcb.script_stop(POSTIN, 0, key, None)
+        self.rpmcb.script_stop(POSTIN, 0, key, None)
+
+        self.assertEqual(self._report()["scriptlets"],
+                         [{"package": "bash", "scriptlet": "POSTIN", "seconds": 1.0, "rc": 0}])
+
+    def empty_report_test(self):
+        """A transaction without packages should still have a report."""
+        self.assertEqual(self._report(), {"package_seconds": 0, "scriptlet_seconds": 0,
+                                          "packages": [], "scriptlets": []})
+
+    def unwritable_report_test(self):
+        """A report that can't be written should only be warned about."""
+        self.rpmcb.write_timing_report(os.path.join(self.tmpdir, "missing", "timing.json"))
+        self.assertTrue(anaconda_yum.out.warn.called)
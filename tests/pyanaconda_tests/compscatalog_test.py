@@ -0,0 +1,123 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+from pyanaconda.packaging import PackagePayload, NoSuchGroup
+from pyanaconda.packaging.compscatalog import CompsCatalog, CompsEnvironment, CompsGroup
+import unittest
+
+ENVIRONMENTS = [
+    CompsEnvironment("server-environment", "Server", "A server", ("core", "base"),
+                     ("web-server", "mail-server"), frozenset(["web-server"])),
+    CompsEnvironment("minimal-environment", "Minimal", "Basic functionality", ("core",),
+                     (), frozenset()),
+]
+
+GROUPS = [
+    CompsGroup("core", "Core", "Smallest possible installation", False, True, None),
+    CompsGroup("base", "Base", "The base system", False, True, None),
+    CompsGroup("web-server", "Web Server", "Serve web pages", True, True, None),
+    CompsGroup("mail-server", "Mail Server", "Serve mail", True, False, None),
+    CompsGroup("czech-support", "Czech Support", "Czech language support", True, True, "cs"),
+]
+
+class CompsCatalogTests(unittest.TestCase):
+    def setUp(self):
+        # generators, as the payloads pass them
+        self.catalog = CompsCatalog((env for env in ENVIRONMENTS), (grp for grp in GROUPS))
+
+    def ids_test(self):
+        """The ids should be kept in the order of the comps."""
+        self.assertEqual(self.catalog.environment_ids,
+                         ("server-environment", "minimal-environment"))
+        self.assertEqual(self.catalog.group_ids,
+                         ("core", "base", "web-server", "mail-server", "czech-support"))
+
+    def lookup_test(self):
+        """Environments and groups should be found by their ids."""
+        self.assertEqual(self.catalog.environment("minimal-environment").name, "Minimal")
+        self.assertIsNone(self.catalog.environment("workstation-environment"))
+        self.assertEqual(self.catalog.group("czech-support").langonly, "cs")
+        self.assertFalse(self.catalog.group("mail-server").installable)
+        self.assertIsNone(self.catalog.group("games"))
+        self.assertEqual(sorted(grp.id for grp in self.catalog.groups()), sorted(self.catalog.group_ids))
+
+    def options_test(self):
+        """Only the options of the environment should be its options."""
+        self.assertTrue(self.catalog.environmentHasOption("server-environment", "mail-server"))
+        self.assertFalse(self.catalog.environmentHasOption("server-environment", "core"))
+        self.assertFalse(self.catalog.environmentHasOption("minimal-environment", "web-server"))
+        self.assertRaises(KeyError, self.catalog.environmentHasOption, "games-environment", "core")
+
+    def empty_test(self):
+        """A catalog of empty comps should answer every query."""
+        catalog = CompsCatalog([], [])
+        self.assertEqual(catalog.environment_ids, ())
+        self.assertEqual(catalog.group_ids, ())
+        self.assertIsNone(catalog.group("core"))
+
+class CatalogPayload(PackagePayload):
+    """A payload with just a comps catalog."""
+    catalog = None
+
+    @property
+    def compsCatalog(self):
+        return self.catalog
+
+class CatalogPayloadTests(unittest.TestCase):
+    def setUp(self):
+        self.payload = CatalogPayload(None)
+        self.payload.catalog = CompsCatalog(ENVIRONMENTS, GROUPS)
+
+    def environments_test(self):
+        """The environment queries should use the catalog."""
+        payload = self.payload
+        self.assertEqual(payload.environments, ["server-environment", "minimal-environment"])
+        self.assertEqual(payload.environmentDescription("server-environment"),
+                         ("Server", "A server"))
+        self.assertEqual(payload.environmentGroups("server-environment"),
+                         ["core", "base", "web-server", "mail-server"])
+        self.assertTrue(payload.environmentHasOption("server-environment", "web-server"))
+        self.assertTrue(payload.environmentOptionIsDefault("server-environment", "web-server"))
+        self.assertFalse(payload.environmentOptionIsDefault("server-environment", "mail-server"))
+        self.assertRaises(NoSuchGroup, payload.environmentDescription, "games-environment")
+
+    def groups_test(self):
+        """The group queries should use the catalog."""
+        payload = self.payload
+        self.assertEqual(payload.groups[:2], ["core", "base"])
+        self.assertEqual(payload.groupDescription("web-server"), ("Web Server", "Serve web pages"))
+        self.assertTrue(payload._isGroupVisible("web-server"))
+        self.assertFalse(payload._isGroupVisible("core"))
+        self.assertFalse(payload._isGroupVisible("games"))
+        self.assertTrue(payload._groupHasInstallableMembers("base"))
+        self.assertFalse(payload._groupHasInstallableMembers("mail-server"))
+        self.assertRaises(NoSuchGroup, payload.groupDescription, "games")
+
+    def no_comps_test(self):
+        """Without comps the queries should give empty answers."""
+        payload = self.payload
+        payload.catalog = None
+        self.assertEqual(payload.environments, [])
+        self.assertEqual(payload.groups, [])
+        self.assertEqual(payload.environmentDescription("server-environment"),
+                         ("server-environment", "server-environment"))
+        self.assertEqual(payload.groupDescription("core"), ("core", "core"))
+        self.assertEqual(payload.environmentGroups("server-environment"), [])
+        self.assertFalse(payload.environmentHasOption("server-environment", "web-server"))
+        self.assertFalse(payload._isGroupVisible("web-server"))
@@ -0,0 +1,151 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+from pyanaconda.ui.lib.diskcatalog import DiskCatalog
+import unittest
+import random
+
+class FakeNode(object):
+    def __init__(self, port, tpgt):
+        self.port = port
+        self.tpgt = tpgt
+
+class FakeDisk(object):
+    """The attributes of a blivet disk the catalog reads."""
+    def __init__(self, name, vendor="ATA", model="Disk", bus="SATA", ancestors=(), **attrs):
+        self.name = name
+        self.vendor = vendor
+        self.model = model
+        self.bus = bus
+        self.ancestors = [self] + list(ancestors)
+        self.__dict__.update(attrs)
+
+def multipath(name, wwid, members):
+    disks = [FakeDisk(member, wwid=wwid, bus="FCP") for member in members]
+    return [FakeDisk(name, wwid=wwid, bus="FCP", ancestors=disks)] + disks
+
+class DiskCatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.disks = [FakeDisk("sda"),
+                      FakeDisk("sdb", vendor="IBM", model="2107900", bus="FCP",
+                               fcp_lun="0x4010400000000000",
+                               deviceLinks=["/dev/disk/by-id/x",
+                                            "/dev/disk/by-path/ccw-0.0.5080-zfcp-0x5005-lun-1"]),
+                      FakeDisk("sdc", bus="iSCSI", node=FakeNode(3260, 1),
+                               initiator="iqn.2015-01.com.example:storage"),
+                      FakeDisk("sdd", bus="iSCSI", node=FakeNode(3261, 2),
+                               initiator="iqn.2015-01.com.example:backup")]
+        self.disks += multipath("mpatha", "3600508b4000156d70001200000b0000", ["sde", "sdf"])
+        self.catalog = DiskCatalog()
+        self.catalog.update(self.disks)
+
+    def info_test(self):
+        """The attributes should be taken from the disks."""
+        info = self.catalog.get("sdc")
+        self.assertEqual((info.port, info.lun, info.target),
+                         ("3260", "1", "iqn.2015-01.com.example:storage"))
+        self.assertEqual(self.catalog.get("sdb").path,
+                         "/dev/disk/by-path/ccw-0.0.5080-zfcp-0x5005-lun-1")
+        self.assertIsNone(self.catalog.get("sda").port)
+        self.assertEqual(self.catalog.get("mpatha").ancestors, frozenset(["sde", "sdf"]))
+        self.assertIsNone(self.catalog.get("sdz"))
+        self.assertEqual(len(self.catalog), 7)
+        self.assertIn("sda", self.catalog)
+
+    def match_test(self):
+        """Exact attributes should be looked up by their values."""
+        self.assertEqual(self.catalog.match("interconnect", "iSCSI"), set(["sdc", "sdd"]))
+        self.assertEqual(self.catalog.match("port", "3261"), set(["sdd"]))
+        self.assertEqual(self.catalog.match("port", None),
+                         self.catalog.names - set(["sdc", "sdd"]))
+        self.assertEqual(self.catalog.match("vendor", "EMC"), set())
+
+        # the result is a copy
+        self.catalog.match("vendor", "IBM").clear()
+        self.assertEqual(self.catalog.match("vendor", "IBM"), set(["sdb"]))
+
+    def search_test(self):
+        """Text attributes should be found by any part of their values."""
+        self.assertEqual(self.catalog.search("target", "example"), set(["sdc", "sdd"]))
+        self.assertEqual(self.catalog.search("target", "backup"), set(["sdd"]))
+        self.assertEqual(self.catalog.search("wwid", "b4000156d7"),
+                         set(["mpatha", "sde", "sdf"]))
+        self.assertEqual(self.catalog.search("fcp_lun", "0x40104"), set(["sdb"]))
+        self.assertEqual(self.catalog.search("path", "zfcp"), set(["sdb"]))
+        self.assertEqual(self.catalog.search("target", "nothing"), set())
+
+        # all the trigrams, but not in that order
+        self.assertEqual(self.catalog.search("target", "backupexam"), set())
+
+    def short_search_test(self):
+        """Texts shorter than a trigram should be compared with every value."""
+        self.assertEqual(self.catalog.search("target", "up"), set(["sdd"]))
+        self.assertEqual(self.catalog.search("wwid", ""), set(["mpatha", "sde", "sdf"]))
+
+    def search_like_scan_test(self):
+        """The trigram index should find what a scan of all disks finds."""
+        rand = random.Random(22)
+        disks = [FakeDisk("sd%d" % i, wwid="".join(rand.choice("0123ab") for _j in range(8)))
+                 for i in range(200)]
+        catalog = DiskCatalog()
+        catalog.update(disks)
+
+        for _i in range(200):
+            text = "".join(rand.choice("0123ab") for _j in range(rand.randint(1, 5)))
+            self.assertEqual(catalog.search("wwid", text),
+                             set(d.name for d in disks if text in d.wwid), text)
+
+    def ancestor_test(self):
+        """Ancestors should be known while a disk having them is there."""
+        self.assertTrue(self.catalog.isAncestor("sde"))
+        self.assertFalse(self.catalog.isAncestor("mpatha"))
+        self.assertFalse(self.catalog.isAncestor("sda"))
+
+        self.catalog.update(d for d in self.disks if d.name != "mpatha")
+        self.assertFalse(self.catalog.isAncestor("sde"))
+
+    def update_test(self):
+        """Only the disks that changed should be indexed again."""
+        self.assertEqual(self.catalog.update(self.disks), (set(), set()))
+
+        self.disks[3].initiator = "iqn.2015-01.com.example:archive"
+        self.disks.append(FakeDisk("sdg", vendor="IBM", wwid="36005076"))
+        del self.disks[0]
+        (added, removed) = self.catalog.update(self.disks)
+        self.assertEqual(added, set(["sdd", "sdg"]))
+        self.assertEqual(removed, set(["sda", "sdd"]))
+
+        self.assertNotIn("sda", self.catalog)
+        self.assertEqual(self.catalog.search("target", "backup"), set())
+        self.assertEqual(self.catalog.search("target", "archive"), set(["sdd"]))
+        self.assertEqual(self.catalog.search("wwid", "3600"),
+                         set(["mpatha", "sde", "sdf", "sdg"]))
+        self.assertEqual(self.catalog.match("vendor", "IBM"), set(["sdb", "sdg"]))
+        self.assertEqual(self.catalog.match("model", "Disk"),
+                         set(["sdc", "sdd", "mpatha", "sde", "sdf", "sdg"]))
+
+    def remove_all_test(self):
+        """An empty rescan should leave empty indexes behind."""
+        self.catalog.update([])
+        self.assertEqual(len(self.catalog), 0)
+        self.assertEqual(self.catalog._ancestors, {})
+        for index in self.catalog._exact.values():
+            self.assertEqual(index, {})
+        for index in self.catalog._text.values():
+            self.assertEqual((index._names, index._grams), ({}, {}))
@@ -0,0 +1,312 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+from pyanaconda.packaging import dnfpayload
+import unittest
+import mock
+import os
+from Queue import Queue
+
+class FakePackage(object):
+    def __init__(self, name, requires=(), provides=(), downloadsize=100, local=None):
+        self.name = name
+        self.requires = list(requires)
+        self.provides = [name] + list(provides)
+        self.downloadsize = downloadsize
+        self.local = local or "/nonexistent/%s.rpm" % name
+
+    def localPkg(self):
+        return self.local
+
+    def __repr__(self):
+        return self.name
+
+class FakeQuery(object):
+    def __init__(self, packages):
+        self.packages = list(packages)
+
+    def filter(self, pkg=None, provides=None):
+        if pkg is not None:
+            return FakeQuery(p for p in self.packages if p in pkg)
+        return FakeQuery(p for p in self.packages if provides in p.provides)
+
+    def run(self):
+        return list(self.packages)
+
+class FakeSack(object):
+    """Knows more packages than are installed, like the real sack."""
+    def __init__(self, packages):
+        self.packages = packages
+
+    def query(self):
+        return FakeQuery(self.packages)
+
+def _position(components, name):
+    for (i, component) in enumerate(components):
+        if name in [pkg.name for pkg in component]:
+            return i
+    raise AssertionError("%s is in no component" % name)
+
+class InstallOrderTests(unittest.TestCase):
+    def setUp(self):
+        self.packages = [FakePackage("bash", ["glibc", "rpmlib(PayloadIsXz)"]),
+                         FakePackage("glibc", ["glibc-common"]),
+                         FakePackage("glibc-common", ["glibc", "tzdata"]),
+                         FakePackage("tzdata"),
+                         FakePackage("vim", ["bash", "libc.so.6", "gpm"]),
+                         FakePackage("coreutils", ["libc.so.6"]),
+                         FakePackage("filesystem", ["setup"]),
+                         FakePackage("setup", ["filesystem"])]
+        self.packages[1].provides.append("libc.so.6")
+        # in the repo, but not installed
+        self.sack = FakeSack(self.packages + [FakePackage("gpm-new", provides=["gpm"])])
+
+    def dependencies_first_test(self):
+        """Every package should come after what it requires."""
+        components = dnfpayload._install_order(self.sack, self.packages)
+        self.assertEqual(sorted(pkg.name for c in components for pkg in c),
+                         sorted(pkg.name for pkg in self.packages))
+
+        for pkg in self.packages:
+            for req in pkg.requires:
+                for dep in self.packages:
+                    if dep is not pkg and req in dep.provides:
+                        self.assertLessEqual(_position(components, dep.name),
+                                             _position(components, pkg.name),
+                                             "%s before %s" % (dep.name, pkg.name))
+
+    def cycles_test(self):
+        """Packages requiring each other should be in one group."""
+        components = dnfpayload._install_order(self.sack, self.packages)
+        groups = [sorted(pkg.name for pkg in c) for c in components]
+        self.assertIn(["glibc", "glibc-common"], groups)
+        self.assertIn(["filesystem", "setup"], groups)
+        self.assertIn(["tzdata"], groups)
+
+    def deep_chain_test(self):
+        """Long dependency chains shouldn't hit the recursion limit."""
+        packages = [FakePackage("pkg0")]
+        for i in range(1, 1200):
+            packages.append(FakePackage("pkg%d" % i, ["pkg%d" % (i - 1)]))
+        packages.reverse()
+        components = dnfpayload._install_order(FakeSack(packages), packages)
+        self.assertEqual([c[0].name for c in components], ["pkg%d" % i for i in range(1200)])
+
+class SplitBatchesTests(unittest.TestCase):
+    def split_test(self):
+        """The groups should be joined into batches of about the size."""
+        components = [[FakePackage("a", downloadsize=60)],
+                      [FakePackage("b", downloadsize=30), FakePackage("c", downloadsize=30)],
+                      [FakePackage("d", downloadsize=50)],
+                      [FakePackage("e", downloadsize=10)]]
+        batches = dnfpayload._split_batches(components, 100)
+        self.assertEqual([[pkg.name for pkg in batch] for batch in batches],
+                         [["a", "b", "c"], ["d", "e"]])
+
+    def big_component_test(self):
+        """A group bigger than the size should not be split."""
+        components = [[FakePackage("a", downloadsize=500), FakePackage("b", downloadsize=500)]]
+        self.assertEqual(len(dnfpayload._split_batches(components, 100)), 1)
+        self.assertEqual(dnfpayload._split_batches([], 100), [])
+
+    def downloaded_test(self):
+        """Packages downloaded already shouldn't count."""
+        components = [[FakePackage("a", downloadsize=500, local=os.__file__)],
+                      [FakePackage("b", downloadsize=50)]]
+        self.assertEqual(len(dnfpayload._split_batches(components, 100)), 1)
+
+class FakeProcess(object):
+    name = "Process-1"
+
+    def __init__(self, alive=True, exitcode=None):
+        self.alive = alive
+        self.exitcode = exitcode
+
+    def is_alive(self):
+        return self.alive
+
+class NextEventTests(unittest.TestCase):
+    def setUp(self):
+        self.timeout = mock.patch.object(dnfpayload, "DNF_EVENT_TIMEOUT", 0.01)
+        self.timeout.start()
+
+    def tearDown(self):
+        self.timeout.stop()
+
+    def event_test(self):
+        """Posted messages should be returned."""
+        queue = Queue()
+        queue.put(('install', 'bash'))
+        self.assertEqual(dnfpayload._next_event(queue, FakeProcess()), ('install', 'bash'))
+
+    def posted_before_exit_test(self):
+        """A message posted right before the process exited should be returned."""
+        queue = Queue()
+        queue.put(('done', None))
+        self.assertEqual(dnfpayload._next_event(queue, FakeProcess(False, 0)), ('done', None))
+
+    def dead_process_test(self):
+        """A process that died without a message should not be waited for forever."""
+        (token, msg) = dnfpayload._next_event(Queue(), FakeProcess(False, -9))
+        self.assertEqual(token, 'quit')
+        self.assertIn("-9", msg)
+
+    def still_running_test(self):
+        """A process still running should be waited for."""
+        queue = Queue()
+        process = FakeProcess()
+        def is_alive():
+            queue.put(('post', None))
+            return True
+        process.is_alive = is_alive
+        self.assertEqual(dnfpayload._next_event(queue, process), ('post', None))
+
+class FakeDownload(object):
+    """A package as dnf passes it to the download progress."""
+    def __init__(self, name, download_size):
+        self.name = name
+        self.download_size = download_size
+
+    def __str__(self):
+        return self.name
+
+class DownloadProgressTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.clock = mock.patch("time.time", lambda: self.now)
+        self.clock.start()
+        self.reports = []
+        self.progress = dnfpayload.PayloadDownloadProgress(self.reports.append)
+        self.packages = [FakeDownload("bash", 1000), FakeDownload("glibc", 3000)]
+
+    def tearDown(self):
+        self.clock.stop()
+
+    def aggregation_test(self):
+        """The progress of all packages should be added up."""
+        self.progress.start(2, 4000)
+        self.assertEqual(len(self.reports), 1)
+        self.assertIn("(0/2,", self.reports[-1])
+
+        self.now += 2
+        self.progress.progress(self.packages[0], 500)
+        self.now += 2
+        self.progress.progress(self.packages[1], 1500)
+        self.assertEqual(len(self.reports), 3)
+        self.assertEqual(self.progress._rate.done, 2000)
+        # 1500 bytes in the last 2 seconds, smoothed with 250 B/s before
+        self.assertAlmostEqual(self.progress._rate.rate, 0.3 * 750 + 0.7 * 250)
+
+        self.now += 2
+        self.progress.end(self.packages[0], dnfpayload.dnf.callback.STATUS_OK, None)
+        self.assertEqual(self.progress._rate.done, 2500)
+        self.assertIn("(1/2,", self.reports[-1])
+
+        # the last package always gets reported
+        self.progress.end(self.packages[1], dnfpayload.dnf.callback.STATUS_OK, None)
+        self.assertEqual(len(self.reports), 5)
+        self.assertEqual(self.progress._rate.done, 4000)
+        self.assertIn("(2/2,", self.reports[-1])
+
+    def throttle_test(self):
+        """Progress should be reported at most once per interval."""
+        self.progress.start(2, 4000)
+        for i in range(10):
+            self.now += 0.1
+            self.progress.progress(self.packages[0], i * 100)
+        # only after a second
+        self.assertEqual(len(self.reports), 2)
+        self.assertEqual(self.progress._rate.done, 900)
+
+    def failed_test(self):
+        """Failed downloads should not be counted as done."""
+        self.progress.start(2, 4000)
+        self.now += 2
+        self.progress.end(self.packages[0], dnfpayload.dnf.callback.STATUS_MIRROR, "timeout")
+        self.progress.end(self.packages[1], dnfpayload.dnf.callback.STATUS_FAILED, "404")
+        self.assertEqual(self.progress._done_files, 0)
+        self.assertEqual(len(self.reports), 1)
+
+        self.progress.end(self.packages[0], dnfpayload.dnf.callback.STATUS_OK, None)
+        self.assertEqual(self.progress._done_files, 1)
+        self.assertEqual(self.progress._rate.done, 1000)
+
+class DownloadRetryTests(unittest.TestCase):
+    def setUp(self):
+        self.base = mock.Mock()
+        self.packages = [FakePackage("bash"), FakePackage("glibc")]
+        self.progress = mock.Mock()
+
+    def _fail(self, times):
+        failures = [dnfpayload.dnf.exceptions.DownloadError({"bash": ["timeout"]})] * times
+        def download_packages(packages, progress):
+            if failures:
+                raise failures.pop()
+        self.base.download_packages.side_effect = download_packages
+
+    def success_test(self):
+        """A download that works should be done once."""
+        self._fail(0)
+        dnfpayload._download_packages(self.base, self.packages, self.progress)
+        self.base.download_packages.assert_called_once_with(self.packages, self.progress)
+
+    def retry_test(self):
+        """A failed download should be restarted."""
+        self._fail(dnfpayload.DNF_DOWNLOAD_RETRIES - 1)
+        dnfpayload._download_packages(self.base, self.packages, self.progress)
+        self.assertEqual(self.base.download_packages.call_args_list,
+                         [mock.call(self.packages, self.progress)] * dnfpayload.DNF_DOWNLOAD_RETRIES)
+
+    def give_up_test(self):
+        """The error should be raised when all the attempts failed."""
+        self._fail(dnfpayload.DNF_DOWNLOAD_RETRIES)
+        self.assertRaises(dnfpayload.dnf.exceptions.DownloadError,
+                          dnfpayload._download_packages, self.base, self.packages)
+        self.assertEqual(self.base.download_packages.call_count,
+                         dnfpayload.DNF_DOWNLOAD_RETRIES)
+
+    def other_error_test(self):
+        """Errors other than download errors should not be retried."""
+        self.base.download_packages.side_effect = dnfpayload.dnf.exceptions.RepoError("broken")
+        self.assertRaises(dnfpayload.dnf.exceptions.RepoError,
+                          dnfpayload._download_packages, self.base, self.packages)
+        self.assertEqual(self.base.download_packages.call_count, 1)
+
+class PipelineOptionTests(unittest.TestCase):
+    def _batches(self, cmdline):
+        payload = mock.Mock()
+        packages = [FakePackage("a", downloadsize=600), FakePackage("b", downloadsize=600)]
+        payload._base.transaction.__len__ = lambda _self: len(packages)
+        payload._base.sack = FakeSack(packages)
+        payload._staging_size.return_value = 1000
+        with mock.patch.object(dnfpayload.flags, "cmdline", cmdline):
+            return dnfpayload.DNFPayload._pipeline_batches.__func__(payload, packages)
+
+    def default_test(self):
+        """The packages should be installed in one transaction by default."""
+        cmdline = mock.Mock()
+        cmdline.getbool.return_value = False
+        self.assertEqual(self._batches(cmdline), [])
+        cmdline.getbool.assert_called_with("dnfpipeline")
+
+    def opt_in_test(self):
+        """inst.dnfpipeline should split the packages into batches."""
+        cmdline = mock.Mock()
+        cmdline.getbool.return_value = True
+        self.assertEqual(len(self._batches(cmdline)), 2)
@@ -0,0 +1,148 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from pyanaconda import eventchannel
+from pyanaconda.eventchannel import EventWriter, read_events
+import unittest
+import mock
+import fcntl
+import json
+import os
+import struct
+
+def frame(event, *args):
+    payload = json.dumps(args)
+    return struct.pack("!BI", event, len(payload)) + payload
+
+class FakeHelper(object):
+    """A helper process that has already written all its output."""
+
+    def __init__(self, output=b"", channel=b""):
+        (out_r, out_w) = os.pipe()
+        os.write(out_w, output)
+        os.close(out_w)
+        self.stdout = os.fdopen(out_r)
+
+        (self.channel_fd, channel_w) = eventchannel.channel_pipe()
+        os.write(channel_w, channel)
+        os.close(channel_w)
+
+    def poll(self):
+        return None
+
+    def wait(self):
+        return 0
+
+class SplitFramesTests(unittest.TestCase):
+    def complete_frames_test(self):
+        """Complete frames should be decoded in order."""
+        data = frame(eventchannel.EVENT_PREP) + \
+               frame(eventchannel.EVENT_PKG_START, "bash", 1, 2, 1024)
+        self.assertEqual(eventchannel._split_frames(data),
+                         ([(eventchannel.EVENT_PREP, []),
+                           (eventchannel.EVENT_PKG_START, ["bash", 1, 2, 1024])], b""))
+
+    def partial_frames_test(self):
+        """An incomplete header or payload should be kept for later."""
+        first = frame(eventchannel.EVENT_POST)
+        data = first + frame(eventchannel.EVENT_ERROR, "failed")
+
+        # cut in the header and in the payload of the second frame
+        for cut in (len(first) + 3, len(data) - 2):
+            (frames, rest) = eventchannel._split_frames(data[:cut])
+            self.assertEqual(frames, [(eventchannel.EVENT_POST, [])])
+            self.assertEqual(rest, data[len(first):cut])
+
+            # the rest and the next data make up the frame
+            (frames, rest) = eventchannel._split_frames(rest + data[cut:])
+            self.assertEqual(frames, [(eventchannel.EVENT_ERROR, ["failed"])])
+            self.assertEqual(rest, b"")
+
+    def oversized_frame_test(self):
+        """A frame longer than the limit should not be waited for."""
+        data = struct.pack("!BI", eventchannel.EVENT_LOG, eventchannel.MAX_FRAME_SIZE + 1)
+        self.assertRaises(IOError, eventchannel._split_frames, data)
+
+        writer = EventWriter(-1)
+        with mock.patch("pyanaconda.eventchannel.MAX_FRAME_SIZE", 10):
+            self.assertRaises(ValueError, writer.send, eventchannel.EVENT_ERROR,
+                              "a message longer than ten bytes")
+
+class ReadEventsTests(unittest.TestCase):
+    def events_test(self):
+        """Text lines and channel events should all be generated."""
+        (channel_r, channel_w) = eventchannel.channel_pipe()
+        writer = EventWriter(channel_w)
+        writer.send(eventchannel.EVENT_LOG, "INFO", "hello")
+        writer.send(eventchannel.EVENT_QUIT)
+        writer.close()
+
+        helper = FakeHelper(output=b"line one\nline two")
+        os.close(helper.channel_fd)
+        helper.channel_fd = channel_r
+
+        events = list(read_events(helper, helper.channel_fd))
+        self.assertEqual([e for e in events if e[0] == eventchannel.EVENT_TEXT],
+                         [(eventchannel.EVENT_TEXT, ["line one"]),
+                          (eventchannel.EVENT_TEXT, ["line two"])])
+        self.assertEqual([e for e in events if e[0] != eventchannel.EVENT_TEXT],
+                         [(eventchannel.EVENT_LOG, ["INFO", "hello"]),
+                          (eventchannel.EVENT_QUIT, [])])
+
+        # both descriptors are closed
+        self.assertTrue(helper.stdout.closed)
+        self.assertRaises(OSError, os.fstat, channel_r)
+
+    @mock.patch("pyanaconda.eventchannel.CHUNK_SIZE", 3)
+    def partial_reads_test(self):
+        """Frames split over several reads should be put together."""
+        data = frame(eventchannel.EVENT_PKG_START, "bash", 1, 2, 1024) + \
+               frame(eventchannel.EVENT_PKG_END, "bash", 0.5)
+        helper = FakeHelper(channel=data)
+
+        self.assertEqual(list(read_events(helper, helper.channel_fd)),
+                         [(eventchannel.EVENT_PKG_START, ["bash", 1, 2, 1024]),
+                          (eventchannel.EVENT_PKG_END, ["bash", 0.5])])
+
+    def eof_mid_frame_test(self):
+        """A frame cut off by the end of the channel should be an error."""
+        data = frame(eventchannel.EVENT_PREP) + frame(eventchannel.EVENT_POST)[:-1]
+        helper = FakeHelper(channel=data)
+
+        events = list(read_events(helper, helper.channel_fd))
+        self.assertEqual(events[0], (eventchannel.EVENT_PREP, []))
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[1][0], eventchannel.EVENT_ERROR)
+
+    def oversized_frame_test(self):
+        """A corrupted frame length should stop the reading."""
+        data = struct.pack("!BI", eventchannel.EVENT_LOG, eventchannel.MAX_FRAME_SIZE + 1)
+        helper = FakeHelper(channel=data)
+
+        self.assertRaises(IOError, list, read_events(helper, helper.channel_fd))
+        self.assertTrue(helper.stdout.closed)
+
+    def channel_pipe_test(self):
+        """Only the writing end of the channel should be inherited."""
+        (channel_r, channel_w) = eventchannel.channel_pipe()
+        try:
+            self.assertTrue(fcntl.fcntl(channel_r, fcntl.F_GETFD) & fcntl.FD_CLOEXEC)
+            self.assertFalse(fcntl.fcntl(channel_w, fcntl.F_GETFD) & fcntl.FD_CLOEXEC)
+        finally:
+            os.close(channel_r)
+            os.close(channel_w)
@@ -0,0 +1,197 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from pyanaconda.packaging import initrd
+import unittest
+import mock
+import os
+import shutil
+import tempfile
+import time
+
+KERNEL = "3.19.0-1.x86_64"
+
+class InitrdFingerprintTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self._write("/usr/bin/dracut", "dracut")
+        self._write("/lib/modules/%s/modules.dep" % KERNEL, "")
+        self._write("/boot/initramfs-%s.img" % KERNEL, "image")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, path, content):
+        path = self.root + path
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _fingerprint(self):
+        return initrd.initrd_fingerprint(KERNEL, root=self.root)
+
+    def stable_test(self):
+        """The fingerprint should only depend on the inputs."""
+        self.assertEqual(self._fingerprint(), self._fingerprint())
+        self.assertNotEqual(self._fingerprint(),
+                            initrd.initrd_fingerprint(KERNEL, image_install=True,
+                                                      root=self.root))
+
+    def inputs_test(self):
+        """The configuration written after the packages changes the fingerprint."""
+        for path in ("/etc/sysconfig/network-scripts/ifcfg-eth0",
+                     "/etc/modprobe.d/blacklist.conf",
+                     "/etc/multipath/wwids",
+                     "/etc/iscsi/initiatorname.iscsi",
+                     "/etc/fcoe/cfg-eth1",
+                     "/etc/vconsole.conf"):
+            before = self._fingerprint()
+            self._write(path, "first")
+            self.assertNotEqual(before, self._fingerprint(), path)
+
+            before = self._fingerprint()
+            self._write(path, "second")
+            self.assertNotEqual(before, self._fingerprint(), path)
+
+    def outdated_test(self):
+        """A recorded image is only current while inputs and image are."""
+        records = {}
+        self.assertEqual(initrd._initrd_outdated(records, KERNEL, False, self.root),
+                         "not built by the installer")
+
+        initrd.record_initrd(records, KERNEL, root=self.root)
+        self.assertIsNone(initrd._initrd_outdated(records, KERNEL, False, self.root))
+
+        self._write("/etc/sysconfig/network-scripts/ifcfg-eth0", "BOOTPROTO=dhcp\n")
+        self.assertIn("inputs changed",
+                      initrd._initrd_outdated(records, KERNEL, False, self.root))
+
+        initrd.record_initrd(records, KERNEL, root=self.root)
+        self._write("/boot/initramfs-%s.img" % KERNEL, "another image")
+        self.assertEqual(initrd._initrd_outdated(records, KERNEL, False, self.root),
+                         "the image changed since it was built")
+
+        os.unlink(self.root + "/boot/initramfs-%s.img" % KERNEL)
+        self.assertEqual(initrd._initrd_outdated(records, KERNEL, False, self.root),
+                         "the image is missing")
+
+class RecordedInitrdTests(unittest.TestCase):
+    """The images built by the kernel's %posttrans and recreateInitrds."""
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(self.root + "/boot")
+        os.makedirs(self.root + "/etc/sysconfig/network-scripts")
+        self.records = {}
+        self.built = []
+
+        self.patches = [mock.patch.object(initrd, "_run_commands", side_effect=self._dracut),
+                        mock.patch.object(initrd.iutil, "execWithRedirect"),
+                        mock.patch.object(initrd.flags, "testing", False)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.root)
+
+    def _dracut(self, commands, root):
+        kernel = commands[-1][-1]
+        self.built.append(kernel)
+        self._build_image(kernel)
+        return (0, "")
+
+    def _build_image(self, kernel, mtime=None):
+        path = "%s/boot/initramfs-%s.img" % (self.root, kernel)
+        with open(path, "w") as f:
+            f.write("image of %s" % kernel)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def _recreate(self, kernels):
+        return initrd.build_initrds(kernels, root=self.root, workers=1,
+                                    records=self.records)
+
+    def posttrans_test(self):
+        """Images built by the packages should only be rebuilt if their inputs changed."""
+        since = time.time()
+        # the payload is installed, the kernel's %posttrans builds its image
+        self._build_image(KERNEL)
+        initrd.record_built_initrds(self.records, [KERNEL], since, root=self.root)
+
+        self._recreate([KERNEL])
+        self.assertEqual(self.built, [])
+
+        with open(self.root + "/etc/sysconfig/network-scripts/ifcfg-eth0", "w") as f:
+            f.write("BOOTPROTO=dhcp\n")
+        self._recreate([KERNEL])
+        self.assertEqual(self.built, [KERNEL])
+
+    def copied_image_test(self):
+        """Images the payload brought along should always be rebuilt."""
+        since = time.time()
+        # e.g. the live image's, copied with its time
+        self._build_image(KERNEL, mtime=since - 3600)
+        self._build_image("3.18.0-1.x86_64")
+        initrd.record_built_initrds(self.records, [KERNEL, "3.18.0-1.x86_64", "missing"],
+                                    since, root=self.root)
+        self.assertEqual(sorted(self.records), ["3.18.0-1.x86_64"])
+
+        self._recreate([KERNEL, "3.18.0-1.x86_64"])
+        self.assertEqual(self.built, [KERNEL])
+
+class PayloadInitrdTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(self.root + "/boot")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    @mock.patch("pyanaconda.packaging.livepayload.blivet.util.umount")
+    @mock.patch("pyanaconda.packaging.Payload._copyDriverDiskFiles")
+    @mock.patch("pyanaconda.packaging.Payload._setDefaultBootTarget")
+    def live_post_install_test(self, *_mocks):
+        """The live payload should record only the images its scripts built."""
+        from pyanaconda.packaging import livepayload
+
+        # copied from the live image
+        old = "3.18.0-1.x86_64"
+        path = "%s/boot/initramfs-%s.img" % (self.root, old)
+        with open(path, "w") as f:
+            f.write("generic")
+        os.utime(path, (1000000000, 1000000000))
+
+        def run(program, argv, root):
+            # a postinst.d script rebuilding the image of one of the kernels
+            if argv == ["--rpmposttrans", KERNEL]:
+                with open("%s/boot/initramfs-%s.img" % (self.root, KERNEL), "w") as f:
+                    f.write("rebuilt")
+            return 0
+
+        payload = livepayload.LiveImagePayload(mock.Mock())
+        payload._kernelVersionList = [KERNEL, old]
+        with mock.patch("pyanaconda.packaging.ROOT_PATH", self.root), \
+             mock.patch("pyanaconda.packaging.livepayload.ROOT_PATH", self.root), \
+             mock.patch("pyanaconda.packaging.DD_ALL", self.root + "/DD"), \
+             mock.patch("pyanaconda.iutil.execWithRedirect", side_effect=run), \
+             mock.patch("pyanaconda.packaging.flags.imageInstall", False):
+            payload.postInstall()
+
+        self.assertEqual(list(payload._initrdRecords), [KERNEL])
@@ -0,0 +1,205 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from pyanaconda import iso9660
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+
+SECTOR = iso9660.SECTOR_SIZE
+
+# where the parts of the crafted images go
+PRIMARY_SECTOR = 16
+ROOT_SECTOR = 20
+JOLIET_ROOT_SECTOR = 23
+DISCINFO_SECTOR = 24
+IMAGE_SECTORS = 25
+
+DISCINFO = "1415134496.285834\nFedora 21\nx86_64\n1\n"
+
+def both_endian(fmt, value):
+    return struct.pack("<" + fmt, value) + struct.pack(">" + fmt, value)
+
+def dir_record(name, extent, size, flags=0, system_use=""):
+    """A directory record as in ECMA-119 9.1."""
+    pad = "\0" if len(name) % 2 == 0 else ""
+    length = 33 + len(name) + len(pad) + len(system_use)
+    if length % 2:
+        system_use += "\0"
+        length += 1
+    return (chr(length) + "\0" + both_endian("I", extent) + both_endian("I", size) +
+            "\0" * 7 + chr(flags) + "\0\0" + both_endian("H", 1) +
+            chr(len(name)) + name + pad + system_use)
+
+def rr_sp():
+    return "SP" + chr(7) + "\1" + "\xbe\xef" + "\0"
+
+def rr_nm(name, flags=0):
+    return "NM" + chr(5 + len(name)) + "\1" + chr(flags) + name
+
+def volume_descriptor(vd_type, root_extent, root_size, escape=""):
+    vd = chr(vd_type) + "CD001" + "\1"
+    vd = vd.ljust(88, "\0") + escape
+    vd = vd.ljust(128, "\0") + both_endian("H", SECTOR)
+    vd = vd.ljust(156, "\0") + dir_record("\0", root_extent, root_size, 0x02)
+    return vd.ljust(SECTOR, "\0")
+
+def directory(records):
+    """Lay out the records in sectors, records don't cross sectors."""
+    data = ""
+    for record in records:
+        if len(data) % SECTOR + len(record) > SECTOR:
+            data += "\0" * (SECTOR - len(data) % SECTOR)
+        data += record
+    return data
+
+class IsoImage(object):
+    """Builds a small ISO 9660 image with .discinfo and repodata."""
+    def __init__(self, rock_ridge=True, joliet=False, filler=0, discinfo=DISCINFO):
+        self.rock_ridge = rock_ridge
+        self.joliet = joliet
+        # files added before the interesting ones to make the root
+        # directory longer than a sector
+        self.filler = filler
+        self.discinfo = discinfo
+
+    def _root(self):
+        files = [("FILLER%03d.;1" % i, "filler-file-with-a-long-name-%03d" % i, DISCINFO_SECTOR, 0, 0)
+                 for i in range(self.filler)]
+        files.append(("DISCINFO.;1", ".discinfo", DISCINFO_SECTOR, len(self.discinfo), 0))
+        files.append(("REPODATA", "repodata", ROOT_SECTOR, SECTOR, 0x02))
+
+        records = [dir_record("\0", ROOT_SECTOR, 2 * SECTOR, 0x02,
+                              rr_sp() + rr_nm("", 0x02) if self.rock_ridge else ""),
+                   dir_record("\1", ROOT_SECTOR, 2 * SECTOR, 0x02,
+                              rr_nm("", 0x04) if self.rock_ridge else "")]
+        for (iso_name, rr_name, extent, size, flags) in files:
+            records.append(dir_record(iso_name, extent, size, flags,
+                                      rr_nm(rr_name) if self.rock_ridge else ""))
+
+        data = directory(records)
+        assert len(data) <= 2 * SECTOR
+        return data
+
+    def _joliet_root(self):
+        records = [dir_record("\0", JOLIET_ROOT_SECTOR, SECTOR, 0x02),
+                   dir_record("\1", JOLIET_ROOT_SECTOR, SECTOR, 0x02),
+                   dir_record(u".discinfo;1".encode("utf-16-be"), DISCINFO_SECTOR,
+                              len(self.discinfo)),
+                   dir_record(u"repodata".encode("utf-16-be"), ROOT_SECTOR, SECTOR, 0x02)]
+        return directory(records)
+
+    def write(self, path, truncate=None):
+        sectors = ["\0" * SECTOR] * IMAGE_SECTORS
+        sectors[PRIMARY_SECTOR] = volume_descriptor(1, ROOT_SECTOR, 2 * SECTOR)
+        terminator = PRIMARY_SECTOR + 1
+        if self.joliet:
+            sectors[terminator] = volume_descriptor(2, JOLIET_ROOT_SECTOR, SECTOR, "%/E")
+            terminator += 1
+        sectors[terminator] = volume_descriptor(255, 0, 0)
+
+        image = "".join(sectors)
+        root = self._root()
+        image = image[:ROOT_SECTOR * SECTOR] + root + image[ROOT_SECTOR * SECTOR + len(root):]
+        if self.joliet:
+            joliet = self._joliet_root()
+            offset = JOLIET_ROOT_SECTOR * SECTOR
+            image = image[:offset] + joliet + image[offset + len(joliet):]
+        offset = DISCINFO_SECTOR * SECTOR
+        image = image[:offset] + self.discinfo + image[offset + len(self.discinfo):]
+
+        with open(path, "wb") as f:
+            f.write(image[:truncate])
+
+class IsoInfoTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "image.iso")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def rock_ridge_test(self):
+        """The Rock Ridge names of an image should be found."""
+        IsoImage().write(self.path)
+        info = iso9660.read_iso_info(self.path)
+        self.assertEqual(info, iso9660.IsoInfo(("1415134496.285834", "Fedora 21", "x86_64"),
+                                               True, True))
+
+    def joliet_test(self):
+        """The Joliet names should be used without Rock Ridge."""
+        IsoImage(rock_ridge=False, joliet=True).write(self.path)
+        info = iso9660.read_iso_info(self.path)
+        self.assertEqual(info.discinfo[2], "x86_64")
+        self.assertTrue(info.has_repodata)
+        self.assertTrue(info.names_found)
+
+    def no_names_test(self):
+        """An image with neither Rock Ridge nor Joliet names has to be mounted."""
+        IsoImage(rock_ridge=False).write(self.path)
+        self.assertEqual(iso9660.read_iso_info(self.path),
+                         iso9660.IsoInfo(None, False, False))
+
+    def multi_sector_test(self):
+        """Records in the second sector of the root directory should be found."""
+        image = IsoImage(filler=40)
+        image.write(self.path)
+        # make sure the interesting records really are in the second sector
+        self.assertGreater(len(image._root()), SECTOR)
+
+        info = iso9660.read_iso_info(self.path)
+        self.assertEqual(info.discinfo[1], "Fedora 21")
+        self.assertTrue(info.has_repodata)
+
+    def no_discinfo_test(self):
+        """An empty .discinfo should give empty fields."""
+        IsoImage(discinfo="").write(self.path)
+        info = iso9660.read_iso_info(self.path)
+        self.assertEqual(info.discinfo, ("", "", ""))
+
+    def not_an_image_test(self):
+        """Files that are not ISO images should be recognized."""
+        with open(self.path, "wb") as f:
+            f.write("\0" * 20 * SECTOR)
+        self.assertIsNone(iso9660.read_iso_info(self.path))
+
+        with open(self.path, "wb") as f:
+            f.write("not an image")
+        self.assertIsNone(iso9660.read_iso_info(self.path))
+
+    def truncated_test(self):
+        """A truncated image should be reported, not crash."""
+        IsoImage().write(self.path, truncate=(ROOT_SECTOR + 1) * SECTOR)
+        self.assertRaises(iso9660.IsoReadError, iso9660.read_iso_info, self.path)
+        self.assertIsNone(iso9660.iso_info(self.path))
+
+    def cache_test(self):
+        """Results should be cached until the image changes."""
+        IsoImage().write(self.path)
+        info = iso9660.iso_info(self.path)
+        self.assertIs(iso9660.iso_info(self.path), info)
+
+        IsoImage(rock_ridge=False).write(self.path, truncate=IMAGE_SECTORS * SECTOR - 1)
+        self.assertFalse(iso9660.iso_info(self.path).names_found)
+
+    def parse_discinfo_test(self):
+        """Short .discinfo files should be padded."""
+        self.assertEqual(iso9660.parse_discinfo(["123\n", "Fedora\n"]), ("123", "Fedora", ""))
+        self.assertEqual(iso9660.parse_discinfo([]), ("", "", ""))
@@ -21,6 +21,7 @@
 
 from pyanaconda import iutil
 import unittest
+import mock
 import types
 import os
 import shutil
@@ -106,6 +107,14 @@ class RunProgramTests(unittest.TestCase):
         self.assertIsInstance(iutil.execReadlines("true", []),
                               types.GeneratorType)
 
+        # the last line doesn't need to be terminated and empty lines are kept
+        self.assertEqual(list(iutil.execReadlines("printf", ["a\\n\\nb"])),
+                         ["a", "", "b"])
+
+        # big outputs are split into lines properly
+        lines = list(iutil.execReadlines("seq", ["100000"]))
+        self.assertEqual(lines, [str(i) for i in range(1, 100001)])
+
     def get_dir_size_test(self):
         """Test the getDirSize."""
 
@@ -119,8 +128,173 @@ class RunProgramTests(unittest.TestCase):
         self.assertIsInstance(iutil.getDirSize('/dev/null'), int)
         self.assertIsInstance(iutil.getDirSize('/dev/null/foo'), int)
 
-        # TODO: mock some dirs and check if their size is
-        # computed correctly
+        # create some files and check that hard links are counted only once
+        test_dir = os.path.join(ANACONDA_TEST_DIR, "test_get_dir_size")
+        iutil.mkdirChain(os.path.join(test_dir, "sub"))
+        with open(os.path.join(test_dir, "foo"), "w") as f:
+            f.write("x" * 1024 * 1024)
+        os.link(os.path.join(test_dir, "foo"),
+                os.path.join(test_dir, "sub", "foo"))
+
+        files_size = os.lstat(os.path.join(test_dir, "foo")).st_blocks * 512
+        dirs_size = os.lstat(os.path.join(test_dir, "sub")).st_blocks * 512
+        expected = (files_size + dirs_size) / 1024
+
+        self.assertEqual(iutil.getDirSize(test_dir), expected)
+        self.assertEqual(iutil.getDirSize(test_dir, workers=4), expected)
+
+        # a file growing doesn't change the directory's mtime, but the size
+        with open(os.path.join(test_dir, "sub", "bar"), "w") as f:
+            f.write("x" * 1024 * 1024)
+        bar_size = os.lstat(os.path.join(test_dir, "sub", "bar")).st_blocks * 512
+        self.assertEqual(iutil.getDirSize(test_dir), expected + bar_size / 1024)
+        dir_mtime = os.lstat(os.path.join(test_dir, "sub")).st_mtime
+        with open(os.path.join(test_dir, "sub", "bar"), "a") as f:
+            f.write("x" * 1024 * 1024)
+        self.assertEqual(os.lstat(os.path.join(test_dir, "sub")).st_mtime, dir_mtime)
+        bar_size = os.lstat(os.path.join(test_dir, "sub", "bar")).st_blocks * 512
+        self.assertEqual(iutil.getDirSize(test_dir), expected + bar_size / 1024)
+        os.unlink(os.path.join(test_dir, "sub", "bar"))
+
+        # changes in the directory are noticed
+        os.unlink(os.path.join(test_dir, "sub", "foo"))
+        self.assertEqual(iutil.getDirSize(test_dir), expected)
+        os.unlink(os.path.join(test_dir, "foo"))
+        self.assertEqual(iutil.getDirSize(test_dir), dirs_size / 1024)
+
+    def get_dir_size_stat_error_test(self):
+        """An entry that can't be stat'ed shouldn't lose the others."""
+
+        test_dir = os.path.join(ANACONDA_TEST_DIR, "test_get_dir_size_errors")
+        iutil.mkdirChain(test_dir)
+        for name in ("a", "b"):
+            with open(os.path.join(test_dir, name), "w") as f:
+                f.write("x" * 64 * 1024)
+        a_size = os.lstat(os.path.join(test_dir, "a")).st_blocks * 512
+
+        real_lstat = os.lstat
+        def lstat(path):
+            if path.endswith("/b"):
+                raise OSError(2, "No such file or directory")
+            return real_lstat(path)
+
+        class Entry(object):
+            def __init__(self, directory, name):
+                self.name = name
+                self.path = os.path.join(directory, name)
+            def stat(self, follow_symlinks=True):
+                return lstat(self.path)
+
+        def scandir(directory):
+            return [Entry(directory, name) for name in os.listdir(directory)]
+
+        with mock.patch("pyanaconda.iutil.scandir", None):
+            with mock.patch("os.lstat", side_effect=lstat):
+                self.assertEqual(iutil.getDirSize(test_dir), a_size / 1024)
+
+        with mock.patch("pyanaconda.iutil.scandir", scandir):
+            self.assertEqual(iutil.getDirSize(test_dir), a_size / 1024)
+
+    def dir_tree_map_test(self):
+        """Test dir_tree_map."""
+
+        # non-existing root should be processed without an error
+        self.assertEqual(iutil.dir_tree_map('/dev/null/foo', lambda path: None), 0)
+
+        test_dir = os.path.join(ANACONDA_TEST_DIR, "test_dir_tree_map")
+        dirs = [test_dir] + [os.path.join(test_dir, d)
+                             for d in ("a", "a/b", "c")]
+        files = [os.path.join(d, "file") for d in dirs]
+        for d in dirs:
+            iutil.mkdirChain(d)
+        for f in files:
+            open(f, "w").close()
+
+        for workers in (1, 3):
+            visited = []
+            self.assertEqual(iutil.dir_tree_map(test_dir, visited.append,
+                                                workers=workers), 8)
+            self.assertEqual(sorted(visited), sorted(dirs + files))
+
+            visited = []
+            self.assertEqual(iutil.dir_tree_map(test_dir, visited.append,
+                                                dirs=False, workers=workers), 4)
+            self.assertEqual(sorted(visited), sorted(files))
+
+        # errors from the function are ignored and not counted
+        def raise_os_error(path):
+            raise OSError
+        self.assertEqual(iutil.dir_tree_map(test_dir, raise_os_error), 0)
+
+        # other errors are raised whatever the number of workers
+        def raise_value_error(path):
+            if path.endswith("/b"):
+                raise ValueError(path)
+        for workers in (1, 3):
+            with self.assertRaises(ValueError):
+                iutil.dir_tree_map(test_dir, raise_value_error, workers=workers)
+
+        # symlinks to directories are neither walked nor passed, as with
+        # os.walk, symlinks to files are passed as files
+        os.symlink(os.path.join(test_dir, "a"), os.path.join(test_dir, "c", "dirlink"))
+        os.symlink(files[0], os.path.join(test_dir, "c", "filelink"))
+        for workers in (1, 3):
+            visited = []
+            self.assertEqual(iutil.dir_tree_map(test_dir, visited.append,
+                                                workers=workers), 9)
+            self.assertEqual(sorted(visited),
+                             sorted(dirs + files + [os.path.join(test_dir, "c", "filelink")]))
+
+        shutil.rmtree(test_dir)
+
+    def chown_dir_tree_test(self):
+        """Test chown_dir_tree."""
+
+        test_dir = os.path.join(ANACONDA_TEST_DIR, "test_chown_dir_tree")
+        iutil.mkdirChain(os.path.join(test_dir, "sub"))
+        for name in ("user", "other", "sub/user"):
+            open(os.path.join(test_dir, name), "w").close()
+        os.symlink(os.path.join(test_dir, "sub"), os.path.join(test_dir, "link"))
+        os.symlink("/dev/null/missing", os.path.join(test_dir, "sub/broken"))
+
+        # pretend "other" is owned by 2000:2000, the rest by 1000:1000
+        real_lstat_dir = iutil._lstat_dir
+        def lstat_dir(directory):
+            entries = []
+            for (name, sinfo) in real_lstat_dir(directory):
+                owner = 2000 if name == "other" else 1000
+                entries.append((name, mock.Mock(st_mode=sinfo.st_mode, st_uid=owner,
+                                                st_gid=owner)))
+            return entries
+
+        def chowned(**kwargs):
+            with mock.patch("pyanaconda.iutil._lstat_dir", lstat_dir):
+                with mock.patch("os.lchown") as lchown, \
+                     mock.patch("os.chown") as chown:
+                    count = iutil.chown_dir_tree(test_dir, 3000, 3000, **kwargs)
+            self.assertFalse(chown.called)
+            # all the entries are processed, even the ones left alone
+            self.assertEqual(count, 7)
+            paths = [args[0][0] for args in lchown.call_args_list]
+            for args in lchown.call_args_list:
+                self.assertEqual(args[0][1:], (3000, 3000))
+            return sorted(os.path.relpath(path, test_dir) for path in paths)
+
+        # symlinks themselves are chown'ed, the directory behind the link
+        # is not walked twice
+        for workers in (1, 3):
+            self.assertEqual(chowned(workers=workers),
+                             [".", "link", "other", "sub", "sub/broken",
+                              "sub/user", "user"])
+
+        # the top directory has its real owner, not a faked one
+        self.assertEqual(chowned(from_uid_only=1000),
+                         ["link", "sub", "sub/broken", "sub/user", "user"])
+        self.assertEqual(chowned(from_gid_only=2000), ["other"])
+        self.assertEqual(chowned(from_uid_only=1000, from_gid_only=2000), [])
+        self.assertEqual(chowned(from_uid_only=2000, from_gid_only=2000), ["other"])
+
+        shutil.rmtree(test_dir)
 
     def mkdir_chain_test(self):
         """Test mkdirChain."""
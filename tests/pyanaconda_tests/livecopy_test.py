@@ -0,0 +1,248 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from pyanaconda.packaging import livecopy
+from pyanaconda.packaging.livecopy import LiveCopy, LiveCopyError
+import unittest
+import mock
+import os
+import stat
+import shutil
+import tempfile
+import threading
+import time
+
+class LiveCopyTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, "source")
+        self.dest = os.path.join(self.tmpdir, "dest")
+        os.mkdir(self.source)
+
+        # copy the extended attributes in python, not with rsync
+        self.xattr = mock.patch.object(livecopy, "xattr")
+        self.xattr.start().list.return_value = []
+
+    def tearDown(self):
+        self.xattr.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, relpath, content, mode=0644):
+        path = self.source + relpath
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(content)
+        os.chmod(path, mode)
+        return path
+
+    def _read(self, relpath):
+        with open(self.dest + relpath) as f:
+            return f.read()
+
+    def scan_test(self):
+        """The walk should sort the entries into their kinds."""
+        self._write("/etc/passwd", "root")
+        self._write("/usr/bin/ls", "ls")
+        os.link(self.source + "/usr/bin/ls", self.source + "/usr/bin/dir")
+        os.symlink("ls", self.source + "/usr/bin/list")
+        os.mkfifo(self.source + "/fifo")
+
+        copy = LiveCopy(self.source, self.dest, workers=2)
+        copy.scan()
+        self.assertEqual(copy.total_files, 2)
+        self.assertEqual(copy.total_bytes, len("root") + len("ls"))
+        self.assertEqual([p for (p, _st) in copy._dirs], ["/etc", "/usr", "/usr/bin"])
+        self.assertEqual([p for (p, _st) in copy._symlinks], ["/usr/bin/list"])
+        self.assertEqual([p for (p, _st) in copy._specials], ["/fifo"])
+        self.assertEqual(copy._hardlinks, [("/usr/bin/ls", "/usr/bin/dir")])
+
+    def copy_test(self):
+        """Files should be copied with their data, modes and times."""
+        self._write("/etc/shadow", "secret", 0400)
+        self._write("/usr/bin/tool", "#!/bin/sh\n", 0755)
+        self._write("/empty", "")
+        os.utime(self.source + "/usr/bin/tool", (1000000000, 1000000000))
+        os.chmod(self.source + "/usr", 0711)
+        reports = []
+
+        copy = LiveCopy(self.source, self.dest, workers=2,
+                        callback=lambda b, f: reports.append((b, f)), interval=0)
+        copy.run()
+
+        self.assertEqual(self._read("/etc/shadow"), "secret")
+        self.assertEqual(self._read("/usr/bin/tool"), "#!/bin/sh\n")
+        self.assertEqual(self._read("/empty"), "")
+        self.assertEqual(stat.S_IMODE(os.stat(self.dest + "/etc/shadow").st_mode), 0400)
+        self.assertEqual(stat.S_IMODE(os.stat(self.dest + "/usr/bin/tool").st_mode), 0755)
+        self.assertEqual(stat.S_IMODE(os.stat(self.dest + "/usr").st_mode), 0711)
+        self.assertEqual(os.stat(self.dest + "/usr/bin/tool").st_mtime, 1000000000)
+
+        self.assertEqual((copy.bytes_copied, copy.files_copied), (16, 3))
+        self.assertEqual(reports[-1], (16, 3))
+        self.assertFalse(os.path.exists(copy.manifest_path))
+
+    def links_test(self):
+        """Symlinks should be copied as they are and hardlinks kept."""
+        self._write("/usr/bin/ls", "ls")
+        os.link(self.source + "/usr/bin/ls", self.source + "/usr/bin/dir")
+        os.symlink("ls", self.source + "/usr/bin/list")
+        os.symlink("/nonexistent", self.source + "/dangling")
+        os.mkfifo(self.source + "/fifo")
+
+        LiveCopy(self.source, self.dest).run()
+
+        self.assertEqual(os.stat(self.dest + "/usr/bin/ls").st_ino,
+                         os.stat(self.dest + "/usr/bin/dir").st_ino)
+        self.assertEqual(os.readlink(self.dest + "/usr/bin/list"), "ls")
+        self.assertEqual(os.readlink(self.dest + "/dangling"), "/nonexistent")
+        self.assertTrue(stat.S_ISFIFO(os.lstat(self.dest + "/fifo").st_mode))
+
+    @unittest.skipIf(livecopy._utimensat is None, "utimensat is not available")
+    def symlink_times_test(self):
+        """The times of the symlinks themselves should be copied."""
+        self._write("/usr/bin/ls", "ls")
+        os.symlink("ls", self.source + "/usr/bin/list")
+        livecopy._lutime(self.source + "/usr/bin/list", (1000000000, 1000000000))
+        self.assertNotEqual(os.stat(self.source + "/usr/bin/ls").st_mtime, 1000000000)
+
+        LiveCopy(self.source, self.dest).run()
+
+        self.assertEqual(os.lstat(self.dest + "/usr/bin/list").st_mtime, 1000000000)
+        self.assertNotEqual(os.stat(self.dest + "/usr/bin/list").st_mtime, 1000000000)
+
+    def excludes_test(self):
+        """The rsync-style exclude patterns should be honoured."""
+        self._write("/dev/null", "not a device")
+        self._write("/boot/initramfs-0-rescue.img", "rescue")
+        self._write("/boot/vmlinuz", "kernel")
+        self._write("/etc/machine-id", "id")
+        self._write("/var/run", "a file, not the excluded directory")
+        self._write("/var/tmp/x.swp", "swap")
+        # '*' doesn't match a '/'
+        self._write("/boot/grub2/rescue.cfg", "menu entry")
+        self._write("/etc/sub/machine-id", "not the top one")
+        self._write("/var/cache/x.swp/file", "a directory matching *.swp")
+
+        LiveCopy(self.source, self.dest,
+                 excludes=livecopy.LIVE_COPY_EXCLUDES + ["*.swp", "/run/"]).run()
+
+        self.assertFalse(os.path.exists(self.dest + "/dev"))
+        self.assertFalse(os.path.exists(self.dest + "/boot/initramfs-0-rescue.img"))
+        self.assertFalse(os.path.exists(self.dest + "/etc/machine-id"))
+        self.assertFalse(os.path.exists(self.dest + "/var/tmp/x.swp"))
+        self.assertFalse(os.path.exists(self.dest + "/var/cache/x.swp"))
+        self.assertEqual(self._read("/boot/vmlinuz"), "kernel")
+        self.assertEqual(self._read("/var/run"), "a file, not the excluded directory")
+        self.assertEqual(self._read("/boot/grub2/rescue.cfg"), "menu entry")
+        self.assertEqual(self._read("/etc/sub/machine-id"), "not the top one")
+
+    def exclude_components_test(self):
+        """Patterns should be matched one path component at a time."""
+        copy = LiveCopy(self.source, self.dest,
+                        excludes=["/boot/*rescue*", "lib/*.a", "/tmp/"])
+        self.assertTrue(copy._excluded("/boot/initramfs-0-rescue.img", False))
+        self.assertFalse(copy._excluded("/boot/grub2/rescue.cfg", False))
+        self.assertFalse(copy._excluded("/sub/boot/vmlinuz-rescue", False))
+        self.assertTrue(copy._excluded("/usr/lib/libc.a", False))
+        self.assertTrue(copy._excluded("/lib/libc.a", False))
+        self.assertFalse(copy._excluded("/usr/lib/x/libc.a", False))
+        self.assertFalse(copy._excluded("/libc.a", False))
+        self.assertTrue(copy._excluded("/tmp", True))
+        self.assertFalse(copy._excluded("/tmp", False))
+        self.assertFalse(copy._excluded("/var/tmp", True))
+
+    @mock.patch.object(livecopy, "LIVE_COPY_MIN_UNIT_SIZE", 1)
+    def callback_serialized_test(self):
+        """The workers should never run the callback at the same time."""
+        for i in range(64):
+            self._write("/%02d" % i, "x" * 100)
+
+        busy = threading.Lock()
+        overlaps = []
+        reports = []
+        def callback(nbytes, nfiles):
+            if not busy.acquire(False):
+                overlaps.append((nbytes, nfiles))
+                return
+            try:
+                # give the other workers a chance to come in
+                time.sleep(0.001)
+                reports.append((nbytes, nfiles))
+            finally:
+                busy.release()
+
+        copy = LiveCopy(self.source, self.dest, workers=8, callback=callback,
+                        interval=0)
+        copy.run()
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual(reports, sorted(reports))
+        self.assertEqual(reports[-1], (6400, 64))
+
+    @mock.patch.object(livecopy, "LIVE_COPY_MIN_UNIT_SIZE", 1)
+    def resume_test(self):
+        """An interrupted copy should be resumed from the manifest."""
+        for name in "abcd":
+            self._write("/" + name, name * 10)
+
+        real_copy_data = LiveCopy._copy_data
+        copied = []
+        failed = []
+        def copy_data(copy, src, dst, size):
+            if src.endswith("/c") and not failed:
+                failed.append(src)
+                raise IOError(5, "Input/output error")
+            copied.append(src)
+            real_copy_data(copy, src, dst, size)
+
+        with mock.patch.object(LiveCopy, "_copy_data", copy_data):
+            copy = LiveCopy(self.source, self.dest, workers=1)
+            self.assertRaises(LiveCopyError, copy.run)
+            with open(copy.manifest_path) as f:
+                self.assertEqual(len(f.readlines()), 2)
+
+            # a unit in the manifest whose file is gone is copied again
+            os.unlink(self.dest + "/b")
+            del copied[:]
+            copy = LiveCopy(self.source, self.dest, workers=1)
+            copy.run()
+
+        self.assertEqual([os.path.basename(p) for p in copied], ["b", "c", "d"])
+        for name in "abcd":
+            self.assertEqual(self._read("/" + name), name * 10)
+        self.assertEqual((copy.bytes_copied, copy.files_copied), (40, 4))
+        self.assertFalse(os.path.exists(copy.manifest_path))
+
+    @mock.patch.object(livecopy, "xattr", None)
+    @mock.patch("pyanaconda.iutil.execWithRedirect")
+    def rsync_test(self, exec_mock):
+        """Running rsync for the attributes should report its failures."""
+        self._write("/file", "data")
+
+        exec_mock.return_value = 23
+        LiveCopy(self.source, self.dest).run()
+        args = exec_mock.call_args[0][1]
+        self.assertEqual(args[-2:], [self.source + "/", self.dest])
+        self.assertIn("/" + livecopy.LIVE_COPY_MANIFEST, args)
+
+        exec_mock.return_value = 12
+        self.assertRaises(LiveCopyError, LiveCopy(self.source, self.dest).run)
+
+        exec_mock.side_effect = OSError(2, "No such file or directory")
+        self.assertRaises(LiveCopyError, LiveCopy(self.source, self.dest).run)
@@ -0,0 +1,48 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from pyanaconda.packaging import livepayload
+import unittest
+import mock
+
+class LiveImageSizeTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("pyanaconda.iutil.getDirSize", return_value=2048)
+        self.getDirSize = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.payload = livepayload.LiveImagePayload(mock.Mock())
+
+    def space_required_test(self):
+        """The live image should be walked only once for the hub's refreshes."""
+        first = self.payload.spaceRequired
+        second = self.payload.spaceRequired
+        self.assertEqual(first, second)
+        self.getDirSize.assert_called_once_with("/", workers=livepayload.LIVE_COPY_MAX_WORKERS)
+
+    @mock.patch("pyanaconda.packaging.livepayload.blivet.util.mount")
+    @mock.patch("pyanaconda.packaging.ImagePayload.setup")
+    def setup_test(self, *_mocks):
+        """Setup should compute the size so the hub doesn't have to."""
+        storage = mock.Mock()
+        with mock.patch("os.stat") as stat_mock:
+            stat_mock.return_value = [0o60644] * 10
+            self.payload.setup(storage)
+        self.assertEqual(self.getDirSize.call_count, 1)
+
+        self.payload.spaceRequired
+        self.assertEqual(self.getDirSize.call_count, 1)
@@ -20,6 +20,10 @@
 
 from pyanaconda import localization
 import unittest
+import mock
+import os
+import shutil
+import tempfile
 
 class ParsingTests(unittest.TestCase):
     def invalid_langcodes_test(self):
@@ -84,6 +88,14 @@ class ParsingTests(unittest.TestCase):
         self.assertEqual(parts["territory"], "CZ")
         self.assertEqual(parts["script"], "latin")
 
+    def parsing_cached_test(self):
+        """Modifying the parts of a langcode shouldn't change later results."""
+
+        parts = localization.parse_langcode("cs_CZ.UTF-8")
+        parts["territory"] = "SK"
+        parts = localization.parse_langcode("cs_CZ.UTF-8")
+        self.assertEqual(parts["territory"], "CZ")
+
 class LangcodeLocaleMatchingTests(unittest.TestCase):
     def langcode_matches_locale_test(self):
         """Langcode-locale matching should work as expected."""
@@ -139,3 +151,99 @@ class LangcodeLocaleMatchingTests(unittest.TestCase):
         # no matches
         self.assertIsNone(localization.find_best_locale_match("pt_BR", ["en_BR", "en"]))
         self.assertIsNone(localization.find_best_locale_match("cs_CZ.UTF-8", ["en", "en.UTF-8"]))
+
+class LangtableIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "langtable-index.pickle")
+        self.saved_index = localization._index
+        self.saved_path = localization.LANGTABLE_INDEX_PATH
+        localization.LANGTABLE_INDEX_PATH = self.path
+        localization._index = None
+
+    def tearDown(self):
+        localization._index = self.saved_index
+        localization.LANGTABLE_INDEX_PATH = self.saved_path
+        shutil.rmtree(self.tmpdir)
+
+    def _patch_langtable(self, **kwargs):
+        patches = []
+        for function in ("list_locales", "list_keyboards", "list_timezones",
+                         "language_name"):
+            patches.append(mock.patch.object(localization.langtable, function,
+                                             **kwargs))
+        return patches
+
+    def round_trip_test(self):
+        """Answers from a written index should equal langtable's answers."""
+
+        expected = (localization.get_language_locales("cs"),
+                    localization.get_territory_locales("CZ"),
+                    localization.get_locale_keyboards("cs_CZ.UTF-8"),
+                    localization.get_locale_timezones("cs_CZ.UTF-8"),
+                    localization.get_english_name("cs_CZ.UTF-8"),
+                    localization.get_native_name("cs_CZ.UTF-8"))
+
+        localization.write_langtable_index(["cs"], self.path)
+        localization._index = None
+
+        # everything has to come from the index now
+        patches = self._patch_langtable(side_effect=AssertionError("langtable asked"))
+        for patch in patches:
+            patch.start()
+        try:
+            answers = (localization.get_language_locales("cs"),
+                       localization.get_territory_locales("CZ"),
+                       localization.get_locale_keyboards("cs_CZ.UTF-8"),
+                       localization.get_locale_timezones("cs_CZ.UTF-8"),
+                       localization.get_english_name("cs_CZ.UTF-8"),
+                       localization.get_native_name("cs_CZ.UTF-8"))
+        finally:
+            for patch in patches:
+                patch.stop()
+
+        self.assertEqual(answers, expected)
+        self.assertEqual([type(a) for a in answers], [type(e) for e in expected])
+
+    def stale_index_test(self):
+        """An index built from another langtable should be ignored."""
+
+        localization.write_langtable_index(["cs"], self.path)
+        localization._index = None
+
+        with mock.patch("pyanaconda.localization._langtable_stamp",
+                        return_value="another langtable"):
+            with mock.patch.object(localization.langtable, "list_locales",
+                                   return_value=["xx_XX.UTF-8"]):
+                self.assertEqual(localization.get_language_locales("cs"),
+                                 ["xx_XX.UTF-8"])
+
+    def stamp_test(self):
+        """The stamp should change with langtable's data files."""
+
+        data = os.path.join(self.tmpdir, "languages.xml.gz")
+        with open(data, "w") as f:
+            f.write("data")
+
+        with mock.patch("pyanaconda.localization._langtable_files",
+                        return_value=[data]):
+            stamp = localization._langtable_stamp()
+            self.assertIn(data, stamp)
+
+            with open(data, "a") as f:
+                f.write("more data")
+            self.assertNotEqual(localization._langtable_stamp(), stamp)
+
+            os.unlink(data)
+            self.assertIsNone(localization._langtable_stamp())
+
+    def lookup_test(self):
+        """Answers missing in the index should be asked for once."""
+
+        localization._index = localization._LangtableIndex()
+        query = mock.Mock(return_value=["cz"])
+
+        keyboards = localization._lookup("keyboards", "cs_CZ.UTF-8", query)
+        keyboards.append("us")
+        self.assertEqual(localization._lookup("keyboards", "cs_CZ.UTF-8", query), ["cz"])
+        query.assert_called_once_with("cs_CZ.UTF-8")
@@ -0,0 +1,198 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+from pyanaconda.packaging import mdcache
+import unittest
+import hashlib
+import os
+import shutil
+import tempfile
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+class FakeData(object):
+    def __init__(self, name, data):
+        self.location = (None, "repodata/" + name)
+        self.checksum = ("sha256", sha256(data))
+
+class FakeRepoMD(object):
+    """The part of yum's RepoMD the cache uses."""
+    def __init__(self, files):
+        self.files = files
+
+    def fileTypes(self):
+        return sorted(self.files)
+
+    def getData(self, mdtype):
+        (name, data) = self.files[mdtype]
+        return FakeData(name, data)
+
+class FakeRepo(object):
+    def __init__(self, cachedir, baseurl, files):
+        self.id = "anaconda"
+        self.cachedir = cachedir
+        self.baseurl = [baseurl]
+        self.mirrorlist = None
+        self.files = files
+
+    @property
+    def repoXML(self):
+        """Reading repomd.xml fetches it from the source like yum does."""
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+        with open(os.path.join(self.cachedir, "repomd.xml"), "w") as f:
+            f.write(repr(sorted(self.files.items())))
+        return FakeRepoMD(self.files)
+
+    def download(self):
+        """What yum leaves in the cache dir."""
+        self.repoXML
+        for (name, data) in self.files.values():
+            with open(os.path.join(self.cachedir, name), "w") as f:
+                f.write(data)
+
+    def read(self, name):
+        with open(os.path.join(self.cachedir, name)) as f:
+            return f.read()
+
+class MetadataCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = mdcache.MetadataCache(os.path.join(self.tmpdir, "cache"))
+        self.files = {"primary": ("primary.xml.gz", "primary data"),
+                      "filelists": ("filelists.xml.gz", "filelists data")}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _repo(self, name="repo", baseurl="http://example.com/os", files=None):
+        return FakeRepo(os.path.join(self.tmpdir, name), baseurl, files or self.files)
+
+    def _objects(self):
+        return sorted(os.listdir(self.cache.path))
+
+    def store_restore_test(self):
+        """Stored files should be put back into a new cache dir by checksum."""
+        repo = self._repo()
+        repo.download()
+        self.cache.store(repo)
+        self.assertEqual(self._objects(),
+                         sorted([sha256("primary data"), sha256("filelists data")]))
+
+        # the same source in another, empty cache dir
+        again = self._repo("again")
+        self.assertEqual(self.cache.restore(again), 2)
+        self.assertEqual(again.read("primary.xml.gz"), "primary data")
+
+        # files already there are kept
+        self.assertEqual(self.cache.restore(again), 0)
+
+        # a new cache instance finds them too
+        cache = mdcache.MetadataCache(self.cache.path)
+        self.assertEqual(cache.restore(self._repo("new-instance")), 2)
+
+    def media_switch_test(self):
+        """Media mounted at the same path should only get their own files."""
+        url = "file:///run/install/repo"
+        dvd = self._repo("dvd", url, {"primary": ("primary.xml.gz", "dvd primary"),
+                                      "group": ("comps.xml", "dvd comps")})
+        dvd.download()
+        self.cache.store(dvd)
+
+        # another ISO with the same comps, in a fresh cache dir
+        iso = self._repo("iso", url, {"primary": ("primary.xml.gz", "iso primary"),
+                                      "group": ("comps.xml", "dvd comps")})
+        self.assertEqual(self.cache.restore(iso), 1)
+        self.assertFalse(os.path.exists(os.path.join(iso.cachedir, "primary.xml.gz")))
+        self.assertEqual(iso.read("comps.xml"), "dvd comps")
+        self.assertEqual(iso.read("repomd.xml"), repr(sorted(iso.files.items())))
+
+        iso.download()
+        self.cache.store(iso)
+
+        # and back to the first one
+        back = self._repo("back", url, dvd.files)
+        self.assertEqual(self.cache.restore(back), 2)
+        self.assertEqual(back.read("primary.xml.gz"), "dvd primary")
+
+    def changed_tree_test(self):
+        """A tree changed under the same URL should not get the old files."""
+        nightly = self._repo("nightly", "http://example.com/nightly")
+        nightly.download()
+        self.cache.store(nightly)
+
+        changed = self._repo("changed", "http://example.com/nightly",
+                             {"primary": ("primary.xml.gz", "tomorrow's primary")})
+        self.assertEqual(self.cache.restore(changed), 0)
+
+    def checksum_key_test(self):
+        """Files should be shared by checksum and checked before storing."""
+        repo = self._repo()
+        repo.download()
+        self.cache.store(repo)
+
+        # another source with the same primary and a corrupted filelists
+        other = self._repo("other", "http://mirror.example.com/os")
+        other.download()
+        with open(os.path.join(other.cachedir, "filelists.xml.gz"), "w") as f:
+            f.write("truncated")
+        os.unlink(os.path.join(self.cache.path, sha256("filelists data")))
+        self.cache.store(other)
+
+        self.assertIn(sha256("primary data"), self._objects())
+        self.assertNotIn(sha256("filelists data"), self._objects())
+        self.assertNotIn(sha256("truncated"), self._objects())
+
+        # files are found by their checksums, whatever repomd.xml names them
+        renamed = self._repo("renamed", files={"primary": ("abc-primary.xml.gz",
+                                                           "primary data")})
+        self.assertEqual(self.cache.restore(renamed), 1)
+        self.assertEqual(renamed.read("abc-primary.xml.gz"), "primary data")
+
+    def eviction_test(self):
+        """The least recently used files should be removed over the limit."""
+        repos = []
+        for (i, name) in enumerate(("old", "used", "new")):
+            repo = self._repo(name, "http://example.com/%s" % name,
+                              {"primary": ("primary.xml.gz", name * 100)})
+            repo.download()
+            self.cache.store(repo)
+            path = os.path.join(self.cache.path, sha256(name * 100))
+            os.utime(path, (1000000000 + i, 1000000000 + i))
+            repos.append(repo)
+
+        # restoring marks the files as used
+        used = self._repo("used-again", "http://example.com/used",
+                          {"primary": ("primary.xml.gz", "used" * 100)})
+        self.assertEqual(self.cache.restore(used), 1)
+
+        # room for the files of two repos
+        self.cache.max_size = 2 * 400
+        self.cache.store(repos[2])
+
+        self.assertEqual(self._objects(), sorted([sha256("used" * 100), sha256("new" * 100)]))
+
+    def file_checksum_test(self):
+        """The sha checksum type of old repos should mean sha1."""
+        path = os.path.join(self.tmpdir, "file")
+        with open(path, "w") as f:
+            f.write("data")
+        self.assertEqual(mdcache._file_checksum(path, "sha"), hashlib.sha1("data").hexdigest())
+        self.assertEqual(mdcache._file_checksum(path, "sha256"), sha256("data"))
@@ -0,0 +1,217 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from pyanaconda import network
+from pyanaconda import constants
+import unittest
+import mock
+import logging
+import os
+import shutil
+import tempfile
+
+def linear_find(directory, values):
+    """The lookup done before the repository: read every file in turn."""
+    paths = []
+    for path in network._ifcfg_files(directory):
+        ifcfg = network.IfcfgFile(path)
+        ifcfg.read()
+        for (key, value) in values:
+            actual = ifcfg.get(key)
+            if callable(value):
+                if not value(actual):
+                    break
+            elif key == "HWADDR":
+                if actual.upper() != value.upper():
+                    break
+            elif actual != value:
+                break
+        else:
+            paths.append(path)
+    return paths
+
+class IfcfgRepositoryTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = self.root + network.netscriptsDir
+        os.makedirs(self.directory)
+        self.repository = network.IfcfgRepository(self.directory)
+
+        # set up by setup_ifcfg_log() in anaconda
+        patcher = mock.patch("pyanaconda.network.ifcfglog", logging.getLogger("ifcfg"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, name, mtime=None, **values):
+        path = os.path.join(self.directory, "ifcfg-" + name)
+        with open(path, "w") as f:
+            for (key, value) in sorted(values.items()):
+                f.write('%s="%s"\n' % (key, value))
+        if mtime:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def _find(self, values):
+        paths = self.repository.find(values)
+        # the same files in the same order as the lookup used to return
+        self.assertEqual(paths, linear_find(self.directory, values))
+        return paths
+
+    def lookup_test(self):
+        """Files should be found by the indexed keys and by other keys."""
+        eth0 = self._write("eth0", DEVICE="eth0", HWADDR="52:54:00:12:34:56")
+        slave = self._write("slave", HWADDR="52:54:00:AB:CD:EF", MASTER="bond0")
+        bond = self._write("bond0", DEVICE="bond0", BONDING_MASTER="yes")
+        self._write("lo", DEVICE="lo")
+
+        self.assertEqual(self._find([("DEVICE", "eth0")]), [eth0])
+        self.assertEqual(self._find([("DEVICE", "lo")]), [])
+        self.assertEqual(self._find([("MASTER", "bond0")]), [slave])
+        self.assertEqual(self._find([("BONDING_MASTER", "yes")]), [bond])
+        self.assertEqual(self._find([("DEVICE", "eth0"), ("MASTER", "bond0")]), [])
+        self.assertEqual(self._find([("DEVICE", "missing")]), [])
+
+        # hardware addresses are compared case insensitively
+        self.assertEqual(self._find([("HWADDR", "52:54:00:ab:cd:ef")]), [slave])
+        self.assertEqual(self._find([("HWADDR", "52:54:00:12:34:56")]), [eth0])
+
+        ifcfg = self.repository.ifcfg(slave)
+        self.assertEqual(ifcfg.get("MASTER"), "bond0")
+        # a copy, not the values of the repository
+        ifcfg.set(("MASTER", "bond1"))
+        self.assertEqual(self._find([("MASTER", "bond0")]), [slave])
+        self.assertIsNone(self.repository.ifcfg(os.path.join(self.directory, "ifcfg-lo")))
+
+    def callable_test(self):
+        """Functions should be used to match the values."""
+        nonempty = lambda x: x
+        eth0 = self._write("eth0", DEVICE="eth0", HWADDR="52:54:00:12:34:56")
+        slave = self._write("slave", HWADDR="52:54:00:12:34:56", MASTER="bond0")
+
+        self.assertEqual(self._find([("HWADDR", "52:54:00:12:34:56"),
+                                     ("MASTER", nonempty)]), [slave])
+        self.assertEqual(self._find([("HWADDR", "52:54:00:12:34:56"),
+                                     ("TEAM_MASTER", nonempty)]), [])
+        self.assertEqual(self._find([("MASTER", lambda x: not x)]), [eth0])
+        self.assertEqual(self._find([("HWADDR", lambda x: x.endswith("56"))]),
+                         sorted([eth0, slave], key=network._ifcfg_files(self.directory).index))
+
+    def order_test(self):
+        """Several matches should come in the order of the listing."""
+        for i in range(20):
+            self._write("con%d" % i, DEVICE="eth0", NAME="con%d" % i)
+
+        listing = network._ifcfg_files(self.directory)
+        self.assertEqual(self._find([("DEVICE", "eth0")]), listing)
+        self.assertEqual(network.find_ifcfg_file([("DEVICE", "eth0")], self.root),
+                         listing[0])
+
+    def rewritten_file_test(self):
+        """A changed file should be parsed again."""
+        path = self._write("eth0", mtime=1000000000, DEVICE="eth0", HWADDR="52:54:00:12:34:56")
+        self.assertEqual(self._find([("DEVICE", "eth0")]), [path])
+
+        # the same size, only the modification time tells them apart
+        self._write("eth0", mtime=1000000001, DEVICE="eth1", HWADDR="52:54:00:12:34:57")
+        self.assertEqual(self._find([("DEVICE", "eth0")]), [])
+        self.assertEqual(self._find([("DEVICE", "eth1")]), [path])
+        self.assertEqual(self._find([("HWADDR", "52:54:00:12:34:56")]), [])
+        self.assertEqual(self._find([("HWADDR", "52:54:00:12:34:57")]), [path])
+
+        # the key is gone
+        self._write("eth0", DEVICE="eth1")
+        self.assertEqual(self._find([("HWADDR", "52:54:00:12:34:57")]), [])
+
+    def deleted_file_test(self):
+        """A removed file should not be found, a new one should."""
+        eth0 = self._write("eth0", DEVICE="eth0")
+        eth1 = self._write("eth1", DEVICE="eth1")
+        self.assertEqual(self._find([("DEVICE", "eth0")]), [eth0])
+
+        os.unlink(eth0)
+        self.assertEqual(self._find([("DEVICE", "eth0")]), [])
+        self.assertEqual(self._find([("DEVICE", "eth1")]), [eth1])
+
+        eth2 = self._write("eth2", DEVICE="eth0")
+        self.assertEqual(self._find([("DEVICE", "eth0")]), [eth2])
+
+        # the whole directory
+        shutil.rmtree(self.directory)
+        self.assertEqual(self.repository.find([("DEVICE", "eth1")]), [])
+
+class FakeNM(object):
+    """NM states for the polling fallback, time passes only when sleeping."""
+    def __init__(self, states):
+        # (state, seconds it lasts), the last one lasts forever
+        self.states = states
+        self.now = 0.0
+
+    def state(self):
+        elapsed = self.now
+        for (state, duration) in self.states:
+            if elapsed < duration:
+                return state
+            elapsed -= duration
+        return self.states[-1][0]
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class WaitForConnectingNMTests(unittest.TestCase):
+    def _wait(self, states):
+        fake = FakeNM(states)
+        with mock.patch("pyanaconda.nm._cache", return_value=None), \
+             mock.patch("pyanaconda.nm.monotonic", fake.monotonic), \
+             mock.patch("pyanaconda.network.monotonic", fake.monotonic), \
+             mock.patch("pyanaconda.nm.time.sleep", fake.sleep), \
+             mock.patch("pyanaconda.nm.nm_is_connected",
+                        side_effect=lambda: fake.state() == "connected"), \
+             mock.patch("pyanaconda.nm.nm_is_connecting",
+                        side_effect=lambda: fake.state() == "connecting"):
+            connected = network._wait_for_connecting_NM()
+        return (connected, fake.now)
+
+    def connected_test(self):
+        """A connected NM should not be waited for."""
+        self.assertEqual(self._wait([("connected", 0)]), (True, 0))
+
+    def disconnected_test(self):
+        """An NM that isn't connecting should not be waited for."""
+        self.assertEqual(self._wait([("disconnected", 0)]), (False, 0))
+
+    def connecting_test(self):
+        """The wait should end as soon as NM gets connected."""
+        (connected, waited) = self._wait([("connecting", 3), ("connected", 0)])
+        self.assertTrue(connected)
+        self.assertAlmostEqual(waited, 3, delta=constants.NETWORK_CONNECTED_CHECK_INTERVAL)
+
+        (connected, waited) = self._wait([("connecting", 3), ("disconnected", 0)])
+        self.assertFalse(connected)
+        self.assertAlmostEqual(waited, 3, delta=constants.NETWORK_CONNECTED_CHECK_INTERVAL)
+
+    def timeout_test(self):
+        """An NM connecting for too long should be waited for until the timeout."""
+        (connected, waited) = self._wait([("connecting", 0)])
+        self.assertFalse(connected)
+        self.assertAlmostEqual(waited, constants.NETWORK_CONNECTION_TIMEOUT)
@@ -0,0 +1,369 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+from pyanaconda import nm
+import unittest
+import mock
+import threading
+
+DEVICE_IFACE = nm.NM_DEVICE_IFACE
+DEVICES = ["/org/freedesktop/NetworkManager/Devices/0",
+           "/org/freedesktop/NetworkManager/Devices/1"]
+
+class FakeVariant(object):
+    """Stands for the GLib.Variant of a signal's parameters."""
+    def __init__(self, *values):
+        self.values = values
+
+    def unpack(self):
+        return self.values
+
+class NMObjectCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = nm.NMObjectCache()
+        self.props = {DEVICES[0]: {"Interface": "ens3", "IpInterface": "ens3", "State": 30},
+                      DEVICES[1]: {"Interface": "ens4", "IpInterface": "", "State": 20}}
+        self.devices = list(DEVICES)
+        self.loads = []
+
+        self.patches = [mock.patch("pyanaconda.nm._get_all_properties",
+                                   side_effect=self._get_all_properties),
+                        mock.patch("pyanaconda.nm._get_proxy")]
+        for patch in self.patches:
+            patch.start()
+        nm._get_proxy.return_value.GetDevices.side_effect = lambda: list(self.devices)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def _get_all_properties(self, path, interface):
+        self.loads.append((path, interface))
+        if path not in self.props:
+            raise nm.UnknownMethodGetError
+        return dict(self.props[path])
+
+    def _signal(self, path, interface, signal, *values):
+        self.cache._on_signal(None, ":1.5", path, interface, signal, FakeVariant(*values))
+
+    def properties_cached_test(self):
+        """Properties should be loaded once and updated by signals."""
+        self.assertEqual(self.cache.properties(DEVICES[0], DEVICE_IFACE)["State"], 30)
+        self.assertEqual(self.cache.properties(DEVICES[0], DEVICE_IFACE)["State"], 30)
+        self.assertEqual(len(self.loads), 1)
+
+        self._signal(DEVICES[0], nm.DBUS_PROPERTIES_IFACE, "PropertiesChanged",
+                     DEVICE_IFACE, {"State": 100}, [])
+        self.assertEqual(self.cache.properties(DEVICES[0], DEVICE_IFACE)["State"], 100)
+
+        self._signal(DEVICES[0], DEVICE_IFACE, "StateChanged", 30, 100, 0)
+        self.assertEqual(self.cache.properties(DEVICES[0], DEVICE_IFACE)["State"], 30)
+        self.assertEqual(len(self.loads), 1)
+
+    def type_specific_signal_test(self):
+        """Changes announced by the type specific interface should update the device's."""
+        self.cache.properties(DEVICES[0], DEVICE_IFACE)
+        self._signal(DEVICES[0], DEVICE_IFACE + ".Wired", "PropertiesChanged",
+                     {"State": 100, "Carrier": True})
+        props = self.cache.properties(DEVICES[0], DEVICE_IFACE)
+        self.assertEqual(props["State"], 100)
+        self.assertNotIn("Carrier", props)
+
+    def invalidated_test(self):
+        """Invalidated properties should be loaded again."""
+        self.cache.properties(DEVICES[0], DEVICE_IFACE)
+        self.props[DEVICES[0]]["State"] = 70
+        self._signal(DEVICES[0], nm.DBUS_PROPERTIES_IFACE, "PropertiesChanged",
+                     DEVICE_IFACE, {}, ["State"])
+        self.assertEqual(self.cache.properties(DEVICES[0], DEVICE_IFACE)["State"], 70)
+        self.assertEqual(len(self.loads), 2)
+
+    def generation_race_test(self):
+        """Data loaded while a signal arrived should be returned, not cached."""
+        real_load = self._get_all_properties
+        def racing_load(path, interface):
+            props = real_load(path, interface)
+            self.props[path]["State"] = 100
+            self._signal(path, DEVICE_IFACE, "StateChanged", 100, 30, 0)
+            return props
+        nm._get_all_properties.side_effect = racing_load
+
+        self.assertEqual(self.cache.properties(DEVICES[0], DEVICE_IFACE)["State"], 30)
+        nm._get_all_properties.side_effect = self._get_all_properties
+        self.assertEqual(self.cache.properties(DEVICES[0], DEVICE_IFACE)["State"], 100)
+        self.assertEqual(len(self.loads), 2)
+
+    def device_path_test(self):
+        """Devices should be found by their ip interface names."""
+        self.assertEqual(self.cache.device_path("ens3"), DEVICES[0])
+        self.assertEqual(self.cache.device_path("ens4"), DEVICES[1])
+        self.assertIsNone(self.cache.device_path("ens5"))
+        self.assertEqual(nm._get_proxy.return_value.GetDevices.call_count, 1)
+
+        # renamed
+        self._signal(DEVICES[1], nm.DBUS_PROPERTIES_IFACE, "PropertiesChanged",
+                     DEVICE_IFACE, {"Interface": "eth1"}, [])
+        self.props[DEVICES[1]]["Interface"] = "eth1"
+        self.assertIsNone(self.cache.device_path("ens4"))
+        self.assertEqual(self.cache.device_path("eth1"), DEVICES[1])
+
+    def device_added_removed_test(self):
+        """Added and removed devices should be picked up."""
+        self.assertEqual(self.cache.devices(), DEVICES)
+        self.cache.properties(DEVICES[1], DEVICE_IFACE)
+
+        added = "/org/freedesktop/NetworkManager/Devices/2"
+        self.devices.append(added)
+        self.props[added] = {"Interface": "wlp2s0", "IpInterface": "", "State": 30}
+        self._signal(nm.NM_PATH, nm.NM_SERVICE, "DeviceAdded", added)
+        self.assertEqual(self.cache.devices(), DEVICES + [added])
+        self.assertEqual(self.cache.device_path("wlp2s0"), added)
+
+        self.devices.remove(DEVICES[1])
+        del self.props[DEVICES[1]]
+        self._signal(nm.NM_PATH, nm.NM_SERVICE, "DeviceRemoved", DEVICES[1])
+        self.assertEqual(self.cache.devices(), [DEVICES[0], added])
+        self.assertIsNone(self.cache.device_path("ens4"))
+        self.assertRaises(nm.UnknownMethodGetError,
+                          self.cache.properties, DEVICES[1], DEVICE_IFACE)
+
+    def removed_during_lookup_test(self):
+        """A device removed while the devices are listed should be skipped."""
+        del self.props[DEVICES[1]]
+        self.assertEqual(self.cache.device_path("ens3"), DEVICES[0])
+        self.assertIsNone(self.cache.device_path("ens4"))
+
+    def clear_test(self):
+        """A new NM should make everything be loaded again."""
+        self.cache.properties(DEVICES[0], DEVICE_IFACE)
+        self.cache.clear()
+        self.cache.properties(DEVICES[0], DEVICE_IFACE)
+        self.assertEqual(len(self.loads), 2)
+
+    def wait_test(self):
+        """wait should see the changes announced by signals."""
+        self.assertTrue(self.cache.wait(lambda: True, 0))
+        self.assertFalse(self.cache.wait(lambda: False, 0))
+
+        states = []
+        def predicate():
+            state = self.cache.properties(DEVICES[0], DEVICE_IFACE)["State"]
+            states.append(state)
+            if len(states) == 1:
+                self._signal(DEVICES[0], DEVICE_IFACE, "StateChanged", 100, 30, 0)
+            return state == 100
+        self.assertTrue(self.cache.wait(predicate, 10))
+        self.assertEqual(states, [30, 100])
+
+CONNECTIONS = ["/org/freedesktop/NetworkManager/Settings/%d" % i for i in range(4)]
+
+class NMSettingsIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = nm.NMObjectCache()
+        self.connections = list(CONNECTIONS[:3])
+        self.settings = {
+            CONNECTIONS[0]: {"connection": {"uuid": "u0", "id": "ens3"},
+                             "802-3-ethernet": {"mac-address": [0x52, 0x54, 0, 0x12, 0x34, 0x56]}},
+            CONNECTIONS[1]: {"connection": {"uuid": "u1", "id": "ens3"}},
+            CONNECTIONS[2]: {"connection": {"uuid": "u2", "id": "bond0"}},
+        }
+        self.loads = []
+
+        self.patches = [mock.patch("pyanaconda.nm._get_settings_uncached",
+                                   side_effect=self._get_settings),
+                        mock.patch("pyanaconda.nm._get_proxy")]
+        for patch in self.patches:
+            patch.start()
+        nm._get_proxy.return_value.ListConnections.side_effect = lambda: list(self.connections)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def _get_settings(self, path):
+        self.loads.append(path)
+        return self.settings[path]
+
+    def _signal(self, path, interface, signal, *values):
+        self.cache._on_signal(None, ":1.5", path, interface, signal, FakeVariant(*values))
+
+    def _find(self, value, key1="connection", key2="id", format_value=nm._identity):
+        return self.cache.find_settings(value, key1, key2, format_value)
+
+    def index_test(self):
+        """Settings should be loaded once and looked up in the index."""
+        self.assertEqual(self._find("ens3"), CONNECTIONS[:2])
+        self.assertEqual(self._find("bond0"), [CONNECTIONS[2]])
+        self.assertEqual(self._find("missing"), [])
+        self.assertEqual(sorted(self.loads), CONNECTIONS[:3])
+
+        # another index of the same settings
+        self.assertEqual(self._find("u1", key2="uuid"), [CONNECTIONS[1]])
+        self.assertEqual(len(self.loads), 3)
+
+    def formatted_value_test(self):
+        """Values should be compared formatted, connections without them skipped."""
+        self.assertEqual(self._find("52:54:00:12:34:56", "802-3-ethernet", "mac-address",
+                                    nm._format_hwaddr),
+                         [CONNECTIONS[0]])
+
+    def unhashable_value_test(self):
+        """Unhashable values should be compared with every connection."""
+        self.assertEqual(self._find([0x52, 0x54, 0, 0x12, 0x34, 0x56],
+                                    "802-3-ethernet", "mac-address"),
+                         [CONNECTIONS[0]])
+
+    def new_connection_test(self):
+        """Only a new connection should be loaded after NewConnection."""
+        self._find("ens3")
+        del self.loads[:]
+
+        self.connections.append(CONNECTIONS[3])
+        self.settings[CONNECTIONS[3]] = {"connection": {"uuid": "u3", "id": "ens3"}}
+        self._signal(nm.NM_SETTINGS_PATH, nm.NM_SETTINGS_IFACE, "NewConnection", CONNECTIONS[3])
+        self.assertEqual(self._find("ens3"), [CONNECTIONS[0], CONNECTIONS[1], CONNECTIONS[3]])
+        self.assertEqual(self.loads, [CONNECTIONS[3]])
+
+        del self.loads[:]
+        self._find("ens3")
+        self.assertEqual(self.loads, [])
+
+    def updated_test(self):
+        """An updated connection should be loaded and indexed again."""
+        self._find("ens3")
+        del self.loads[:]
+
+        self.settings[CONNECTIONS[1]] = {"connection": {"uuid": "u1", "id": "ens4"}}
+        self._signal(CONNECTIONS[1], nm.NM_CONNECTION_IFACE, "Updated")
+        self.assertEqual(self._find("ens3"), [CONNECTIONS[0]])
+        self.assertEqual(self._find("ens4"), [CONNECTIONS[1]])
+        self.assertEqual(self.loads, [CONNECTIONS[1]])
+
+    def removed_test(self):
+        """A removed connection should disappear from the index."""
+        self._find("ens3")
+        del self.loads[:]
+
+        self.connections.remove(CONNECTIONS[0])
+        self._signal(CONNECTIONS[0], nm.NM_CONNECTION_IFACE, "Removed")
+        self.assertEqual(self._find("ens3"), [CONNECTIONS[1]])
+        self.assertEqual(self.loads, [])
+
+    def updated_during_lookup_test(self):
+        """Settings changed while they were loaded shouldn't complete the index."""
+        real_load = self._get_settings
+        def racing_load(path):
+            settings = real_load(path)
+            if path == CONNECTIONS[1]:
+                self.settings[path] = {"connection": {"uuid": "u1", "id": "ens4"}}
+                self._signal(path, nm.NM_CONNECTION_IFACE, "Updated")
+            return settings
+        nm._get_settings_uncached.side_effect = racing_load
+
+        self.assertEqual(self._find("ens3"), CONNECTIONS[:2])
+        nm._get_settings_uncached.side_effect = self._get_settings
+        del self.loads[:]
+        self.assertEqual(self._find("ens4"), [CONNECTIONS[1]])
+        self.assertEqual(self.loads, [CONNECTIONS[1]])
+
+    def invalidate_test(self):
+        """Settings changed by anaconda itself should be loaded again."""
+        self._find("ens3")
+        del self.loads[:]
+
+        self.settings[CONNECTIONS[0]] = {"connection": {"uuid": "u0", "id": "eth0"}}
+        self.cache.invalidate_settings(CONNECTIONS[0])
+        self.assertEqual(self._find("eth0"), [CONNECTIONS[0]])
+        self.assertEqual(self.loads, [CONNECTIONS[0]])
+
+class FakeClock(object):
+    """A clock for the polling fallback, sleeping only moves it forward."""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class NMWaitForTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = nm.NMObjectCache()
+        self.props = {DEVICES[0]: {"Interface": "ens3", "State": 30}}
+        self.patches = [mock.patch("pyanaconda.nm._get_all_properties",
+                                   side_effect=lambda path, interface: dict(self.props[path])),
+                        mock.patch("pyanaconda.nm._get_proxy"),
+                        mock.patch("pyanaconda.nm._cache", return_value=self.cache)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def _state(self):
+        return self.cache.properties(DEVICES[0], DEVICE_IFACE)["State"]
+
+    def signal_test(self):
+        """A signal should wake the waiting up before the timeout."""
+        states = []
+        def predicate():
+            states.append(self._state())
+            return states[-1] == 100
+
+        timer = threading.Timer(0.1, self.cache._on_signal,
+                                (None, ":1.5", DEVICES[0], DEVICE_IFACE, "StateChanged",
+                                 FakeVariant(100, 30, 0)))
+        timer.start()
+        self.assertTrue(nm.nm_wait_for(predicate, 30, interval=0.01))
+        timer.join()
+
+        # evaluated once before and once after the signal, no polling
+        self.assertEqual(states, [30, 100])
+
+    def deadline_test(self):
+        """Without any change the wait should end at the deadline."""
+        calls = []
+        def predicate():
+            calls.append(self._state())
+            return False
+
+        start = nm.monotonic()
+        self.assertFalse(nm.nm_wait_for(predicate, 0.2, interval=0.01))
+        self.assertGreaterEqual(nm.monotonic() - start, 0.2)
+        # a signal-less wait doesn't poll
+        self.assertLessEqual(len(calls), 2)
+
+    def polling_test(self):
+        """Without the cache the predicate should be polled every interval."""
+        clock = FakeClock()
+        results = [False, False, True]
+        with mock.patch("pyanaconda.nm._cache", return_value=None), \
+             mock.patch("pyanaconda.nm.monotonic", clock.monotonic), \
+             mock.patch("pyanaconda.nm.time.sleep", clock.sleep):
+            self.assertTrue(nm.nm_wait_for(lambda: results.pop(0), 10, interval=1))
+            self.assertEqual(clock.sleeps, [1, 1])
+
+            # the last sleep is cut to the deadline
+            clock.sleeps = []
+            self.assertFalse(nm.nm_wait_for(lambda: False, 2.5, interval=1))
+            self.assertEqual(clock.sleeps, [1, 1, 0.5])
@@ -0,0 +1,229 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+from pyanaconda import ntp
+import unittest
+import mock
+import ntplib
+import socket
+import time
+
+class FakeServer(object):
+    """How an NTP server at one address answers."""
+    def __init__(self, offset=0.0, stratum=2, root_dispersion=0.01, reply=True,
+                 own_timestamp=False):
+        self.offset = offset
+        self.stratum = stratum
+        self.root_dispersion = root_dispersion
+        self.reply = reply
+        # answer with a timestamp that isn't the query's
+        self.own_timestamp = own_timestamp
+
+    def answer(self, query):
+        packet = ntplib.NTPPacket(mode=4, version=ntp.NTP_VERSION)
+        packet.stratum = self.stratum
+        packet.root_dispersion = self.root_dispersion
+        now = ntplib.system_to_ntp_time(time.time() + self.offset)
+        packet.recv_timestamp = packet.tx_timestamp = now
+        data = packet.to_data()
+        if self.own_timestamp:
+            return data
+        # a server copies the transmit timestamp of the query verbatim
+        return data[:24] + query[40:48] + data[32:]
+
+class FakeSocket(object):
+    def __init__(self, network, family):
+        self.network = network
+        self.family = family
+        self.inbox = []
+        self.closed = False
+
+    def setblocking(self, flag):
+        pass
+
+    def sendto(self, data, sockaddr):
+        self.network.sent.append((self.family, sockaddr[0]))
+        server = self.network.servers.get(sockaddr[0])
+        if server and server.reply:
+            self.inbox.append((server.answer(data), sockaddr))
+        for (address, spoofed) in self.network.spoofed.items():
+            if spoofed is server:
+                # an answer to our query from somewhere else
+                self.inbox.append((server.answer(data), (address, ntp.NTP_PORT)))
+
+    def recvfrom(self, size):
+        return self.inbox.pop(0)
+
+    def close(self):
+        self.closed = True
+
+class FakeNetwork(object):
+    """Name resolution, UDP sockets and select for probe_servers."""
+    def __init__(self):
+        # name -> list of (family, address)
+        self.names = {}
+        # address -> FakeServer
+        self.servers = {}
+        # address -> FakeServer whose replies come from the address
+        self.spoofed = {}
+        self.sockets = []
+        self.sent = []
+
+    def add(self, name, address, server, family=socket.AF_INET):
+        self.names.setdefault(name, []).append((family, address))
+        self.servers[address] = server
+
+    def getaddrinfo(self, host, port, family, socktype):
+        if host not in self.names:
+            raise socket.gaierror(-2, "Name or service not known")
+        return [(fam, socktype, 17, "", (address, port)) for (fam, address) in self.names[host]]
+
+    def socket(self, family, socktype):
+        sock = FakeSocket(self, family)
+        self.sockets.append(sock)
+        return sock
+
+    def select(self, rlist, wlist, xlist, timeout):
+        readable = [sock for sock in rlist if sock.inbox]
+        if not readable:
+            time.sleep(min(timeout, 0.01))
+        return (readable, [], [])
+
+class ProbeServersTests(unittest.TestCase):
+    def setUp(self):
+        self.network = FakeNetwork()
+        self.patches = [mock.patch.object(ntp.socket, "getaddrinfo", self.network.getaddrinfo),
+                        mock.patch.object(ntp.socket, "socket", self.network.socket),
+                        mock.patch.object(ntp.select, "select", self.network.select)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def probe_test(self):
+        """Every server should be measured with one query."""
+        self.network.add("0.pool.ntp.org", "192.0.2.1", FakeServer(offset=30))
+        self.network.add("1.pool.ntp.org", "192.0.2.2", FakeServer(stratum=3))
+        measurements = ntp.probe_servers(["0.pool.ntp.org", "1.pool.ntp.org"], timeout=5)
+
+        first = measurements["0.pool.ntp.org"]
+        self.assertEqual((first.server, first.address, first.stratum),
+                         ("0.pool.ntp.org", "192.0.2.1", 2))
+        self.assertAlmostEqual(first.offset, 30, places=1)
+        self.assertLess(first.delay, 1)
+        self.assertEqual(measurements["1.pool.ntp.org"].stratum, 3)
+        self.assertEqual(len(self.network.sent), 2)
+        self.assertTrue(all(sock.closed for sock in self.network.sockets))
+
+    def no_reply_test(self):
+        """Servers that don't reply or resolve should have no measurement."""
+        self.network.add("silent.example.com", "192.0.2.1", FakeServer(reply=False))
+        self.network.add("ntp.example.com", "192.0.2.2", FakeServer())
+        start = time.time()
+        measurements = ntp.probe_servers(["silent.example.com", "ntp.example.com",
+                                          "unknown.example.com"], timeout=0.3)
+        self.assertLess(time.time() - start, 2)
+        self.assertIsNone(measurements["silent.example.com"])
+        self.assertIsNone(measurements["unknown.example.com"])
+        self.assertIsNotNone(measurements["ntp.example.com"])
+
+    def unresolved_test(self):
+        """Names that don't resolve shouldn't be waited for."""
+        start = time.time()
+        self.assertEqual(ntp.probe_servers(["unknown.example.com"], timeout=5),
+                         {"unknown.example.com": None})
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(ntp.probe_servers([]), {})
+
+    def reply_matching_test(self):
+        """Only replies to our queries from the queried address should count."""
+        self.network.add("forged.example.com", "192.0.2.1",
+                         FakeServer(own_timestamp=True))
+        self.network.add("other.example.com", "192.0.2.2", FakeServer(reply=False))
+        self.network.spoofed["192.0.2.99"] = self.network.servers["192.0.2.2"]
+        measurements = ntp.probe_servers(["forged.example.com", "other.example.com"],
+                                         timeout=0.3)
+        self.assertEqual(measurements, {"forged.example.com": None,
+                                        "other.example.com": None})
+
+    def shared_address_test(self):
+        """Names of the same address should share the query and its reply."""
+        server = FakeServer()
+        self.network.add("ntp.example.com", "192.0.2.1", server)
+        self.network.add("time.example.com", "192.0.2.1", server)
+        measurements = ntp.probe_servers(["ntp.example.com", "time.example.com"], timeout=5)
+        self.assertEqual(measurements["ntp.example.com"].address, "192.0.2.1")
+        self.assertEqual(measurements["time.example.com"].address, "192.0.2.1")
+
+    def families_test(self):
+        """IPv6 servers should be queried from a socket of their own."""
+        self.network.add("ntp.example.com", "192.0.2.1", FakeServer())
+        self.network.add("ntp6.example.com", "2001:db8::1", FakeServer(), socket.AF_INET6)
+        measurements = ntp.probe_servers(["ntp.example.com", "ntp6.example.com"], timeout=5)
+        self.assertEqual(measurements["ntp6.example.com"].address, "2001:db8::1")
+        self.assertEqual(sorted(sock.family for sock in self.network.sockets),
+                         sorted([socket.AF_INET, socket.AF_INET6]))
+
+    def best_server_test(self):
+        """The probed server with the lowest root distance should be picked."""
+        self.network.add("far.example.com", "192.0.2.1", FakeServer(root_dispersion=0.5))
+        self.network.add("near.example.com", "192.0.2.2", FakeServer(root_dispersion=0.01))
+        self.network.add("unsynced.example.com", "192.0.2.3", FakeServer(stratum=16,
+                                                                         root_dispersion=0))
+        measurements = ntp.probe_servers(["far.example.com", "near.example.com",
+                                          "unsynced.example.com"], timeout=5)
+        self.assertEqual(ntp.best_measurement(measurements.values()).server,
+                         "near.example.com")
+
+class BestMeasurementTests(unittest.TestCase):
+    def _measurement(self, server, stratum, distance):
+        return ntp.NTPMeasurement(server, "192.0.2.1", 0.0, 0.01, stratum, distance)
+
+    def best_test(self):
+        """The lowest distance should win, then the lowest stratum."""
+        measurements = [None,
+                        self._measurement("a", 3, 0.2),
+                        self._measurement("b", 2, 0.1),
+                        self._measurement("c", 1, 0.1)]
+        self.assertEqual(ntp.best_measurement(measurements).server, "c")
+
+    def unusable_test(self):
+        """Unsynchronized servers and missing replies should never be picked."""
+        self.assertIsNone(ntp.best_measurement([]))
+        self.assertIsNone(ntp.best_measurement([None, self._measurement("a", 0, 0.0),
+                                                self._measurement("b", 16, 0.0)]))
+
+    @mock.patch("pyanaconda.ntp.isys")
+    @mock.patch("pyanaconda.ntp.probe_servers")
+    def one_time_sync_test(self, probe_mock, isys_mock):
+        """The time should be set from the best server's offset."""
+        probe_mock.return_value = {"a": self._measurement("a", 2, 0.1), "b": None}
+        callback = mock.Mock()
+        self.assertTrue(ntp.one_time_sync("a", callback))
+        probe_mock.assert_called_with(["a"])
+        self.assertTrue(isys_mock.set_system_time.called)
+        callback.assert_called_with(True)
+
+        probe_mock.return_value = {"b": None}
+        isys_mock.reset_mock()
+        self.assertFalse(ntp.one_time_sync(["b"], callback))
+        self.assertFalse(isys_mock.set_system_time.called)
+        callback.assert_called_with(False)
@@ -0,0 +1,142 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from pyanaconda.progress import ProgressRate, ProgressThrottle
+import unittest
+import mock
+
+class FakeClock(object):
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class ProgressRateTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.rate = ProgressRate(1000, smoothing=0.5, clock=self.clock)
+
+    def rate_test(self):
+        """The rate should be smoothed over the samples."""
+        self.assertEqual(self.rate.rate, 0)
+        self.assertIsNone(self.rate.eta)
+
+        # the first sample is taken as it is
+        self.clock.now = 2
+        self.rate.update(200)
+        self.assertEqual(self.rate.rate, 100)
+        self.assertEqual(self.rate.pct, 20)
+        self.assertEqual(self.rate.eta, 8)
+
+        # 300 units/s now, weighted by the smoothing
+        self.clock.now = 3
+        self.rate.update(500)
+        self.assertEqual(self.rate.rate, 200)
+        self.assertEqual(self.rate.pct, 50)
+        self.assertEqual(self.rate.eta, 2)
+
+        self.clock.now = 4
+        self.rate.update(1000)
+        self.assertEqual(self.rate.pct, 100)
+        self.assertEqual(self.rate.eta, 0)
+
+    def same_time_test(self):
+        """A sample without time passing should update only the done amount."""
+        self.clock.now = 1
+        self.rate.update(100)
+        self.rate.update(300)
+        self.assertEqual(self.rate.done, 300)
+        self.assertEqual(self.rate.rate, 100)
+
+        # the units of the ignored sample count in the next rate
+        self.clock.now = 2
+        self.rate.update(400)
+        self.assertEqual(self.rate.rate, 0.5 * 300 + 0.5 * 100)
+
+    def limits_test(self):
+        """The percentage and time left should stay in their ranges."""
+        rate = ProgressRate(0, clock=self.clock)
+        self.assertEqual(rate.pct, 0)
+
+        self.clock.now = 1
+        self.rate.update(1200)
+        self.assertEqual(self.rate.pct, 100)
+        self.assertEqual(self.rate.eta, 0)
+
+        # no progress at all
+        rate = ProgressRate(1000, clock=self.clock)
+        self.clock.now = 2
+        rate.update(0)
+        self.assertIsNone(rate.eta)
+
+class ProgressThrottleTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.throttle = ProgressThrottle(1.0, clock=self.clock)
+        patcher = mock.patch("pyanaconda.progress.progressQ")
+        self.queue = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sent(self):
+        return [args[0][0] for args in self.queue.send_message.call_args_list]
+
+    def interval_test(self):
+        """Messages should go out at most once per interval."""
+        self.throttle.send("first")
+        for i in range(7):
+            self.clock.now += 0.125
+            self.throttle.send("message %d" % i)
+        self.assertEqual(self._sent(), ["first"])
+
+        # the latest message once the interval has passed
+        self.clock.now += 0.125
+        self.throttle.send("second")
+        self.assertEqual(self._sent(), ["first", "second"])
+
+        # the interval starts again from the last message
+        self.clock.now += 0.5
+        self.throttle.send("third")
+        self.clock.now += 0.6
+        self.throttle.send("fourth")
+        self.assertEqual(self._sent(), ["first", "second", "fourth"])
+
+    def force_test(self):
+        """Forced messages should go out right away."""
+        self.throttle.send("first")
+        self.throttle.send("phase", force=True)
+        self.assertEqual(self._sent(), ["first", "phase"])
+
+        # and restart the interval
+        self.clock.now += 0.5
+        self.throttle.send("skipped")
+        self.assertEqual(self._sent(), ["first", "phase"])
+
+    def flush_test(self):
+        """The pending message should be sent by flush, only once."""
+        self.throttle.send("first")
+        self.clock.now += 0.5
+        self.throttle.send("pending")
+        self.throttle.flush()
+        self.throttle.flush()
+        self.assertEqual(self._sent(), ["first", "pending"])
+
+        # flush restarted the interval
+        self.clock.now += 0.5
+        self.throttle.send("skipped")
+        self.assertEqual(self._sent(), ["first", "pending"])
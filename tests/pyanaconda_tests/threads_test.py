@@ -0,0 +1,123 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from pyanaconda import threads
+from pyanaconda.threads import AnacondaThread, ThreadManager
+import unittest
+import mock
+import threading
+
+# don't let a broken test hang forever
+TIMEOUT = 10
+
+class DependencyTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("pyanaconda.threads.threadMgr", ThreadManager())
+        self.mgr = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ran = []
+
+    def _add(self, name, depends_on=None, event=None, error=None):
+        def target():
+            self.ran.append(name)
+            if event:
+                event.wait(TIMEOUT)
+            if error:
+                raise error
+
+        return self.mgr.add(AnacondaThread(name=name, target=target, fatal=False,
+                                           depends_on=depends_on or []))
+
+    def _wait_running(self, name):
+        for _i in range(TIMEOUT * 100):
+            if name in self.ran:
+                return
+            threading.Event().wait(0.01)
+        self.fail("thread %s didn't start" % name)
+
+    def wait_for_dependencies_test(self):
+        """A thread should start its work only when its dependencies are done."""
+        first_done = threading.Event()
+        last_done = threading.Event()
+        self._add("first", event=first_done)
+        self._add("second", depends_on=["first"])
+        self._add("last", depends_on=["second"], event=last_done)
+        self._wait_running("first")
+        self.assertEqual(self.ran, ["first"])
+
+        first_done.set()
+        self._wait_running("last")
+        self.assertEqual(self.ran, ["first", "second", "last"])
+
+        # the chain the last thread waited for
+        self.assertEqual(self.mgr.critical_path("last"), ["first", "second", "last"])
+
+        last_done.set()
+        self.mgr.wait("last")
+
+    def failed_dependency_test(self):
+        """The error of a dependency should stop the threads waiting for it."""
+        fail = threading.Event()
+        self._add("broken", event=fail, error=ValueError("broken"))
+        self._add("waiting", depends_on=["broken"])
+        self._wait_running("broken")
+
+        fail.set()
+        # the error got to the waiting thread, its target didn't run
+        self.assertRaises(ValueError, self.mgr.wait, "waiting")
+        self.assertEqual(self.ran, ["broken"])
+        self.assertIsNone(self.mgr.get_error("broken"))
+
+    def missing_dependency_test(self):
+        """A dependency that was never added should not be waited for."""
+        done = threading.Event()
+        self._add("alone", depends_on=["nonexistent"], event=done)
+        self._wait_running("alone")
+
+        self.assertEqual(self.mgr.get("alone").depends_on, [])
+        self.assertEqual(self.mgr.critical_path("alone"), ["alone"])
+        done.set()
+        self.mgr.wait("alone")
+
+    def prune_timings_test(self):
+        """Only the timings still needed should be kept."""
+        first_done = threading.Event()
+        last_done = threading.Event()
+        self._add("first", event=first_done)
+        self._add("second", depends_on=["first"])
+        self._add("last", depends_on=["second"], event=last_done)
+        self._add("other")
+        self.mgr.wait("other")
+
+        # "other" is done and nobody waits for it
+        self.assertEqual(sorted(self.mgr._timings), ["first", "last", "second"])
+
+        first_done.set()
+        self._wait_running("last")
+        # "first" and "second" are done and "last" has started
+        self.assertEqual(sorted(self.mgr._timings), ["last"])
+
+        last_done.set()
+        self.mgr.wait("last")
+        self.assertEqual(self.mgr._timings, {})
+
+        # a finished thread is not waited for any more
+        self._add("late", depends_on=["first"])
+        self.mgr.wait("late")
+        self.assertEqual(self.ran[-1], "late")
+        self.assertEqual(self.mgr._timings, {})
@@ -0,0 +1,75 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+
+from pyanaconda import timing
+import unittest
+import threading
+
+class InstallProfileTests(unittest.TestCase):
+    def nesting_test(self):
+        """Phases should nest within their thread and record failures."""
+        profile = timing.InstallProfile()
+        with profile.phase("outer"):
+            with profile.phase("inner"):
+                pass
+        try:
+            with profile.phase("broken"):
+                raise ValueError("broken")
+        except ValueError:
+            pass
+
+        (outer, inner, broken) = profile.phases
+        self.assertIsNone(outer.parent)
+        self.assertEqual((inner.parent, inner.depth), (0, 1))
+        self.assertFalse(outer.failed)
+        self.assertTrue(broken.failed)
+        self.assertIsNotNone(outer.end)
+        self.assertFalse(any(p.concurrent for p in profile.phases))
+
+    def concurrent_test(self):
+        """Overlapping phases of different threads should be marked."""
+        profile = timing.InstallProfile()
+        started = threading.Event()
+        done = threading.Event()
+
+        def worker():
+            with profile.phase("worker"):
+                started.set()
+                done.wait()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        started.wait()
+        with profile.phase("main"):
+            pass
+        done.set()
+        thread.join()
+        with profile.phase("alone"):
+            pass
+
+        phases = dict((p.name, p) for p in profile.phases)
+        self.assertTrue(phases["worker"].concurrent)
+        self.assertTrue(phases["main"].concurrent)
+        self.assertFalse(phases["alone"].concurrent)
+        self.assertTrue(phases["main"].asdict()["concurrent"])
+
+        events = [e for e in profile.chrome_trace()["traceEvents"] if e["ph"] == "X"]
+        self.assertEqual(len(events), 3)
+        self.assertTrue(events[0]["args"]["concurrent"])
+        self.assertNotIn("concurrent", events[2]["args"])
@@ -0,0 +1,145 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from pyanaconda.packaging import treeinfo
+import unittest
+import mock
+import shutil
+import tempfile
+import threading
+
+URL = "http://example.com/tree"
+
+TREEINFO = """[general]
+version = %s
+variant = Server
+
+[variant-Server]
+addons = Server.HA
+
+[addon-Server.HA]
+name = High Availability
+repository = addons/HighAvailability
+"""
+
+class FakeServer(object):
+    """Serves .treeinfo files and answers conditional requests."""
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+
+    def download(self, url, ugopts, headers=()):
+        self.requests.append((url, dict(headers), ugopts["proxies"]))
+        if url not in self.files:
+            raise treeinfo.URLGrabError(14, "HTTP Error 404 - Not Found")
+
+        (data, etag) = self.files[url]
+        if etag and dict(headers).get("If-None-Match") == etag:
+            return (304, "", etag, None)
+        return (200, data, etag, None)
+
+class TreeInfoCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.server = FakeServer()
+        self.server.files[URL + "/.treeinfo"] = (TREEINFO % "22", '"1"')
+        self.patch = mock.patch("pyanaconda.packaging.treeinfo._download",
+                                side_effect=self.server.download)
+        self.patch.start()
+
+    def tearDown(self):
+        # the download of the name that wasn't used may still be running
+        for thread in threading.enumerate():
+            if thread.name.startswith("AnaTreeInfoWorker"):
+                thread.join()
+        self.patch.stop()
+        shutil.rmtree(self.cachedir)
+
+    def _cache(self, max_age):
+        return treeinfo.TreeInfoCache(cachedir=self.cachedir, max_age=max_age)
+
+    def parse_test(self):
+        """The treeinfo should be parsed."""
+        info = self._cache(60).get(URL)
+        self.assertEqual(info.version, "22")
+        self.assertEqual(info.variant, "Server")
+        self.assertEqual(info.variants["Server"]["addons"], "Server.HA")
+        self.assertEqual(info.addons["Server.HA"]["repository"], "addons/HighAvailability")
+        self.assertIsNone(info.get("general", "missing"))
+
+    def fresh_test(self):
+        """A fresh entry should be used without asking the server."""
+        cache = self._cache(60)
+        first = cache.get(URL)
+        count = len(self.server.requests)
+        self.assertIs(cache.get(URL), first)
+        self.assertEqual(len(self.server.requests), count)
+
+    def not_modified_test(self):
+        """An expired entry should be kept if the server says it's unchanged."""
+        cache = self._cache(0)
+        first = cache.get(URL)
+        self.assertIs(cache.get(URL), first)
+        (url, headers, _proxies) = self.server.requests[-1]
+        self.assertEqual(url, URL + "/.treeinfo")
+        self.assertEqual(headers, {"If-None-Match": '"1"'})
+
+    def modified_test(self):
+        """An expired entry should be replaced if the treeinfo changed."""
+        cache = self._cache(0)
+        self.assertEqual(cache.get(URL).version, "22")
+        self.server.files[URL + "/.treeinfo"] = (TREEINFO % "23", '"2"')
+        self.assertEqual(cache.get(URL).version, "23")
+
+    def failure_not_cached_test(self):
+        """A tree that couldn't be retrieved should be tried again."""
+        cache = self._cache(60)
+        other = "http://example.com/other"
+        self.assertIsNone(cache.get(other))
+
+        self.server.files[other + "/treeinfo"] = (TREEINFO % "21", None)
+        self.assertEqual(cache.get(other).version, "21")
+
+    def key_test(self):
+        """Proxies and SSL verification should be part of the key."""
+        cache = self._cache(60)
+        cache.get(URL)
+        count = len(self.server.requests)
+
+        proxies = {"http": "http://proxy:3128", "https": "http://proxy:3128"}
+        cache.get(URL, proxies=proxies)
+        self.assertGreater(len(self.server.requests), count)
+        self.assertEqual(self.server.requests[-1][2], proxies)
+
+        count = len(self.server.requests)
+        cache.get(URL, sslverify=False)
+        self.assertGreater(len(self.server.requests), count)
+
+    def local_test(self):
+        """Local trees should be read every time."""
+        cache = self._cache(60)
+        local = "file:///run/install/repo"
+        self.server.files[local + "/.treeinfo"] = (TREEINFO % "22", None)
+        self.assertEqual(cache.get(local).version, "22")
+
+        # another source mounted at the same place
+        self.server.files[local + "/.treeinfo"] = (TREEINFO % "23", None)
+        self.assertEqual(cache.get(local).version, "23")
+
+        del self.server.files[local + "/.treeinfo"]
+        self.assertIsNone(cache.get(local))
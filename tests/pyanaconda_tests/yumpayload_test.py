@@ -0,0 +1,60 @@
+#
+# Copyright (C) 2015  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import threading
+import unittest
+
+class FakePayload(object):
+    """Just enough of a YumPayload for gatherRepoMetadata with no repos."""
+    def __init__(self):
+        self.repos = []
+        self.metadata_workers = 1
+        self._mdcache = None
+        self._base_repo = "old-base"
+        self._base_repo_lock = threading.RLock()
+        self.base_repo_during = None
+        self.refreshed = False
+
+    def _fetchRepoMetadata(self, repos, workers, mdcache):
+        self.base_repo_during = self._base_repo
+
+    def _refreshBaseRepo(self):
+        self.refreshed = True
+
+class YumPayloadClassTests(unittest.TestCase):
+    def import_test(self):
+        """The yum payload module should import."""
+        from pyanaconda.packaging import yumpayload
+        self.assertTrue(issubclass(yumpayload.YumPayload,
+                                   yumpayload.PackagePayload))
+
+    def metadata_workers_test(self):
+        """metadata_workers should be a plain property."""
+        from pyanaconda.packaging.yumpayload import YumPayload
+        self.assertIsInstance(YumPayload.__dict__["metadata_workers"], property)
+
+    def gather_refreshes_base_repo_test(self):
+        """gatherRepoMetadata should invalidate and refresh the base repo."""
+        from pyanaconda.packaging.yumpayload import YumPayload
+        gather = YumPayload.__dict__["gatherRepoMetadata"]
+        self.assertEqual(gather.__name__, "gatherRepoMetadata")
+
+        payload = FakePayload()
+        gather(payload)
+        self.assertIsNone(payload.base_repo_during)
+        self.assertTrue(payload.refreshed)